@@ -1,7 +1,12 @@
+from contextlib import nullcontext
+
 import altair as alt
 import pandas as pd
 import streamlit as st
 
+import logic
+import utils
+
 from ui.sidebar import render_sidebar
 from ui.tab_profile import render_tab_profile
 from ui.tab_tapering import render_tab_tapering
@@ -39,23 +44,54 @@ def create_cutoff_line(cutoff_time):
 # ==============================================================================================
 weight, user_vo2, user_vlamax, selected_sport, sim_method = render_sidebar(db_data)
 
-# --- DEFINIZIONE TABS ---
-tab1, tab2, tab3 = st.tabs(["Dati & Upload", "Simulazione Gara", "Analisi Avanzata"])
-
-# =============================================================================
-# TAB 1: PROFILO & METABOLISMO
-# =============================================================================
-with tab1:
-    render_tab_profile(db_data, weight, user_vo2, user_vlamax, selected_sport, sim_method)
-
-# =============================================================================
-# TAB 2: DIARIO IBRIDO
-# =============================================================================
-with tab2:
-    render_tab_tapering()
-
-# =============================================================================
-# TAB 3: SIMULAZIONE GARA & STRATEGIA (PULITA)
-# =============================================================================
-with tab3:
-    render_tab_simulation(sim_method, create_cutoff_line)
+# --- DEBUG PRESTAZIONI (OPZIONALE) ---
+debug_profile = st.sidebar.checkbox(
+    "🛠️ Debug Prestazioni", value=False,
+    help="Misura tempo, chiamate e picco di memoria di parsing, motori e grafici per questa esecuzione."
+)
+profiler = utils.session_profiler(enabled=debug_profile or None)
+debug_slot = st.sidebar.container()
+
+
+def render_profile_breakdown(prof):
+    with debug_slot.expander("⏱️ Profilo Esecuzione Corrente", expanded=True):
+        df_prof = prof.summary_frame()
+        if df_prof.empty:
+            st.caption("Nessuno stage registrato.")
+            return
+        st.dataframe(df_prof.round(2), hide_index=True, use_container_width=True)
+        cache = logic.simulation_cache_stats()
+        st.caption(f"Cache simulazioni: {cache['size']}/{cache['maxsize']} scenari · "
+                   f"hit {cache['hits']} · miss {cache['misses']} · hit rate {cache['hit_rate']:.0%}")
+        st.download_button(
+            "Esporta Trace (Chrome/Perfetto)", prof.chrome_trace_json(),
+            file_name="glicogeno_trace.json", mime="application/json"
+        )
+
+
+with (profiler.active() if profiler is not None else nullcontext()):
+    try:
+        # --- DEFINIZIONE TABS ---
+        tab1, tab2, tab3 = st.tabs(["Dati & Upload", "Simulazione Gara", "Analisi Avanzata"])
+
+        # =============================================================================
+        # TAB 1: PROFILO & METABOLISMO
+        # =============================================================================
+        with tab1:
+            render_tab_profile(db_data, weight, user_vo2, user_vlamax, selected_sport, sim_method)
+
+        # =============================================================================
+        # TAB 2: DIARIO IBRIDO
+        # =============================================================================
+        with tab2:
+            render_tab_tapering()
+
+        # =============================================================================
+        # TAB 3: SIMULAZIONE GARA & STRATEGIA (PULITA)
+        # =============================================================================
+        with tab3:
+            render_tab_simulation(sim_method, create_cutoff_line)
+    finally:
+        # Anche dopo st.stop() di un tab: il profilo copre ciò che è stato eseguito
+        if profiler is not None:
+            render_profile_breakdown(profiler)
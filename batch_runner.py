@@ -0,0 +1,180 @@
+"""
+Esecuzione headless della pianificazione su una rosa di atleti (nessun import di Streamlit/Altair).
+
+Uso:
+    python batch_runner.py rosa.csv risultati.parquet --workers 8
+
+La rosa (CSV o Parquet) ha una riga per atleta con i campi del Subject, le soglie e
+opzionalmente un file di intensità (FIT o tabella a 1 Hz, percorso relativo alla rosa).
+Per ogni atleta: calculate_tank, tapering opzionale (taper_days > 0), poi simulazione
+(task=simulate) o strategia minima (task=strategy). Una riga di risultato per atleta in
+un unico file colonnare (Parquet, oppure CSV se l'estensione è .csv o se manca pyarrow).
+"""
+import argparse
+import importlib.util
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import logic
+from parsers.roster import (
+    build_activity_params, build_subject, load_intensity_file, read_roster, records, roster_race_settings,
+    taper_days_data
+)
+
+DEFAULT_CHUNK_SIZE = 8
+
+# Colonne del file di uscita (ordine fisso, anche per righe in errore)
+RESULT_COLUMNS = (
+    "athlete", "status", "error", "task", "duration_min", "tapered",
+    "start_muscle_g", "start_liver_g", "intake_g_h", "final_glycogen_g",
+    "min_liver_g", "min_muscle_g", "bonk_minute", "binding_constraint", "binding_minute",
+    "total_exo_used_g", "intensity_factor", "simulations", "elapsed_ms",
+)
+
+
+# --- 1. SINGOLO ATLETA ---
+
+def run_athlete(row, base_dir=None):
+    """Pipeline completa di un atleta; ritorna sempre un dict (status='error' con il messaggio)."""
+    started = time.perf_counter()
+    result = dict.fromkeys(RESULT_COLUMNS)
+    result["athlete"] = str(row.get("athlete"))
+    try:
+        subject = build_subject(row, logic.get_concentration_from_vo2max)
+        params = build_activity_params(row, subject)
+        race = roster_race_settings(row)
+        tank = logic.calculate_tank(subject)
+
+        taper = taper_days_data(row, subject)
+        if taper:
+            _, tank = logic.calculate_hourly_tapering(subject, taper, start_state=race["taper_start_state"])
+
+        series = None
+        if row.get("intensity_file"):
+            series = load_intensity_file(str(row["intensity_file"]), subject.sport, base_dir)
+
+        duration = race["duration_min"]
+        intake = race["carb_intake_g_h"]
+        result.update(task=race["task"], duration_min=duration, tapered=bool(taper),
+                      start_muscle_g=tank["muscle_glycogen_g"], start_liver_g=tank["liver_glycogen_g"])
+        simulations = 0
+
+        if race["task"] == "strategy":
+            strategy = logic.solve_minimum_strategy(
+                tank, duration, subject, params, None, race["mix_type"], race["intake_mode"],
+                intake_cutoff_min=race["intake_cutoff_min"], variability_index=race["variability_index"],
+                intensity_series=series, cho_per_unit_g=race["cho_per_unit_g"],
+                crossover_pct=race["crossover_pct"], tau_absorption=race["tau_absorption"]
+            )
+            simulations += strategy["simulations"]
+            result.update(binding_constraint=strategy["binding_constraint"],
+                          binding_minute=strategy["binding_minute"])
+            if strategy["intake_g_h"] is None:
+                result.update(status="infeasible", intake_g_h=None, simulations=simulations)
+                return result
+            intake = strategy["intake_g_h"]
+        elif race["task"] != "simulate":
+            raise ValueError(f"task non valido: {race['task']} (simulate | strategy)")
+
+        _, stats = logic.simulate_metabolism(
+            tank, duration, intake, race["cho_per_unit_g"], race["crossover_pct"], race["tau_absorption"],
+            subject, params, mix_type_input=race["mix_type"], intensity_series=series,
+            intake_mode=race["intake_mode"], intake_cutoff_min=race["intake_cutoff_min"],
+            variability_index=race["variability_index"], summary_only=True, adaptive=race["adaptive"]
+        )
+        simulations += 1
+        # Strategia: la simulazione di verifica deve restare sopra i limiti di sicurezza
+        crossed = (stats["min_liver_g"] <= logic.MIN_LIVER_SAFE or stats["min_muscle_g"] <= logic.MIN_MUSCLE_SAFE)
+        result.update(
+            status="infeasible" if race["task"] == "strategy" and crossed else "ok", intake_g_h=intake, final_glycogen_g=stats["final_glycogen"],
+            min_liver_g=stats["min_liver_g"], min_muscle_g=stats["min_muscle_g"],
+            bonk_minute=stats["bonk_minute"], total_exo_used_g=stats["total_exo_used"],
+            intensity_factor=stats["intensity_factor"], simulations=simulations
+        )
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    finally:
+        result["elapsed_ms"] = (time.perf_counter() - started) * 1000.0
+    return result
+
+
+def _run_chunk(task):
+    rows, base_dir = task
+    return [run_athlete(row, base_dir) for row in rows]
+
+
+# --- 2. ROSA COMPLETA ---
+
+def run_roster(rows, base_dir=None, n_workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Esegue tutti gli atleti in blocchi su processi worker (n_workers=1: tutto nel processo corrente).
+    Ritorna un DataFrame con una riga per atleta, nell'ordine della rosa.
+    """
+    n_chunks = max(1, math.ceil(len(rows) / chunk_size))
+    tasks = [(rows[k::n_chunks], base_dir) for k in range(n_chunks)]
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers <= 1 or len(tasks) == 1:
+        chunks = [_run_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks))) as pool:
+            chunks = list(pool.map(_run_chunk, tasks))
+
+    # I blocchi sono interlacciati (riga i nel blocco i % n_chunks): ripristina l'ordine della rosa
+    ordered = [None] * len(rows)
+    for k, chunk in enumerate(chunks):
+        for j, result in enumerate(chunk):
+            ordered[k + j * n_chunks] = result
+    return pd.DataFrame(ordered, columns=list(RESULT_COLUMNS))
+
+
+def resolve_output_path(path):
+    """
+    Percorso di uscita effettivo, deciso prima della simulazione: senza pyarrow un file Parquet
+    diventa CSV (stesso nome, estensione .csv) invece di fallire a rosa già calcolata.
+    """
+    path = str(path)
+    if path.lower().endswith(".csv") or importlib.util.find_spec("pyarrow") is not None:
+        return path
+    return os.path.splitext(path)[0] + ".csv"
+
+
+def write_results(df, path):
+    """Parquet (colonnare) per default, CSV se l'estensione è .csv."""
+    if str(path).lower().endswith(".csv"):
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+
+
+# --- 3. CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulazione glicogeno headless per una rosa di atleti.")
+    parser.add_argument("roster", help="Rosa atleti (.csv o .parquet)")
+    parser.add_argument("output", help="File risultati (.parquet o .csv)")
+    parser.add_argument("--workers", type=int, default=None, help="Processi worker (default: CPU disponibili)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Atleti per blocco di lavoro")
+    args = parser.parse_args(argv)
+
+    output = resolve_output_path(args.output)
+    if output != args.output:
+        print(f"pyarrow non installato: risultati in CSV ({output})", file=sys.stderr)
+
+    started = time.perf_counter()
+    rows = records(read_roster(args.roster))
+    base_dir = os.path.dirname(os.path.abspath(args.roster))
+    df = run_roster(rows, base_dir, n_workers=args.workers, chunk_size=args.chunk_size)
+    write_results(df, output)
+
+    n_err = int((df["status"] == "error").sum())
+    print(f"{len(df)} atleti in {time.perf_counter() - started:.1f}s · errori: {n_err} · output: {output}")
+    return 1 if n_err else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Casi di benchmark: ognuno prepara gli input fuori dalla misura (setup) e ritorna la funzione da cronometrare.
+Un setup che solleva ImportError (dipendenza opzionale assente: fitparse, openpyxl, altair) rende il caso "skipped".
+"""
+from dataclasses import dataclass
+from typing import Callable
+
+from benchmarks import inputs
+from data_models import ChoMixType, GlycogenState, IntakeMode, SportType
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    name: str
+    group: str
+    setup: Callable   # () -> callable senza argomenti da misurare
+
+
+# --- 1. MOTORI ---
+
+def _simulation(duration_min, kind):
+    def setup():
+        import logic
+        subj = inputs.benchmark_subject()
+        tank = logic.calculate_tank(subj)
+        params = inputs.cycling_params()
+        series = inputs.intensity_series_1hz(duration_min) if kind in ("series", "adaptive") else None
+        curve = logic.build_metabolic_curve(inputs.lab_curve_frame(), 'Watt') if kind == "lab_curve" else None
+        gut_model = logic.GUT_MODEL_COMPARTMENTS if kind == "gut_compartments" else logic.GUT_MODEL_BUCKET
+
+        def run():
+            # Si misura il calcolo, non la cache dei risultati
+            logic.clear_simulation_cache()
+            return logic.simulate_metabolism(
+                tank, duration_min, 60, 30, 75, 20, subj, params,
+                mix_type_input=ChoMixType.MIX_2_1, intensity_series=series, metabolic_curve=curve,
+                intake_mode=IntakeMode.DISCRETE, gut_model=gut_model,
+                # adaptive: passo base di 1 s, dove i passi lunghi rendono di più
+                time_step_s=1 if kind == "adaptive" else 60, adaptive=kind == "adaptive"
+            )
+        return run
+    return setup
+
+
+def _minimum_strategy(duration_min):
+    def setup():
+        import logic
+        subj = inputs.benchmark_subject()
+        tank = logic.calculate_tank(subj)
+        params = inputs.cycling_params()
+
+        def run():
+            logic.clear_simulation_cache()
+            return logic.calculate_minimum_strategy(
+                tank, duration_min, subj, params, None, ChoMixType.MIX_2_1, IntakeMode.DISCRETE
+            )
+        return run
+    return setup
+
+
+def _minimum_strategy_newton(duration_min):
+    def setup():
+        import logic
+        subj = inputs.benchmark_subject()
+        tank = logic.calculate_tank(subj)
+        params = inputs.cycling_params()
+
+        def run():
+            logic.clear_simulation_cache()
+            return logic.solve_minimum_strategy(
+                tank, duration_min, subj, params, None, ChoMixType.MIX_2_1, IntakeMode.DISCRETE,
+                method=logic.SOLVER_NEWTON
+            )
+        return run
+    return setup
+
+
+def _gradients(duration_min):
+    def setup():
+        import logic
+        subj = inputs.benchmark_subject()
+        tank = logic.calculate_tank(subj)
+        params = inputs.cycling_params()
+
+        def run():
+            logic.clear_simulation_cache()
+            return logic.simulate_metabolism_gradients(tank, duration_min, 60, 30, 75, 20, subj, params,
+                                                       mix_type_input=ChoMixType.MIX_2_1)
+        return run
+    return setup
+
+
+def _tapering(n_days):
+    def setup():
+        import logic
+        subj = inputs.benchmark_subject()
+        days = inputs.tapering_days(n_days)
+        return lambda: logic.calculate_hourly_tapering(subj, days, start_state=GlycogenState.NORMAL)
+    return setup
+
+
+def _season(n_days):
+    def setup():
+        import logic
+        subj = inputs.benchmark_subject()
+        days = inputs.tapering_days(n_days)
+        return lambda: logic.run_season_tapering(subj, iter(days), start_state=GlycogenState.NORMAL)
+    return setup
+
+
+# --- 2. PARSER E GRAFICI ---
+
+def _fit_parse(duration_min):
+    def setup():
+        from parsers.fit import process_fit_data
+        data = inputs.synthetic_fit_bytes(duration_min)
+        return lambda: process_fit_data(inputs.NamedBytesIO(data, "activity.fit"))
+    return setup
+
+
+def _metabolic_report(fmt):
+    def setup():
+        from parsers.metabolic import parse_metabolic_report
+        source = inputs.metabolic_report_xlsx() if fmt == "xlsx" else inputs.metabolic_report_csv()
+        data, name = source.getvalue(), source.name
+
+        def run():
+            df, _, err = parse_metabolic_report(inputs.NamedBytesIO(data, name))
+            if err:
+                raise RuntimeError(err)
+            return df
+        return run
+    return setup
+
+
+def _zwo(n_intervals):
+    def setup():
+        from parsers.zwo import parse_zwo_file
+        data = inputs.zwo_workout(n_intervals).getvalue()
+        return lambda: parse_zwo_file(inputs.NamedBytesIO(data, "workout.zwo"), 280, 170, SportType.CYCLING)
+    return setup
+
+
+def _fit_plot(duration_min):
+    def setup():
+        from plots.fit_altair import create_fit_plot
+        df = inputs.fit_frame(duration_min)
+        # to_dict: serializzazione Vega-Lite, come al rendering in Streamlit
+        return lambda: create_fit_plot(df).to_dict()
+    return setup
+
+
+# --- 3. REGISTRO ---
+
+def all_cases():
+    cases = []
+    for hours in (1, 6, 12, 24):
+        for kind in ("constant", "series", "lab_curve", "gut_compartments", "adaptive"):
+            cases.append(BenchmarkCase(f"simulate_metabolism/{kind}/{hours}h", "engine",
+                                       _simulation(hours * 60, kind)))
+    for hours in (3, 8):
+        cases.append(BenchmarkCase(f"calculate_minimum_strategy/{hours}h", "engine", _minimum_strategy(hours * 60)))
+        cases.append(BenchmarkCase(f"solve_minimum_strategy/newton/{hours}h", "engine",
+                                   _minimum_strategy_newton(hours * 60)))
+        cases.append(BenchmarkCase(f"simulate_metabolism_gradients/{hours}h", "engine", _gradients(hours * 60)))
+    for days in (7, 90):
+        cases.append(BenchmarkCase(f"calculate_hourly_tapering/{days}d", "engine", _tapering(days)))
+    cases.append(BenchmarkCase("run_season_tapering/365d", "engine", _season(365)))
+    for hours in (1, 6, 12):
+        cases.append(BenchmarkCase(f"process_fit_data/{hours}h", "parser", _fit_parse(hours * 60)))
+    for fmt in ("csv", "xlsx"):
+        cases.append(BenchmarkCase(f"parse_metabolic_report/{fmt}", "parser", _metabolic_report(fmt)))
+    cases.append(BenchmarkCase("parse_zwo_file/60x", "parser", _zwo(60)))
+    for hours in (1, 6):
+        cases.append(BenchmarkCase(f"create_fit_plot/{hours}h", "plot", _fit_plot(hours * 60)))
+    return cases
@@ -0,0 +1,189 @@
+"""
+Input sintetici deterministici per i benchmark (nessun file esterno): atleti, serie di intensità,
+curve di laboratorio, diari di tapering, file FIT, report metabolici CSV/XLSX e allenamenti ZWO.
+"""
+import datetime
+import io
+import struct
+
+import numpy as np
+import pandas as pd
+
+from data_models import IntensitySeries, Sex, SportType, Subject
+
+SEED = 20240601
+
+# --- 1. ATLETA E GARA ---
+
+def benchmark_subject(sport=SportType.CYCLING):
+    return Subject(
+        weight_kg=70.0, height_cm=180.0, body_fat_pct=0.12, sex=Sex.MALE,
+        glycogen_conc_g_kg=19.0, sport=sport, vo2_max=58.0, vo2max_absolute_l_min=58.0 * 70 / 1000,
+    )
+
+
+def cycling_params(avg_watts=210.0):
+    return {'mode': 'cycling', 'avg_watts': avg_watts, 'np_watts': avg_watts * 1.05, 'ftp_watts': 280.0,
+            'efficiency': 22.0}
+
+
+def power_trace(duration_s, mean_w=210.0, seed=SEED):
+    """Potenza a 1 Hz con blocchi di intensità e rumore (stessa sequenza a ogni esecuzione)."""
+    rng = np.random.default_rng(seed)
+    blocks = np.repeat(rng.uniform(0.7, 1.2, duration_s // 300 + 1), 300)[:duration_s]
+    return np.clip(mean_w * blocks + rng.normal(0, 25, duration_s), 0, None)
+
+
+def intensity_series_1hz(duration_min, mean_w=210.0):
+    return IntensitySeries(power_trace(int(duration_min * 60), mean_w), 1.0, unit='W')
+
+
+def lab_curve_frame():
+    """Curva CHO/FAT per Watt come dopo parse_metabolic_report (1 riga per Watt)."""
+    watts = np.arange(80.0, 421.0)
+    cho = 20 + 0.0035 * watts ** 2
+    fat = np.maximum(0.0, 45 - 0.0009 * (watts - 150) ** 2)
+    return pd.DataFrame({'Watt': watts, 'CHO': cho, 'FAT': fat})
+
+
+# --- 2. TAPERING ---
+
+def tapering_days(n_days, start=datetime.date(2024, 1, 1)):
+    """Diario con allenamenti a giorni alterni e CHO variabili (formato di ui/tab_tapering)."""
+    days = []
+    for k in range(n_days):
+        training = k % 2 == 0
+        days.append({
+            "date_obj": start + datetime.timedelta(days=k),
+            "type": "Ciclismo" if training else "Riposo",
+            "val": 180 + 10 * (k % 5) if training else 0,
+            "duration": 90 if training else 0,
+            "calculated_if": 0.65 + 0.05 * (k % 4) if training else 0.0,
+            "cho_in": 350 + 25 * (k % 7),
+            "sleep_factor": 1.0 if k % 3 else 0.95,
+            "sleep_start": datetime.time(23, 0), "sleep_end": datetime.time(7, 0),
+            "workout_start": datetime.time(18, 0),
+        })
+    return days
+
+
+# --- 3. FILE CARICATI (stessa interfaccia degli UploadedFile di Streamlit) ---
+
+class NamedBytesIO(io.BytesIO):
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+FIT_EPOCH = datetime.datetime(1989, 12, 31, tzinfo=datetime.timezone.utc)
+_FIT_CRC_TABLE = (0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+                  0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400)
+
+# Messaggio "record" (20): (numero campo, dimensione, base type, formato struct)
+_FIT_RECORD_FIELDS = (
+    (253, 4, 0x86, "I"),   # timestamp
+    (7, 2, 0x84, "H"),     # power
+    (3, 1, 0x02, "B"),     # heart_rate
+    (4, 1, 0x02, "B"),     # cadence
+    (6, 2, 0x84, "H"),     # speed (mm/s)
+    (5, 4, 0x86, "I"),     # distance (cm)
+    (2, 2, 0x84, "H"),     # altitude ((m + 500) * 5)
+)
+
+
+def fit_crc(data, crc=0):
+    for byte in data:
+        tmp = _FIT_CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ _FIT_CRC_TABLE[byte & 0xF]
+        tmp = _FIT_CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ _FIT_CRC_TABLE[(byte >> 4) & 0xF]
+    return crc
+
+
+def _fit_definition(local_type, global_num, fields):
+    body = struct.pack("<BBHB", 0, 0, global_num, len(fields))
+    body += b"".join(struct.pack("<BBB", num, size, base) for num, size, base, _ in fields)
+    return struct.pack("<B", 0x40 | local_type) + body
+
+
+def synthetic_fit_bytes(duration_min, seed=SEED):
+    """File FIT di attività (file_id + un record al secondo) con potenza, FC, cadenza, velocità, quota."""
+    n = int(duration_min * 60)
+    rng = np.random.default_rng(seed)
+    power = power_trace(n, seed=seed)
+    hr = np.clip(120 + power * 0.15 + rng.normal(0, 2, n), 60, 200)
+    speed = np.clip(8.0 + power / 60 + rng.normal(0, 0.3, n), 0, None)            # m/s
+    distance = np.cumsum(speed)
+    altitude = 200 + 150 * np.sin(np.arange(n) / 900.0)
+    start = int((datetime.datetime(2024, 6, 1, 8, 0, tzinfo=datetime.timezone.utc) - FIT_EPOCH).total_seconds())
+
+    file_id = ((0, 1, 0x00, "B"), (4, 4, 0x86, "I"))   # type=activity, time_created
+    records = [_fit_definition(0, 0, file_id), struct.pack("<BBI", 0, 4, start)]
+    records.append(_fit_definition(1, 20, _FIT_RECORD_FIELDS))
+    fmt = "<B" + "".join(f for *_, f in _FIT_RECORD_FIELDS)
+    columns = np.column_stack([
+        start + np.arange(n), np.round(power), np.round(hr), np.full(n, 88), np.round(speed * 1000),
+        np.round(distance * 100), np.round((altitude + 500) * 5),
+    ]).astype(np.int64)
+    records.extend(struct.pack(fmt, 0x01, *row) for row in columns.tolist())
+    data = b"".join(records)
+
+    header = struct.pack("<BBHI4s", 14, 0x10, 2093, len(data), b".FIT")
+    header += struct.pack("<H", fit_crc(header))
+    payload = header + data
+    return payload + struct.pack("<H", fit_crc(payload))
+
+
+def fit_frame(duration_min, seed=SEED):
+    """DataFrame nel formato di process_fit_data (per create_fit_plot senza fitparse)."""
+    n = int(duration_min * 60)
+    power = power_trace(n, seed=seed)
+    idx = pd.date_range("2024-06-01 08:00", periods=n, freq="1s")
+    return pd.DataFrame({
+        'power': power, 'heart_rate': 120 + power * 0.15, 'cadence': np.full(n, 88.0),
+        'altitude': 200 + 150 * np.sin(np.arange(n) / 900.0), 'speed_kmh': np.full(n, 32.0),
+        'moving_time_min': np.arange(n) / 60.0,
+    }, index=idx)
+
+
+def metabolic_report_frame(n_rows=600, seed=SEED):
+    """Rampa incrementale con HR, Watt, CHO e FAT (g/min) e rumore, come un export di metabolimetro."""
+    rng = np.random.default_rng(seed)
+    watts = np.linspace(80, 400, n_rows)
+    return pd.DataFrame({
+        "t": np.arange(n_rows) * 10,
+        "WR (Watt)": np.round(watts),
+        "HR (bpm)": np.round(95 + watts * 0.22 + rng.normal(0, 2, n_rows)),
+        "CHO (g/min)": np.round(np.clip(0.3 + 0.00004 * watts ** 2 + rng.normal(0, 0.1, n_rows), 0, None), 3),
+        "FAT (g/min)": np.round(np.clip(0.75 - 0.0000095 * (watts - 150) ** 2 + rng.normal(0, 0.05, n_rows), 0, None), 3),
+    })
+
+
+def metabolic_report_csv(n_rows=600):
+    preamble = "Report Test Metabolico;\nAtleta;Benchmark\n\n"
+    body = metabolic_report_frame(n_rows).to_csv(sep=";", index=False, decimal=",")
+    return NamedBytesIO((preamble + body).encode("latin-1"), "report.csv")
+
+
+def metabolic_report_xlsx(n_rows=600):
+    """Richiede openpyxl (come la lettura Excel dell'app)."""
+    buffer = io.BytesIO()
+    df = metabolic_report_frame(n_rows)
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        pd.DataFrame([["Report Test Metabolico"], ["Atleta: Benchmark"]]).to_excel(
+            writer, index=False, header=False, startrow=0)
+        df.to_excel(writer, index=False, startrow=3)
+    return NamedBytesIO(buffer.getvalue(), "report.xlsx")
+
+
+def zwo_workout(n_intervals=60):
+    """Allenamento ZWO con riscaldamento e ripetute SteadyState (~3 h con 60 intervalli)."""
+    steps = ['<SteadyState Duration="600" Power="0.55"/>']
+    for k in range(n_intervals):
+        steps.append(f'<SteadyState Duration="{120 + 30 * (k % 3)}" Power="{0.95 + 0.05 * (k % 4):.2f}"/>')
+        steps.append('<SteadyState Duration="60" Power="0.50"/>')
+    xml = ("<workout_file><name>Benchmark</name><sportType>bike</sportType><workout>"
+           + "".join(steps) + "</workout></workout_file>")
+    return NamedBytesIO(xml.encode("utf-8"), "workout.zwo")
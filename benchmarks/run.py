@@ -0,0 +1,169 @@
+"""
+Suite di benchmark riproducibile (input sintetici fissi): tempo e picco di memoria per caso,
+storico in JSON Lines e segnalazione delle regressioni.
+
+Uso:
+    python -m benchmarks.run                       # tutti i casi, storico in benchmarks/history.jsonl
+    python -m benchmarks.run -k simulate --threshold 15 --fail-on-regression
+    python -m benchmarks.run --no-save             # solo confronto, senza scrivere lo storico
+
+Il tempo è la mediana di più ripetizioni (almeno --min-time secondi); il picco di memoria è
+misurato con tracemalloc su un'esecuzione separata, così non altera i tempi.
+Regressione: mediana oltre la soglia percentuale rispetto alla mediana delle ultime
+--baseline-runs esecuzioni riuscite dello stesso caso nello storico.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.cases import all_cases
+
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+DEFAULT_THRESHOLD_PCT = 10.0
+DEFAULT_MIN_TIME_S = 0.5
+DEFAULT_MAX_REPEATS = 50
+DEFAULT_BASELINE_RUNS = 5
+
+
+# --- 1. MISURA ---
+
+def time_callable(fn, min_time_s=DEFAULT_MIN_TIME_S, max_repeats=DEFAULT_MAX_REPEATS, min_repeats=3):
+    """Tempi (ms) di ripetizioni successive dopo un'esecuzione di riscaldamento."""
+    fn()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_repeats and (len(samples) < min_repeats or time.perf_counter() - started < min_time_s):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return np.array(samples)
+
+
+def peak_memory_kb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024.0
+
+
+def run_case(case, min_time_s=DEFAULT_MIN_TIME_S, max_repeats=DEFAULT_MAX_REPEATS):
+    record = {"case": case.name, "group": case.group}
+    try:
+        fn = case.setup()
+    except ImportError as e:
+        return {**record, "status": "skipped", "reason": f"dipendenza mancante: {e.name or e}"}
+    try:
+        samples = time_callable(fn, min_time_s, max_repeats)
+        peak = peak_memory_kb(fn)
+    except Exception as e:
+        return {**record, "status": "error", "reason": f"{type(e).__name__}: {e}"}
+    return {
+        **record, "status": "ok",
+        "median_ms": float(np.median(samples)), "min_ms": float(samples.min()),
+        "stdev_ms": float(samples.std()), "repeats": int(len(samples)), "peak_kb": peak,
+    }
+
+
+# --- 2. STORICO E REGRESSIONI ---
+
+def environment_info():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        rev = ""
+    return {"git_rev": rev or None, "python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pd.__version__, "machine": platform.machine(), "node": platform.node()}
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def append_history(path, records):
+    with open(path, "a", encoding="utf-8") as fh:
+        for record in records:
+            fh.write(json.dumps(record) + "\n")
+
+
+def flag_regressions(records, history, threshold_pct=DEFAULT_THRESHOLD_PCT, baseline_runs=DEFAULT_BASELINE_RUNS):
+    """Aggiunge baseline_ms, delta_pct e regression ai record riusciti (baseline = storico precedente)."""
+    for record in records:
+        if record["status"] != "ok":
+            continue
+        past = [h["median_ms"] for h in history if h.get("case") == record["case"] and h.get("status") == "ok"]
+        past = past[-baseline_runs:]
+        if not past:
+            record.update(baseline_ms=None, delta_pct=None, regression=False)
+            continue
+        baseline = float(np.median(past))
+        delta = (record["median_ms"] - baseline) / baseline * 100.0 if baseline > 0 else 0.0
+        record.update(baseline_ms=baseline, delta_pct=delta, regression=delta > threshold_pct)
+    return records
+
+
+def format_report(records):
+    lines = [f"{'caso':<44} {'mediana ms':>11} {'min ms':>9} {'picco kB':>10} {'Δ%':>8}  esito"]
+    for r in records:
+        if r["status"] != "ok":
+            lines.append(f"{r['case']:<44} {'':>11} {'':>9} {'':>10} {'':>8}  {r['status']} ({r['reason']})")
+            continue
+        delta = f"{r['delta_pct']:+.1f}" if r.get("delta_pct") is not None else "—"
+        flag = "REGRESSIONE" if r.get("regression") else "ok"
+        lines.append(f"{r['case']:<44} {r['median_ms']:>11.2f} {r['min_ms']:>9.2f} {r['peak_kb']:>10.0f} "
+                     f"{delta:>8}  {flag}")
+    return "\n".join(lines)
+
+
+# --- 3. CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark di motori, parser e grafici.")
+    parser.add_argument("-k", "--filter", default=None, help="Solo i casi il cui nome contiene questa stringa")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="File JSON Lines dello storico")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD_PCT, help="Soglia regressione (%%)")
+    parser.add_argument("--baseline-runs", type=int, default=DEFAULT_BASELINE_RUNS)
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME_S, help="Secondi minimi di misura per caso")
+    parser.add_argument("--max-repeats", type=int, default=DEFAULT_MAX_REPEATS)
+    parser.add_argument("--no-save", action="store_true", help="Non aggiornare lo storico")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit code 1 se ci sono regressioni")
+    args = parser.parse_args(argv)
+
+    cases = [c for c in all_cases() if args.filter is None or args.filter in c.name]
+    history = load_history(args.history)
+    run_info = {"run_id": uuid.uuid4().hex[:12],
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                **environment_info()}
+
+    records = []
+    for case in cases:
+        records.append({**run_info, **run_case(case, args.min_time, args.max_repeats)})
+    flag_regressions(records, history, args.threshold, args.baseline_runs)
+    print(format_report(records))
+
+    if not args.no_save:
+        append_history(args.history, records)
+    regressions = [r["case"] for r in records if r.get("regression")]
+    if regressions:
+        print(f"\n{len(regressions)} regressioni oltre {args.threshold:.0f}%: {', '.join(regressions)}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 from enum import Enum
 from dataclasses import dataclass
+import numpy as np
 
 class Sex(Enum):
     MALE = "Uomo"
@@ -110,6 +111,202 @@ class IntakeMode(Enum):
     DISCRETE = "Discretizzata (Gel / Barrette / Solidi)"
     CONTINUOUS = "Continuativa (Bevanda Isotonica / Sorsi frequenti)"
 
+class SeriesAggregation(Enum):
+    MEAN = ("mean", "Media Aritmetica")
+    POWER4 = ("power4", "Media 4ª Potenza (stile NP)")
+
+    def __init__(self, key, label):
+        self.key = key
+        self.label = label
+
+@dataclass
+class IntensitySeries:
+    """
+    Serie di intensità (Watt, BPM, km/h...) con la sua frequenza di campionamento.
+    Il motore la ricampiona una sola volta al proprio passo temporale con l'aggregazione scelta.
+    Le liste semplici restano interpretate come un valore al minuto.
+    """
+    values: np.ndarray
+    sample_rate_hz: float = 1.0 / 60.0
+    unit: str = ""
+    aggregation: SeriesAggregation = SeriesAggregation.MEAN
+
+    def __post_init__(self):
+        self.values = np.nan_to_num(np.asarray(self.values, dtype=float))
+        if self.sample_rate_hz <= 0:
+            raise ValueError("sample_rate_hz deve essere positivo")
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def per_minute(cls, values, unit="", aggregation=SeriesAggregation.MEAN):
+        return cls(values, 1.0 / 60.0, unit, aggregation)
+
+    @classmethod
+    def from_frame(cls, df, column, sample_rate_hz=1.0, scale=1.0, unit="", aggregation=SeriesAggregation.MEAN):
+        """Serie da una colonna di un DataFrame a passo costante (es. FIT a 1 Hz)."""
+        return cls(df[column].fillna(0).to_numpy(dtype=float) * scale, sample_rate_hz, unit, aggregation)
+
+    @property
+    def step_s(self) -> float:
+        return 1.0 / self.sample_rate_hz
+
+    @property
+    def duration_min(self) -> float:
+        return len(self.values) * self.step_s / 60.0
+
+    def resample(self, target_rate_hz, aggregation=None):
+        """
+        Nuova serie a target_rate_hz. In riduzione ogni campione di uscita aggrega i campioni
+        del suo intervallo (media o media della 4ª potenza); in aumento si ripete l'ultimo valore.
+        """
+        aggregation = aggregation or self.aggregation
+        if np.isclose(target_rate_hz, self.sample_rate_hz):
+            return IntensitySeries(self.values.copy(), self.sample_rate_hz, self.unit, aggregation)
+        n_in = len(self.values)
+        if n_in == 0:
+            return IntensitySeries(np.zeros(0), target_rate_hz, self.unit, aggregation)
+
+        ratio = self.sample_rate_hz / target_rate_hz
+        if ratio > 1:
+            bins = np.floor(np.arange(n_in) / ratio + 1e-9).astype(int)
+            counts = np.bincount(bins)
+            if aggregation == SeriesAggregation.POWER4:
+                values = (np.bincount(bins, weights=self.values ** 4) / counts) ** 0.25
+            else:
+                values = np.bincount(bins, weights=self.values) / counts
+        else:
+            n_out = int(np.ceil(n_in / ratio - 1e-9))
+            source = np.minimum(np.floor(np.arange(n_out) * ratio + 1e-9).astype(int), n_in - 1)
+            values = self.values[source]
+        return IntensitySeries(values, target_rate_hz, self.unit, aggregation)
+
+    def values_at_step(self, step_s, aggregation=None):
+        """Valori ricampionati al passo del motore (secondi per campione)."""
+        return self.resample(1.0 / step_s, aggregation).values
+
+@dataclass
+class IntakePlan:
+    """
+    Piano di assunzione esplicito, costruito una volta prima della simulazione: eventi discreti
+    (minuto, grammi, prodotto) e tratti a sorsi continui (inizio, fine, g/h, prodotto).
+    Il motore lo converte in grammi per passo; target_g_h è il rateo che guida l'ossidazione
+    esogena (None = rateo medio del piano sulla durata di gara). Prodotto None = mix della simulazione.
+    """
+    event_min: np.ndarray
+    event_g: np.ndarray
+    event_mix: tuple = ()
+    sips: tuple = ()
+    target_g_h: float = None
+
+    def __post_init__(self):
+        self.event_min = np.asarray(self.event_min, dtype=float).ravel()
+        self.event_g = np.asarray(self.event_g, dtype=float).ravel()
+        if self.event_min.shape != self.event_g.shape:
+            raise ValueError("event_min e event_g devono avere la stessa lunghezza")
+        self.event_mix = tuple(self.event_mix) or (None,) * len(self.event_min)
+        if len(self.event_mix) != len(self.event_min):
+            raise ValueError("event_mix deve avere un prodotto per evento")
+        self.sips = tuple(
+            (float(s[0]), float(s[1]), float(s[2]), s[3] if len(s) > 3 else None) for s in self.sips
+        )
+
+    def __len__(self):
+        return len(self.event_min) + len(self.sips)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0), np.zeros(0), target_g_h=0.0)
+
+    @classmethod
+    def from_strategy(cls, constant_carb_intake_g_h, cho_per_unit_g, intake_mode, duration_min, intake_cutoff_min=0):
+        """
+        Piano equivalente alla strategia a rateo costante: un'unità al minuto 0 e poi ogni
+        round(60 / unità orarie) minuti (DISCRETE), oppure sorsi continui (CONTINUOUS), fino al cutoff.
+        """
+        if constant_carb_intake_g_h == 0:
+            return cls.empty()
+        window_end = duration_min - intake_cutoff_min
+        if getattr(intake_mode, 'name', None) != 'DISCRETE':
+            return cls(np.zeros(0), np.zeros(0), sips=((0.0, window_end, constant_carb_intake_g_h),),
+                       target_g_h=constant_carb_intake_g_h)
+
+        units_per_hour = constant_carb_intake_g_h / cho_per_unit_g if cho_per_unit_g > 0 else 0
+        interval = round(60 / units_per_hour) if units_per_hour > 0 else duration_min + 1
+        if window_end < 0:
+            minutes = np.zeros(0)
+        elif interval > 0:
+            minutes = np.arange(0, np.floor(window_end) + 1, interval)
+        else:
+            minutes = np.zeros(1)
+        return cls(minutes, np.full(len(minutes), float(cho_per_unit_g)), target_g_h=constant_carb_intake_g_h)
+
+    @classmethod
+    def from_events(cls, events, target_g_h=None):
+        """Piano da eventi (minuto, grammi[, prodotto]), es. rifornimenti ai ristori."""
+        events = list(events)
+        return cls(
+            [e[0] for e in events], [e[1] for e in events],
+            event_mix=tuple(e[2] if len(e) > 2 else None for e in events), target_g_h=target_g_h
+        )
+
+    @classmethod
+    def from_schedule(cls, minutes, unit_g, target_g_h=None):
+        """Piano da un elenco di minuti con unità tutte uguali (es. optimize_intake_schedule)."""
+        return cls(minutes, np.full(len(minutes), float(unit_g)), target_g_h=target_g_h)
+
+    def total_g(self, until_min=None):
+        """Grammi previsti dal piano (fino a until_min se indicato)."""
+        end = np.inf if until_min is None else until_min
+        total = float(self.event_g[self.event_min <= end].sum())
+        for start, stop, rate, _ in self.sips:
+            total += rate * max(min(stop, end) - start, 0.0) / 60.0
+        return total
+
+    def rate_g_h(self, duration_min):
+        """Rateo di riferimento per l'ossidazione: target_g_h oppure media del piano sulla gara."""
+        if self.target_g_h is not None:
+            return self.target_g_h
+        if duration_min <= 0:
+            return 0.0
+        return self.total_g(duration_min) / (duration_min / 60.0)
+
+    def grams_per_step(self, t, step_s=60):
+        """Grammi ingeriti in ogni passo della timeline t (minuti, un campione ogni step_s secondi)."""
+        t = np.asarray(t)
+        n = len(t)
+        out = np.zeros(n)
+        if len(self.event_min):
+            idx = np.rint(self.event_min * (60.0 / step_s)).astype(int)
+            keep = (idx >= 0) & (idx < n)
+            out += np.bincount(idx[keep], weights=self.event_g[keep], minlength=n)[:n]
+        for start, stop, rate, _ in self.sips:
+            out = np.where((t >= start) & (t <= stop), out + rate / 60.0 * (step_s / 60.0), out)
+        return out
+
+    def mix_grams(self, default_mix):
+        """Grammi per prodotto (None = default_mix), nell'ordine di prima comparsa."""
+        grams = {}
+        for mix, g in zip(self.event_mix, self.event_g.tolist()):
+            mix = mix or default_mix
+            grams[mix] = grams.get(mix, 0.0) + g
+        for start, stop, rate, mix in self.sips:
+            mix = mix or default_mix
+            grams[mix] = grams.get(mix, 0.0) + rate * max(stop - start, 0.0) / 60.0
+        return {mix: g for mix, g in grams.items() if g > 0}
+
+    def blended(self, rate_fn, default_mix):
+        """
+        Media di rate_fn(prodotto) pesata sui grammi di ciascun prodotto (es. ossidazione
+        esogena massima con prodotti diversi); con un solo prodotto è rate_fn(prodotto).
+        """
+        grams = self.mix_grams(default_mix)
+        if len(grams) <= 1:
+            return rate_fn(next(iter(grams), default_mix))
+        total = sum(grams.values())
+        return sum(rate_fn(mix) * g for mix, g in grams.items()) / total
+
 @dataclass
 class Subject:
     weight_kg: float
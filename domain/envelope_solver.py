@@ -0,0 +1,232 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from data_models import ChoMixType, IntakeMode
+from domain.metabolic_curve import compile_metabolic_curve
+from domain.metabolism_engine import BONK_LIVER_G, BONK_MUSCLE_G
+from domain.vectorized_engine import (
+    exogenous_oxidation_batch, exogenous_target, glycogen_recurrence_batch, intake_series, prepare_demand_series,
+    race_summary_batch, resolve_activity, resolve_max_exo_rate
+)
+
+DEFAULT_DURATIONS_MIN = np.linspace(60, 600, 20)
+DEFAULT_INTAKES_G_H = np.linspace(0, 120, 10)
+DEFAULT_N_INTENSITIES = 20
+ENVELOPE_TOLERANCE = 1.0  # W o bpm
+
+
+# --- 1. PARAMETRI DELLA GRIGLIA ---
+
+def intensity_key(activity_params):
+    """Parametro di intensità media della disciplina: Watt (ciclismo) o BPM (corsa)."""
+    return 'avg_watts' if activity_params.get('mode', 'cycling') == 'cycling' else 'avg_hr'
+
+
+def default_intensity_grid(activity_params, subject_obj, n_points=DEFAULT_N_INTENSITIES):
+    """Intensità dal 50% al 110% della soglia (FTP o soglia anaerobica)."""
+    activity = resolve_activity(activity_params, subject_obj)
+    threshold = activity['threshold_ref'] if activity['threshold_ref'] > 0 else activity['base_val'] / 0.8
+    return np.linspace(0.5 * threshold, 1.10 * threshold, n_points)
+
+
+def steady_activity(activity_params, intensity):
+    """Parametri attività a intensità costante (per il ciclismo NP = media)."""
+    params = dict(activity_params)
+    params[intensity_key(activity_params)] = float(intensity)
+    params.pop('np_watts', None)
+    return params
+
+
+def steady_cho_matrix(duration_min, intensities, crossover_pct, subject_obj, activity_params,
+                      metabolic_curve=None):
+    """Domanda CHO (g/min) a intensità costante: matrice (tempo, intensità) e timeline."""
+    columns = []
+    t = None
+    for value in np.atleast_1d(intensities):
+        series = prepare_demand_series(
+            duration_min, crossover_pct, subject_obj, steady_activity(activity_params, value),
+            metabolic_curve=metabolic_curve
+        )
+        t = series['t']
+        columns.append(series['cho_g_min'])
+    return t, np.column_stack(columns)
+
+
+# --- 2. SUPERFICIE PRECALCOLATA ---
+
+def _axis_weights(grid, x):
+    """Indici e peso per l'interpolazione lineare su un asse (valori fuori griglia al bordo)."""
+    grid = np.asarray(grid, dtype=float)
+    if len(grid) == 1:
+        return 0, 0, 0.0
+    x = float(np.clip(x, grid[0], grid[-1]))
+    i1 = int(np.clip(np.searchsorted(grid, x), 1, len(grid) - 1))
+    i0 = i1 - 1
+    w = (x - grid[i0]) / (grid[i1] - grid[i0])
+    return i0, i1, w
+
+
+@dataclass
+class EnvelopeSurface:
+    """
+    Inviluppo di sostenibilità di un soggetto:
+    - reserve_g[durata, intensità, intake]: glicogeno totale residuo a fine gara (0 = esaurito);
+    - bonk_minute[intensità, intake]: primo minuto di crisi sulla durata massima (-1 se assente);
+    - max_intensity[durata, intake]: intensità media massima senza crisi (NaN se nemmeno il minimo
+      della griglia è sostenibile; pari a meta['search_ceiling'] se il limite è oltre la ricerca).
+    """
+    durations: np.ndarray
+    intensities: np.ndarray
+    intakes: np.ndarray
+    reserve_g: np.ndarray
+    bonk_minute: np.ndarray
+    max_intensity: np.ndarray
+    intensity_label: str = "avg_watts"
+    simulations: int = 0
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def shape(self):
+        return self.reserve_g.shape
+
+    def sustainable(self, duration_min, intensity, intake_g_h):
+        """True se l'intensità resta sotto il massimo sostenibile interpolato."""
+        limit = self.max_sustainable(duration_min, intake_g_h)
+        return bool(np.isfinite(limit) and intensity <= limit)
+
+    def max_sustainable(self, duration_min, intake_g_h):
+        d0, d1, wd = _axis_weights(self.durations, duration_min)
+        k0, k1, wk = _axis_weights(self.intakes, intake_g_h)
+        m = self.max_intensity
+        corners = np.array([m[d0, k0], m[d0, k1], m[d1, k0], m[d1, k1]])
+        if np.isnan(corners).any():
+            # Vicino al bordo di sostenibilità: stima prudente
+            return float(np.nanmin(corners)) if not np.isnan(corners).all() else float('nan')
+        top = m[d0, k0] * (1 - wk) + m[d0, k1] * wk
+        bottom = m[d1, k0] * (1 - wk) + m[d1, k1] * wk
+        return float(top * (1 - wd) + bottom * wd)
+
+    def bonk_minute_at(self, intensity, intake_g_h):
+        """Minuto di crisi interpolato (None se nessuna crisi entro la durata massima)."""
+        i0, i1, wi = _axis_weights(self.intensities, intensity)
+        k0, k1, wk = _axis_weights(self.intakes, intake_g_h)
+        horizon = float(self.durations[-1])
+        b = np.where(self.bonk_minute < 0, np.inf, self.bonk_minute).astype(float)
+        corners = [b[i0, k0], b[i0, k1], b[i1, k0], b[i1, k1]]
+        if all(np.isinf(c) for c in corners):
+            return None
+        c = [min(v, horizon + 1) for v in corners]
+        top = c[0] * (1 - wk) + c[1] * wk
+        bottom = c[2] * (1 - wk) + c[3] * wk
+        value = top * (1 - wi) + bottom * wi
+        return None if value > horizon else float(value)
+
+    def reserve_at(self, duration_min, intensity, intake_g_h):
+        d0, d1, wd = _axis_weights(self.durations, duration_min)
+        i0, i1, wi = _axis_weights(self.intensities, intensity)
+        k0, k1, wk = _axis_weights(self.intakes, intake_g_h)
+        r = self.reserve_g
+        value = 0.0
+        for di, dw in ((d0, 1 - wd), (d1, wd)):
+            for ii, iw in ((i0, 1 - wi), (i1, wi)):
+                for ki, kw in ((k0, 1 - wk), (k1, wk)):
+                    value += dw * iw * kw * r[di, ii, ki]
+        return float(value)
+
+    def query(self, duration_min, intensity, intake_g_h):
+        """Risposta istantanea a "posso tenere X per D minuti a Y g/h?"."""
+        limit = self.max_sustainable(duration_min, intake_g_h)
+        bonk = self.bonk_minute_at(intensity, intake_g_h)
+        return {
+            "feasible": bool(np.isfinite(limit)),
+            "sustainable": bool(np.isfinite(limit) and intensity <= limit),
+            "max_intensity": limit,
+            "bonk_minute": bonk,
+            "reserve_g": self.reserve_at(duration_min, intensity, intake_g_h),
+        }
+
+
+# --- 3. SOLVER ---
+
+def _intake_matrix(t, duration_min, intakes, cho_per_unit_g, intake_mode):
+    return np.column_stack([
+        intake_series(t, duration_min, rate, cho_per_unit_g, intake_mode, 0) for rate in intakes
+    ])
+
+
+def solve_envelope(tank, subject_obj, activity_params, durations=None, intensities=None, intakes=None,
+                   crossover_pct=75, tau_absorption=20, cho_per_unit_g=30, intake_mode=IntakeMode.DISCRETE,
+                   mix_type=ChoMixType.GLUCOSE_ONLY, oxidation_efficiency=0.80, custom_max_exo_rate=None,
+                   metabolic_curve=None, tolerance=ENVELOPE_TOLERANCE):
+    """
+    Calcola l'EnvelopeSurface con la fisica di simulate_metabolism a intensità costante.
+    La simulazione di una gara più corta è un prefisso di quella più lunga (intake senza cutoff),
+    quindi ogni coppia (intensità, intake) si simula una sola volta sulla durata massima e si
+    campiona alle durate della griglia. L'intensità massima per ogni (durata, intake) si trova per
+    bisezione, con tutte le coppie valutate insieme a ogni passo (race_summary_batch).
+    """
+    durations = np.asarray(DEFAULT_DURATIONS_MIN if durations is None else durations, dtype=float)
+    intensities = np.asarray(
+        default_intensity_grid(activity_params, subject_obj) if intensities is None else intensities, dtype=float
+    )
+    intakes = np.asarray(DEFAULT_INTAKES_G_H if intakes is None else intakes, dtype=float)
+    horizon = int(np.ceil(durations.max()))
+    metabolic_curve = compile_metabolic_curve(metabolic_curve)
+    activity = resolve_activity(activity_params, subject_obj)
+    max_exo = resolve_max_exo_rate(custom_max_exo_rate, subject_obj, activity, mix_type)
+    alpha = 1 - np.exp(-1.0 / tau_absorption)
+    targets = np.array([exogenous_target(rate, max_exo, oxidation_efficiency) for rate in intakes])
+    m0, l0 = tank['muscle_glycogen_g'], tank['liver_glycogen_g']
+    n_i, n_k, n_d = len(intensities), len(intakes), len(durations)
+
+    # A. Griglia intensità x intake: traiettorie complete sulla durata massima
+    t, cho = steady_cho_matrix(horizon, intensities, crossover_pct, subject_obj, activity_params, metabolic_curve)
+    intake = _intake_matrix(t, horizon, intakes, cho_per_unit_g, intake_mode)
+    # Colonne scenario: intensità più lenta, intake più veloce
+    cho_s = np.repeat(cho, n_k, axis=1)
+    intake_s = np.tile(intake, (1, n_i))
+    target_s = np.tile(targets, n_i)
+    exo, _ = exogenous_oxidation_batch(intake_s, target_s, alpha, oxidation_efficiency)
+    state = glycogen_recurrence_batch(cho_s, exo, m0, l0)
+    total = state['muscle'] + state['liver']
+    rows = np.minimum(np.round(durations).astype(int), len(t) - 1)
+    reserve = total[rows].reshape(n_d, n_i, n_k)
+    crisis = (state['liver'] <= BONK_LIVER_G) | (state['muscle'] <= BONK_MUSCLE_G)
+    bonk = np.where(crisis.any(axis=0), crisis.argmax(axis=0), -1).reshape(n_i, n_k)
+    simulations = n_i * n_k
+
+    # B. Bisezione vettoriale dell'intensità massima per ogni (durata, intake)
+    # Intervallo di ricerca: [10% del minimo, 150% del massimo della griglia]
+    floor_value = float(intensities.min()) * 0.1
+    lo = np.full((n_d, n_k), floor_value)
+    hi = np.full((n_d, n_k), float(intensities.max()) * 1.5)
+    d_idx, k_idx = np.meshgrid(np.arange(n_d), np.arange(n_k), indexing='ij')
+    d_flat, k_flat = d_idx.ravel(), k_idx.ravel()
+    step_rows = np.minimum(np.round(durations[d_flat]).astype(int), len(t) - 1)
+
+    def survives(values):
+        nonlocal simulations
+        _, cho_mid = steady_cho_matrix(horizon, values, crossover_pct, subject_obj, activity_params,
+                                       metabolic_curve)
+        summary = race_summary_batch(cho_mid, intake[:, k_flat], targets[k_flat], alpha, oxidation_efficiency,
+                                     m0, l0)
+        simulations += len(values)
+        b = summary['bonk_minute']
+        return (b < 0) | (b > step_rows)
+
+    ok_floor = survives(np.full(n_d * n_k, floor_value)).reshape(n_d, n_k)
+    while np.max(hi - lo) > tolerance:
+        mid = (lo + hi) / 2
+        ok = survives(mid.ravel()).reshape(n_d, n_k)
+        lo = np.where(ok, mid, lo)
+        hi = np.where(ok, hi, mid)
+    max_intensity = np.where(ok_floor, lo, np.nan)
+
+    return EnvelopeSurface(
+        durations=durations, intensities=intensities, intakes=intakes,
+        reserve_g=reserve, bonk_minute=bonk, max_intensity=max_intensity,
+        intensity_label=intensity_key(activity_params), simulations=simulations,
+        meta={"tau_absorption": tau_absorption, "crossover_pct": crossover_pct, "cho_per_unit_g": cho_per_unit_g,
+              "tolerance": tolerance, "search_ceiling": float(intensities.max()) * 1.5},
+    )
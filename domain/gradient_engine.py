@@ -0,0 +1,277 @@
+import itertools
+import math
+
+import numpy as np
+
+from data_models import ChoMixType, IntakeMode, IntakePlan
+from domain.metabolism_engine import BONK_LIVER_G, BONK_MUSCLE_G
+from domain.vectorized_engine import (
+    MAX_LIVER_OUTPUT_G_MIN, MUSCLE_CONTRIBUTION_EXPONENT, plan_max_exo_rate, prepare_demand_series
+)
+
+# Parametri derivabili (nomi delle colonne dei gradienti)
+GRADIENT_PARAMETERS = (
+    "intake_g_h", "tau_absorption", "oxidation_efficiency", "crossover_pct", "initial_muscle_g", "initial_liver_g",
+)
+CROSSOVER_STEP = 1e-3  # differenza centrata: la tabella dei substrati è lineare a tratti (punti di crossover)
+
+GRADIENT_OUTPUTS = (
+    "final_muscle_g", "final_liver_g", "final_glycogen", "min_liver_g", "min_muscle_g", "total_exo_used",
+    "bonk_time_min",
+)
+
+
+# --- 1. SEMI (DERIVATE DEGLI INGRESSI) ---
+
+def _intake_plan_tangent(t, step_s, constant_carb_intake_g_h, cho_per_unit_g, intake_mode, duration_min,
+                         intake_cutoff_min, dt_min):
+    """
+    Derivata dei grammi per passo rispetto al rateo (g/h). La griglia delle unità discrete non è
+    derivabile: si derivano le unità a orari fissi (grammi proporzionali al rateo). A rateo nullo
+    si usa il limite continuo (sorsi da 1 g/h fino al cutoff).
+    """
+    if constant_carb_intake_g_h > 0:
+        plan = IntakePlan.from_strategy(constant_carb_intake_g_h, cho_per_unit_g, intake_mode, duration_min,
+                                        intake_cutoff_min)
+        return plan.grams_per_step(t, step_s) / constant_carb_intake_g_h
+    plan = IntakePlan.from_strategy(1.0, cho_per_unit_g, IntakeMode.CONTINUOUS, duration_min, intake_cutoff_min)
+    return plan.grams_per_step(t, step_s)
+
+
+def _crossover_tangent(duration_min, crossover_pct, subject_obj, activity_params, intensity_series, metabolic_curve,
+                       variability_index, step_s):
+    """d(CHO g/min)/d(crossover) per differenza centrata sulle serie (pendenza locale del tratto)."""
+    if metabolic_curve is not None:
+        return None
+    upper = prepare_demand_series(duration_min, crossover_pct + CROSSOVER_STEP, subject_obj, activity_params,
+                                  intensity_series, None, variability_index, step_s=step_s)
+    lower = prepare_demand_series(duration_min, crossover_pct - CROSSOVER_STEP, subject_obj, activity_params,
+                                  intensity_series, None, variability_index, step_s=step_s)
+    return (upper['cho_g_min'] - lower['cho_g_min']) / (2 * CROSSOVER_STEP)
+
+
+# --- 2. PROPAGAZIONE IN AVANTI (UNA DIREZIONE PER PASSATA) ---
+
+def exogenous_oxidation_tangent(intake_g, d_intake_g, effective_target, d_target, alpha, d_alpha,
+                                oxidation_efficiency, d_efficiency, dt_min=1.0):
+    """
+    Filtro di exogenous_oxidation_series con la tangente lungo una direzione dei parametri.
+    Clamp espliciti: ossidazione negativa e intestino vuoto azzerano la tangente, il limite del
+    contenuto intestinale la sostituisce con quella del contenuto; le parità (es. 0 == 0 a rateo
+    nullo) usano la derivata destra.
+    Ritorna (ossidazione esogena g/min, tangente g/min, gut load g).
+    """
+    n = len(intake_g)
+    exo_out = np.zeros(n)
+    gut_out = np.zeros(n)
+    d_exo_out = np.zeros(n)
+    exo = gut = d_exo = d_gut = 0.0
+    for i, (g_in, d_in) in enumerate(zip(intake_g.tolist(), d_intake_g.tolist())):
+        gap = effective_target - exo
+        d_exo += d_alpha * gap + alpha * (d_target - d_exo)
+        exo += alpha * gap
+        if exo < 0.0 or (exo == 0.0 and d_exo < 0.0):
+            exo = d_exo = 0.0
+        gut += g_in * oxidation_efficiency
+        d_gut += d_in * oxidation_efficiency + g_in * d_efficiency
+        if gut < exo * dt_min or (gut == exo * dt_min and d_gut < d_exo * dt_min):
+            exo = gut / dt_min
+            d_exo = d_gut / dt_min
+        gut -= exo * dt_min
+        d_gut -= d_exo * dt_min
+        if gut < 0 or (gut == 0 and d_gut < 0):
+            gut = d_gut = 0.0
+        exo_out[i] = exo
+        gut_out[i] = gut
+        d_exo_out[i] = d_exo
+    return exo_out, d_exo_out, gut_out
+
+
+def _crossing_time(t_prev, before, after, d_before, d_after, threshold, dt_min):
+    """Istante (interpolato) in cui la riserva scende a threshold nel passo e sua tangente."""
+    drop = before - after
+    if drop <= 0:
+        return t_prev + dt_min, 0.0
+    frac = (before - threshold) / drop
+    d_frac = (d_before * drop - (before - threshold) * (d_before - d_after)) / (drop * drop)
+    return t_prev + frac * dt_min, d_frac * dt_min
+
+
+def glycogen_tangent(t, cho_g_min, d_cho, exo_g_min, d_exo, initial_muscle, initial_liver, d_muscle0, d_liver0,
+                     dt_min=1.0, clamp_reserves=True):
+    """
+    Ricorsione di glycogen_summary con la tangente (una direzione) di riserve, minimi, totale
+    esogeno e istante di crisi (interpolato nel passo, così è derivabile). Rami di min/max scelti
+    sui valori, tangente del ramo attivo (derivata destra nelle parità); riserve azzerate ->
+    tangente nulla. d_cho None = domanda indipendente dalla direzione.
+    Con clamp_reserves=False il fegato non si ferma a zero (riserva "virtuale"): fino alla prima
+    discesa sotto una soglia positiva i valori coincidono e il margine resta derivabile oltre.
+    Ritorna (valori, tangenti) come dict di float.
+    """
+    exponent = MUSCLE_CONTRIBUTION_EXPONENT
+    liver_cap = MAX_LIVER_OUTPUT_G_MIN
+    muscle_ref, d_ref = initial_muscle, d_muscle0
+
+    muscle, liver = initial_muscle, initial_liver
+    d_m, d_l = d_muscle0, d_liver0
+    min_liver = min_muscle = math.inf
+    d_min_liver = d_min_muscle = 0.0
+    total_exo = d_total_exo = 0.0
+    bonk_time, d_bonk = None, 0.0
+    t_list = t.tolist()
+    d_cho_list = d_cho.tolist() if d_cho is not None else itertools.repeat(0.0)
+
+    for i, (cho, dc, exo, dx) in enumerate(zip(cho_g_min.tolist(), d_cho_list, exo_g_min.tolist(),
+                                               d_exo.tolist())):
+        if muscle <= 0 or muscle_ref <= 0:
+            from_muscle = d_fm = 0.0
+        else:
+            fill = muscle / muscle_ref
+            share = math.pow(fill, exponent)
+            from_muscle = cho * share
+            d_fm = dc * share + cho * exponent * share / fill * (d_m - fill * d_ref) / muscle_ref
+        blood_demand = cho - from_muscle
+        d_blood = dc - d_fm
+        if blood_demand < exo or (blood_demand == exo and d_blood < dx):
+            from_exo, d_fx = blood_demand, d_blood
+        else:
+            from_exo, d_fx = exo, dx
+        remaining = blood_demand - from_exo
+        if remaining < liver_cap:
+            from_liver, d_fl = remaining, d_blood - d_fx
+        else:
+            from_liver, d_fl = liver_cap, 0.0
+        if clamp_reserves and liver <= 0:
+            from_liver = d_fl = 0.0
+
+        if i > 0:
+            muscle_before, liver_before, d_m_before, d_l_before = muscle, liver, d_m, d_l
+            muscle -= from_muscle * dt_min
+            liver -= from_liver * dt_min
+            d_m -= d_fm * dt_min
+            d_l -= d_fl * dt_min
+            total_exo += from_exo * dt_min
+            d_total_exo += d_fx * dt_min
+
+            if bonk_time is None and (liver <= BONK_LIVER_G or muscle <= BONK_MUSCLE_G):
+                # Istante di crisi dai valori prima del clamp (pendenza del passo)
+                candidates = []
+                if liver <= BONK_LIVER_G:
+                    candidates.append(_crossing_time(t_list[i - 1], liver_before, liver, d_l_before, d_l,
+                                                     BONK_LIVER_G, dt_min))
+                if muscle <= BONK_MUSCLE_G:
+                    candidates.append(_crossing_time(t_list[i - 1], muscle_before, muscle, d_m_before, d_m,
+                                                     BONK_MUSCLE_G, dt_min))
+                bonk_time, d_bonk = min(candidates)
+
+            if muscle < 0:
+                muscle = d_m = 0.0
+            if clamp_reserves and liver < 0:
+                liver = d_l = 0.0
+        elif bonk_time is None and (liver <= BONK_LIVER_G or muscle <= BONK_MUSCLE_G):
+            bonk_time = t_list[0]
+
+        if liver < min_liver:
+            min_liver, d_min_liver = liver, d_l
+        if muscle < min_muscle:
+            min_muscle, d_min_muscle = muscle, d_m
+
+    values = {
+        "final_muscle_g": muscle,
+        "final_liver_g": liver,
+        "final_glycogen": muscle + liver,
+        "min_liver_g": min_liver,
+        "min_muscle_g": min_muscle,
+        "total_exo_used": total_exo,
+        "bonk_time_min": bonk_time,
+    }
+    tangents = {
+        "final_muscle_g": d_m,
+        "final_liver_g": d_l,
+        "final_glycogen": d_m + d_l,
+        "min_liver_g": d_min_liver,
+        "min_muscle_g": d_min_muscle,
+        "total_exo_used": d_total_exo,
+        "bonk_time_min": d_bonk if bonk_time is not None else None,
+    }
+    return values, tangents
+
+
+# --- 3. SIMULAZIONE CON GRADIENTI ---
+
+def simulate_metabolism_gradients(subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g,
+                                  crossover_pct, tau_absorption, subject_obj, activity_params,
+                                  oxidation_efficiency_input=0.80, custom_max_exo_rate=None,
+                                  mix_type_input=ChoMixType.GLUCOSE_ONLY, intensity_series=None,
+                                  metabolic_curve=None, intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0,
+                                  variability_index=1.0, time_step_s=60, parameters=GRADIENT_PARAMETERS,
+                                  clamp_reserves=True, series=None):
+    """
+    Simulazione (modello intestinale a serbatoio) che porta in avanti le derivate di riserve
+    finali, minimi, esogeni totali e istante di crisi rispetto ai parametri scelti (sottoinsieme di
+    GRADIENT_PARAMETERS): una passata per parametro, ciascuna circa il costo di una simulazione
+    summary_only. series riusa le serie di prepare_demand_series allo stesso passo.
+    Ritorna {"values": {...}, "gradients": {uscita: {parametro: derivata}}, "parameters": (...)}.
+    """
+    parameters = tuple(parameters)
+    unknown = [name for name in parameters if name not in GRADIENT_PARAMETERS]
+    if unknown:
+        raise ValueError(f"Parametri non derivabili: {unknown} ({' | '.join(GRADIENT_PARAMETERS)})")
+    if series is None:
+        series = prepare_demand_series(duration_min, crossover_pct, subject_obj, activity_params, intensity_series,
+                                       metabolic_curve, variability_index, step_s=time_step_s)
+    t, dt_min, step_s = series['t'], series['dt_min'], series['step_s']
+    n = len(t)
+
+    plan = IntakePlan.from_strategy(constant_carb_intake_g_h, cho_per_unit_g, intake_mode, duration_min,
+                                    intake_cutoff_min)
+    intake_g = plan.grams_per_step(t, step_s)
+    max_exo = plan_max_exo_rate(custom_max_exo_rate, subject_obj, series['activity'], mix_type_input, plan)
+    eff = oxidation_efficiency_input
+    # Target esogeno: min(rateo/60, max) x efficienza (rami espliciti)
+    rate_share = constant_carb_intake_g_h / 60.0
+    capped = rate_share >= max_exo and constant_carb_intake_g_h > 0
+    target = 0.0 if constant_carb_intake_g_h == 0 else min(rate_share, max_exo) * eff
+    decay = math.exp(-dt_min / tau_absorption)
+    alpha = 1 - decay
+
+    def direction(name):
+        """Semi della direzione: (d intake, d target, d alpha, d efficienza, d CHO, d muscolo0, d fegato0)."""
+        seed = dict(d_intake=np.zeros(n), d_target=0.0, d_alpha=0.0, d_eff=0.0, d_cho=None, d_m0=0.0, d_l0=0.0)
+        if name == "intake_g_h":
+            seed['d_target'] = 0.0 if capped else eff / 60.0
+            seed['d_intake'] = _intake_plan_tangent(t, step_s, constant_carb_intake_g_h, cho_per_unit_g,
+                                                    intake_mode, duration_min, intake_cutoff_min, dt_min)
+        elif name == "tau_absorption":
+            seed['d_alpha'] = -decay * dt_min / tau_absorption ** 2
+        elif name == "oxidation_efficiency":
+            seed['d_eff'] = 1.0
+            seed['d_target'] = min(rate_share, max_exo) if constant_carb_intake_g_h > 0 else 0.0
+        elif name == "crossover_pct":
+            seed['d_cho'] = _crossover_tangent(duration_min, crossover_pct, subject_obj, activity_params,
+                                               intensity_series, metabolic_curve, variability_index, step_s)
+        elif name == "initial_muscle_g":
+            seed['d_m0'] = 1.0
+        elif name == "initial_liver_g":
+            seed['d_l0'] = 1.0
+        return seed
+
+    values = None
+    gradients = {key: {} for key in GRADIENT_OUTPUTS}
+    for name in parameters or (None,):
+        seed = direction(name)
+        exo_g_min, d_exo, _ = exogenous_oxidation_tangent(
+            intake_g, seed['d_intake'], target, seed['d_target'], alpha, seed['d_alpha'], eff, seed['d_eff'],
+            dt_min=dt_min
+        )
+        values, tangents = glycogen_tangent(
+            t, series['cho_g_min'], seed['d_cho'], exo_g_min, d_exo,
+            subject_data['muscle_glycogen_g'], subject_data['liver_glycogen_g'], seed['d_m0'], seed['d_l0'],
+            dt_min=dt_min, clamp_reserves=clamp_reserves
+        )
+        if name is not None:
+            for key in GRADIENT_OUTPUTS:
+                gradients[key][name] = tangents[key]
+    if values['bonk_time_min'] is None:
+        gradients['bonk_time_min'] = None
+    return {"values": values, "gradients": gradients, "parameters": parameters}
@@ -0,0 +1,116 @@
+import functools
+
+import numpy as np
+
+from data_models import ChoMixType
+
+GUT_MODEL_BUCKET = "bucket"              # serbatoio unico + filtro del primo ordine (modello storico)
+GUT_MODEL_COMPARTMENTS = "compartments"  # stomaco -> intestino (SGLT1 / GLUT5) -> pool ematico
+GUT_MODELS = (GUT_MODEL_BUCKET, GUT_MODEL_COMPARTMENTS)
+
+# Quota di glucosio della miscela (assorbita via SGLT1); il resto è fruttosio (via GLUT5)
+GLUCOSE_FRACTION = {
+    ChoMixType.GLUCOSE_ONLY: 1.0,
+    ChoMixType.MIX_2_1: 2.0 / 3.0,
+    ChoMixType.MIX_1_08: 1.0 / 1.8,
+}
+
+# Tempi medi di permanenza dei compartimenti come frazione di tau_absorption
+GASTRIC_SHARE = 0.5
+SGLT1_SHARE = 0.25
+GLUT5_SHARE = 0.5        # fruttosio: trasporto più lento e conversione epatica prima dell'ossidazione
+OXIDATION_SHARE = 0.25
+
+# Indici dello stato
+STOMACH, SGLT1, GLUT5, BLOOD = range(4)
+
+
+# --- 1. SISTEMA LINEARE ---
+
+def glucose_fraction(mix_type):
+    return GLUCOSE_FRACTION.get(mix_type, 1.0)
+
+
+def rate_matrix(tau_absorption, glucose_share):
+    """
+    Matrice A di dx/dt = A x con x = (stomaco, intestino SGLT1, intestino GLUT5, pool ematico), in g.
+    Svuotamento gastrico ripartito fra le due vie secondo la miscela; l'unica uscita del sistema
+    è l'ossidazione dal pool ematico.
+    """
+    k_gastric = 1.0 / (GASTRIC_SHARE * tau_absorption)
+    k_sglt1 = 1.0 / (SGLT1_SHARE * tau_absorption)
+    k_glut5 = 1.0 / (GLUT5_SHARE * tau_absorption)
+    k_ox = 1.0 / (OXIDATION_SHARE * tau_absorption)
+    a = np.zeros((4, 4))
+    a[STOMACH, STOMACH] = -k_gastric
+    a[SGLT1, STOMACH] = glucose_share * k_gastric
+    a[SGLT1, SGLT1] = -k_sglt1
+    a[GLUT5, STOMACH] = (1.0 - glucose_share) * k_gastric
+    a[GLUT5, GLUT5] = -k_glut5
+    a[BLOOD, SGLT1] = k_sglt1
+    a[BLOOD, GLUT5] = k_glut5
+    a[BLOOD, BLOOD] = -k_ox
+    return a
+
+
+def expm(matrix):
+    """Esponenziale di matrice (scaling and squaring con serie di Taylor): matrici piccole, solo NumPy."""
+    m = np.asarray(matrix, dtype=float)
+    norm = np.abs(m).sum(axis=0).max()
+    squarings = max(0, int(np.ceil(np.log2(norm))) + 1) if norm > 0 else 0
+    scaled = m / (2.0 ** squarings)
+    result = np.eye(len(m))
+    term = np.eye(len(m))
+    for k in range(1, 20):
+        term = term @ scaled / k
+        result = result + term
+    for _ in range(squarings):
+        result = result @ result
+    return result
+
+
+@functools.lru_cache(maxsize=256)
+def transition_matrix(tau_absorption, glucose_share, dt_min):
+    """Phi = exp(A dt): avanza lo stato di un passo in modo esatto, per qualunque dt."""
+    return expm(rate_matrix(tau_absorption, glucose_share) * dt_min)
+
+
+# --- 2. SERIE DI OSSIDAZIONE ESOGENA ---
+
+def compartment_oxidation_series(intake_g, max_oxidation_g_min, tau_absorption, glucose_share, oxidation_efficiency,
+                                 dt_min=1.0, initial_state=None):
+    """
+    Ogni passo: l'ingerito (x efficienza) entra nello stomaco, poi x <- Phi x. L'ossidato nel passo è
+    la massa uscita dal sistema (bilancio di massa), limitata a max_oxidation_g_min: l'eccesso torna
+    nell'intestino (trasportatori saturi) e alza il Gut Load.
+    Ritorna (ossidazione esogena g/min, gut load g = stomaco + intestino, stato finale).
+    """
+    n = len(intake_g)
+    exo_out = np.zeros(n)
+    gut_out = np.zeros(n)
+    phi = transition_matrix(float(tau_absorption), float(glucose_share), float(dt_min)).tolist()
+    p_s = phi[STOMACH][STOMACH]
+    p_gs, p_gg = phi[SGLT1][STOMACH], phi[SGLT1][SGLT1]
+    p_fs, p_ff = phi[GLUT5][STOMACH], phi[GLUT5][GLUT5]
+    p_bs, p_bg, p_bf, p_bb = phi[BLOOD][STOMACH], phi[BLOOD][SGLT1], phi[BLOOD][GLUT5], phi[BLOOD][BLOOD]
+    cap = max_oxidation_g_min * dt_min
+
+    s, g, f, b = initial_state if initial_state is not None else (0.0, 0.0, 0.0, 0.0)
+    for i, g_in in enumerate(intake_g.tolist()):
+        s += g_in * oxidation_efficiency
+        total = s + g + f + b
+        s, g, f, b = (
+            p_s * s,
+            p_gs * s + p_gg * g,
+            p_fs * s + p_ff * f,
+            p_bs * s + p_bg * g + p_bf * f + p_bb * b,
+        )
+        oxidized = max(total - (s + g + f + b), 0.0)
+        if oxidized > cap:
+            excess = oxidized - cap
+            g += excess * glucose_share
+            f += excess * (1.0 - glucose_share)
+            oxidized = cap
+        exo_out[i] = oxidized / dt_min
+        gut_out[i] = s + g + f
+    return exo_out, gut_out, (s, g, f, b)
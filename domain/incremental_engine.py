@@ -0,0 +1,276 @@
+import datetime
+import hashlib
+from dataclasses import fields, is_dataclass
+from enum import Enum
+
+import numpy as np
+import pandas as pd
+
+from data_models import ChoMixType, IntakeMode, IntensitySeries
+from domain.metabolic_curve import MetabolicCurve
+from domain.vectorized_engine import (
+    _sequential_total, build_result_frame, exogenous_oxidation_series, exogenous_target, glycogen_recurrence,
+    intake_series, is_constant_intensity, prepare_demand_series, resolve_max_exo_rate, summary_stats
+)
+
+# Stato salvato prima di ogni passo di checkpoint (una riga per checkpoint)
+CHECKPOINT_FIELDS = (
+    "exo_oxidation", "gut_load", "muscle", "liver",
+    "intake_cum", "exo_oxidation_cum", "muscle_used", "liver_used", "exo_used",
+)
+DEFAULT_CHECKPOINT_STRIDE = 10
+
+
+# --- 1. IMPRONTA DEL CONTESTO ---
+
+_SCALAR_TYPES = (str, int, float, bool, type(None), Enum, np.generic, datetime.date, datetime.time,
+                 datetime.timedelta)
+
+
+def _feed(parts, obj):
+    """
+    Serializza obj in parts (lista di bytes); scalari ed enum per primi, sono i più frequenti.
+    Array e oggetti pandas per valore (mai con repr, che pandas abbrevia); tipi non riconosciuti ->
+    TypeError, perché un'impronta parziale farebbe coincidere scenari diversi.
+    """
+    if isinstance(obj, _SCALAR_TYPES):
+        parts.append(repr(obj).encode())
+        parts.append(b"|")
+    elif isinstance(obj, IntensitySeries):
+        _feed(parts, (obj.values, obj.sample_rate_hz, obj.unit, obj.aggregation))
+    elif isinstance(obj, MetabolicCurve):
+        _feed(parts, (obj.intensity, obj.cho_gh, obj.fat_gh, obj.cho_tail_slope, obj.fat_tail_slope))
+    elif isinstance(obj, np.ndarray):
+        parts.append(str(obj.dtype).encode())
+        parts.append(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, pd.DataFrame):
+        _feed(parts, (list(obj.columns), pd.util.hash_pandas_object(obj, index=True).to_numpy()))
+    elif isinstance(obj, pd.Series):
+        _feed(parts, ("Series", obj.name, str(obj.dtype), pd.util.hash_pandas_object(obj, index=True).to_numpy()))
+    elif isinstance(obj, pd.Index):
+        _feed(parts, ("Index", obj.name, str(obj.dtype), pd.util.hash_pandas_object(obj).to_numpy()))
+    elif isinstance(obj, dict):
+        items = sorted(obj.items(), key=lambda kv: str(kv[0]))
+        if all(isinstance(v, _SCALAR_TYPES) for _, v in items):
+            # Dict di soli scalari (parametri, serbatoio): una sola repr, numpy float come float
+            parts.append(repr([(k, float(v) if isinstance(v, np.floating) else v) for k, v in items]).encode())
+            return
+        parts.append(b"{")
+        for key, value in items:
+            _feed(parts, key)
+            _feed(parts, value)
+        parts.append(b"}")
+    elif isinstance(obj, (list, tuple)):
+        parts.append(b"[")
+        for item in obj:
+            _feed(parts, item)
+        parts.append(b"]")
+    elif is_dataclass(obj):
+        parts.append(type(obj).__name__.encode())
+        _feed(parts, vars(obj) if hasattr(obj, "__dict__") else {f.name: getattr(obj, f.name) for f in fields(obj)})
+    else:
+        raise TypeError(f"Tipo non supportato nell'impronta dello scenario: {type(obj).__name__}")
+
+
+def context_fingerprint(*parts):
+    """Impronta stabile (sha1) di parametri, serie e curve: due contesti uguali danno la stessa stringa."""
+    chunks = []
+    for part in parts:
+        _feed(chunks, part)
+    return hashlib.sha1(b"".join(chunks)).hexdigest()
+
+
+# --- 2. SIMULATORE INCREMENTALE ---
+
+class IncrementalSimulator:
+    """
+    Simulazione ripresa da checkpoint per cambi di strategia di intake.
+    Domanda e substrati (indipendenti dall'intake) sono preparati una volta; ogni run confronta
+    i nuovi input con quelli del run precedente sulla stessa corsia (lane) e riparte dall'ultimo
+    checkpoint prima del primo passo divergente, riusando il prefisso. Corsie diverse (es. strategia
+    e riferimento a digiuno) condividono le serie ma hanno storie separate.
+    Risultati identici a simulate_metabolism.
+    A intensità costante la domanda dipende solo da t: set_duration cambia la durata mantenendo
+    le storie delle corsie, e un run riparte dall'ultimo checkpoint comune.
+    """
+
+    def __init__(self, subject_data, duration_min, crossover_pct, subject_obj, activity_params,
+                 intensity_series=None, metabolic_curve=None, variability_index=1.0,
+                 checkpoint_stride=DEFAULT_CHECKPOINT_STRIDE):
+        if checkpoint_stride < 1:
+            raise ValueError("checkpoint_stride deve essere >= 1")
+        self.subject_data = subject_data
+        self.duration_min = duration_min
+        self.subject_obj = subject_obj
+        self.checkpoint_stride = int(checkpoint_stride)
+        self.constant_intensity = is_constant_intensity(intensity_series, metabolic_curve)
+        self._demand_args = (crossover_pct, subject_obj, activity_params, intensity_series, metabolic_curve,
+                             variability_index)
+        self.fingerprint = self._fingerprint(
+            subject_data, duration_min, crossover_pct, subject_obj, activity_params,
+            intensity_series, metabolic_curve, variability_index
+        )
+        self.series = prepare_demand_series(duration_min, *self._demand_args)
+        self._lanes = {}
+        self.last_resume_minute = None
+        self.steps_recomputed = 0
+
+    @staticmethod
+    def _fingerprint(subject_data, duration_min, crossover_pct, subject_obj, activity_params,
+                     intensity_series=None, metabolic_curve=None, variability_index=1.0):
+        if is_constant_intensity(intensity_series, metabolic_curve):
+            # La durata non cambia la domanda dei minuti già simulati (vedi set_duration)
+            duration_min = None
+        return context_fingerprint(
+            subject_data, duration_min, crossover_pct, subject_obj, activity_params,
+            intensity_series, metabolic_curve, variability_index
+        )
+
+    def matches(self, *context):
+        """
+        True se il contesto (stessi argomenti del costruttore, senza stride) è quello del simulatore.
+        A intensità costante la durata non conta: basta set_duration.
+        """
+        return self._fingerprint(*context) == self.fingerprint
+
+    def set_duration(self, duration_min):
+        """Nuova durata a intensità costante: serie ricalcolate (forma chiusa), storie delle corsie conservate."""
+        if duration_min == self.duration_min:
+            return
+        if not self.constant_intensity:
+            raise ValueError("set_duration richiede intensità costante (senza serie né curva)")
+        self.duration_min = duration_min
+        self.series = prepare_demand_series(duration_min, *self._demand_args)
+
+    @property
+    def n_steps(self):
+        return len(self.series['t'])
+
+    def _first_divergence(self, last, absorption_key, intake_g, effective_target):
+        n = len(intake_g)
+        if last is None or last['absorption_key'] != absorption_key:
+            return 0
+        common = min(n, len(last['intake_g']))
+        changed = np.flatnonzero(last['intake_g'][:common] != intake_g[:common])
+        first = int(changed[0]) if changed.size else common
+        if len(last['intake_g']) != n:
+            # Durata cambiata: si riparte al più tardi dall'ultimo passo della nuova durata
+            first = min(first, n - 1)
+        if effective_target != last['effective_target']:
+            # Il target conta solo da quando c'è contenuto intestinale (primo intake)
+            fed = np.flatnonzero(intake_g[:first] > 0)
+            if fed.size:
+                first = int(fed[0])
+        return first
+
+    def _checkpoints(self, arrays, from_index, previous=None):
+        """Righe di checkpoint (stato prima del passo j, j multiplo dello stride) da from_index in poi."""
+        n = len(arrays['muscle'])
+        idx = np.arange(0, n, self.checkpoint_stride)
+        rows = np.zeros((len(idx), len(CHECKPOINT_FIELDS)))
+        keep = 0
+        if previous is not None:
+            keep = int(np.searchsorted(idx, from_index, side='right'))
+            rows[:keep] = previous[:keep]
+        initial = np.array([0.0, 0.0, self.subject_data['muscle_glycogen_g'], self.subject_data['liver_glycogen_g'],
+                            0.0, 0.0, 0.0, 0.0, 0.0])
+        rows[0] = initial
+        todo = idx[max(keep, 1):]
+        if len(todo):
+            prev = todo - 1
+            # Cumulati con la stessa somma sequenziale di summary_stats / build_result_frame
+            used = {name: np.cumsum(np.concatenate([[0.0], arrays[name][1:]])) for name in
+                    ('muscle_use', 'liver_use', 'exo_use')}
+            rows[max(keep, 1):] = np.column_stack([
+                arrays['exo_g_min'][prev], arrays['gut_load'][prev], arrays['muscle'][prev], arrays['liver'][prev],
+                np.cumsum(arrays['intake_g'])[prev], np.cumsum(arrays['exo_g_min'])[prev],
+                used['muscle_use'][prev], used['liver_use'][prev], used['exo_use'][prev],
+            ])
+        return idx, rows
+
+    def run(self, constant_carb_intake_g_h, cho_per_unit_g, tau_absorption, oxidation_efficiency_input=0.80,
+            custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY, intake_mode=IntakeMode.DISCRETE,
+            intake_cutoff_min=0, lane="default"):
+        """Stesso output (df, stats) di simulate_metabolism per la strategia indicata."""
+        series = self.series
+        max_exo_rate_g_min = resolve_max_exo_rate(custom_max_exo_rate, self.subject_obj, series['activity'],
+                                                  mix_type_input)
+        effective_target = exogenous_target(constant_carb_intake_g_h, max_exo_rate_g_min, oxidation_efficiency_input)
+        alpha = 1 - np.exp(-1.0 / tau_absorption)
+        is_input_zero = constant_carb_intake_g_h == 0
+        intake_g = intake_series(series['t'], self.duration_min, constant_carb_intake_g_h, cho_per_unit_g,
+                                 intake_mode, intake_cutoff_min)
+        absorption_key = (alpha, oxidation_efficiency_input, is_input_zero)
+
+        n = len(intake_g)
+        previous = self._lanes.get(lane)
+        divergence = self._first_divergence(previous, absorption_key, intake_g, effective_target)
+        if divergence >= n and previous is not None:
+            arrays = previous['arrays']
+            start = n
+            cached = previous.get('result')
+            if cached is not None and cached[0] == constant_carb_intake_g_h:
+                # Stesso scenario del run precedente: nessun ricalcolo né ricostruzione della tabella
+                self.last_resume_minute = start
+                self.steps_recomputed = 0
+                return cached[1].copy(deep=False), dict(cached[2])
+        else:
+            if previous is None or divergence == 0:
+                cp_row, start = 0, 0
+            else:
+                cp_row = int(np.searchsorted(previous['checkpoint_index'], divergence, side='right')) - 1
+                start = int(previous['checkpoint_index'][cp_row])
+            cp = dict(zip(CHECKPOINT_FIELDS, previous['checkpoints'][cp_row])) if start > 0 else None
+            arrays = self._resume(previous, cp, start, intake_g, effective_target, alpha,
+                                  oxidation_efficiency_input, is_input_zero)
+            checkpoint_index, checkpoints = self._checkpoints(
+                arrays, start, previous['checkpoints'] if previous is not None and start > 0 else None
+            )
+            self._lanes[lane] = {
+                "absorption_key": absorption_key,
+                "effective_target": effective_target,
+                "intake_g": intake_g,
+                "arrays": arrays,
+                "checkpoint_index": checkpoint_index,
+                "checkpoints": checkpoints,
+            }
+        self.last_resume_minute = start
+        self.steps_recomputed = n - start
+
+        state = {k: arrays[k] for k in ('muscle_use', 'liver_use', 'exo_use', 'muscle', 'liver')}
+        df = build_result_frame(
+            series['t'], state, series['fat_g_min'], arrays['gut_load'], intake_g, arrays['exo_g_min'],
+            series['cho_ratio'], series['if_moment'], constant_carb_intake_g_h
+        )
+        totals = {
+            "muscle": _sequential_total(arrays['muscle_use'][1:]),
+            "liver": _sequential_total(arrays['liver_use'][1:]),
+            "exo": _sequential_total(arrays['exo_use'][1:]),
+        }
+        stats = summary_stats(series, self.duration_min, arrays['muscle'][-1], arrays['liver'][-1], totals)
+        self._lanes[lane]['result'] = (constant_carb_intake_g_h, df, stats)
+        return df.copy(deep=False), dict(stats)
+
+    def _resume(self, previous, cp, start, intake_g, effective_target, alpha, oxidation_efficiency, is_input_zero):
+        """Ricalcola i passi da start in poi partendo dal checkpoint cp (None = inizio gara)."""
+        series = self.series
+        initial_muscle = self.subject_data['muscle_glycogen_g']
+        if cp is None:
+            cp = {"exo_oxidation": 0.0, "gut_load": 0.0, "muscle": initial_muscle,
+                  "liver": self.subject_data['liver_glycogen_g']}
+        exo_tail, gut_tail = exogenous_oxidation_series(
+            intake_g[start:], effective_target, alpha, oxidation_efficiency, is_input_zero,
+            initial_exo=cp['exo_oxidation'], initial_gut=cp['gut_load']
+        )
+        tail = glycogen_recurrence(
+            series['cho_g_min'][start:], exo_tail, cp['muscle'], cp['liver'],
+            start_index=start, reference_muscle=initial_muscle
+        )
+        tail['exo_g_min'] = exo_tail
+        tail['gut_load'] = gut_tail
+        tail['intake_g'] = intake_g[start:]
+
+        if start == 0:
+            return {k: v for k, v in tail.items() if k != 'stop_reason'}
+        prefix = previous['arrays']
+        return {k: np.concatenate([prefix[k][:start], tail[k]]) for k in prefix}
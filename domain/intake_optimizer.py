@@ -0,0 +1,193 @@
+import numpy as np
+
+from data_models import ChoMixType, IntakePlan
+from domain.strategy_solver import MIN_LIVER_SAFE, MIN_MUSCLE_SAFE
+from domain.vectorized_engine import (
+    exogenous_target, prepare_demand_series, race_summary_batch, resolve_max_exo_rate
+)
+
+DEFAULT_GUT_TOLERANCE_G = 30.0
+DEFAULT_MIN_SPACING_MIN = 5
+
+
+# --- 1. PIANO A UNITÀ DISCRETE ---
+
+def schedule_intake(n_steps, minutes, unit_g):
+    """Grammi ingeriti per minuto per un elenco di minuti di assunzione (più unità nello stesso minuto sommate)."""
+    minutes = np.asarray(minutes, dtype=int)
+    return np.bincount(minutes, minlength=n_steps)[:n_steps] * float(unit_g)
+
+
+def schedule_rate_g_h(n_units, unit_g, feeding_window_min):
+    """Rateo medio equivalente (g/h) del piano sulla finestra di alimentazione."""
+    if n_units == 0:
+        return 0.0
+    return n_units * unit_g / (max(feeding_window_min, 1) / 60.0)
+
+
+def _candidate_matrix(n_steps, base_minutes, extra_minutes, unit_g):
+    """Intake (tempo, candidati): piano base più un'unità in ciascuno dei minuti extra."""
+    base = schedule_intake(n_steps, base_minutes, unit_g)
+    intake = np.repeat(base[:, None], len(extra_minutes), axis=1)
+    intake[extra_minutes, np.arange(len(extra_minutes))] += unit_g
+    return intake
+
+
+def _removal_matrix(n_steps, minutes, unit_g):
+    """Intake (tempo, candidati): il piano senza l'unità k-esima, per ogni k."""
+    base = schedule_intake(n_steps, minutes, unit_g)
+    intake = np.repeat(base[:, None], len(minutes), axis=1)
+    intake[np.asarray(minutes, dtype=int), np.arange(len(minutes))] -= unit_g
+    return intake
+
+
+# --- 2. OTTIMIZZATORE GREEDY + RIPARAZIONE ---
+
+def optimize_intake_schedule(tank, duration, subj, params, cho_per_unit_g, crossover_pct=75, tau_absorption=20,
+                             curve_data=None, mix_type=ChoMixType.GLUCOSE_ONLY, oxidation_efficiency=0.80,
+                             custom_max_exo_rate=None, intake_cutoff_min=0, variability_index=1.0,
+                             intensity_series=None, gut_tolerance_g=DEFAULT_GUT_TOLERANCE_G,
+                             min_spacing_min=DEFAULT_MIN_SPACING_MIN, max_units=None):
+    """
+    Sceglie i minuti delle singole unità (gel/barrette) con il minor numero di unità che mantiene
+    fegato e muscolo sopra i limiti di sicurezza e il picco di Gut Load entro gut_tolerance_g.
+
+    Il muscolo non dipende dai CHO esogeni: se scende sotto la soglia anche senza assunzioni nessun
+    piano è fattibile (esito "muscle"). Greedy: finché il fegato scende sotto la soglia, aggiunge
+    l'unità (fra i minuti liberi prima della violazione, a distanza >= min_spacing_min dalle altre)
+    che sposta più avanti la prima violazione senza superare la tolleranza GI; si ferma con esito
+    "liver" quando nessuna unità sposta più avanti la violazione (o quando neppure il piano più
+    carico la eviterebbe) e con esito "gut" solo quando è la tolleranza a bloccare un piano
+    fattibile. Riparazione: toglie le unità non necessarie.
+    Un piano a unità non ha un rateo fisso: l'ossidazione esogena tende alla capacità massima
+    (max_exo * efficienza), limitata come sempre dal contenuto intestinale.
+    Ogni round valuta tutti i candidati insieme con race_summary_batch.
+    Ritorna un dict con minuti scelti, esito, vincolo limitante e numero di simulazioni; "plan" è
+    l'IntakePlan equivalente, da passare a simulate_metabolism per la tabella minuto per minuto.
+    """
+    series = prepare_demand_series(
+        duration, crossover_pct, subj, params, intensity_series, curve_data, variability_index
+    )
+    cho = series['cho_g_min']
+    n_steps = len(cho)
+    last_minute = min(int(duration - intake_cutoff_min), n_steps - 1)
+    feeding_window = max(last_minute, 0)
+    max_exo = resolve_max_exo_rate(custom_max_exo_rate, subj, series['activity'], mix_type)
+    alpha = 1 - np.exp(-1.0 / tau_absorption)
+    floors = (MIN_LIVER_SAFE, MIN_MUSCLE_SAFE)
+    if max_units is None:
+        max_units = max(last_minute // max(min_spacing_min, 1) + 1, 0)
+    simulations = 0
+
+    target = exogenous_target(max_exo * 60.0, max_exo, oxidation_efficiency)
+
+    def evaluate(intake_matrix):
+        nonlocal simulations
+        simulations += intake_matrix.shape[1]
+        return race_summary_batch(
+            cho, intake_matrix, np.full(intake_matrix.shape[1], target), alpha, oxidation_efficiency,
+            tank['muscle_glycogen_g'], tank['liver_glycogen_g'], floors=floors
+        )
+
+    def reach_minutes(summary):
+        # Primo minuto critico per candidato (nessuna violazione = fine gara)
+        reach = np.where(summary['floor_liver_minute'] >= 0, summary['floor_liver_minute'], n_steps)
+        return np.where(summary['floor_muscle_minute'] >= 0,
+                        np.minimum(reach, summary['floor_muscle_minute']), reach)
+
+    def first_violation(summary, k=0):
+        liver_min = int(summary['floor_liver_minute'][k])
+        muscle_min = int(summary['floor_muscle_minute'][k])
+        crossings = {name: m for name, m in (("liver", liver_min), ("muscle", muscle_min)) if m >= 0}
+        if not crossings:
+            return None, None
+        binding = min(crossings, key=crossings.get)
+        return binding, crossings[binding]
+
+    minutes = []
+    current = evaluate(schedule_intake(n_steps, minutes, cho_per_unit_g)[:, None])
+    # Il glicogeno muscolare non dipende dai CHO esogeni: nessun piano può evitarlo
+    status = "muscle" if current['floor_muscle_minute'][0] >= 0 else "ok"
+
+    # Fase greedy: copre la prima violazione epatica spingendola il più avanti possibile
+    while status == "ok":
+        binding, violation = first_violation(current)
+        if binding is None:
+            break
+        if len(minutes) >= max_units or cho_per_unit_g <= 0:
+            status = "liver"
+            break
+        taken = np.asarray(minutes, dtype=int)
+        free = np.arange(0, min(violation, last_minute) + 1)
+        if taken.size:
+            free = free[np.min(np.abs(free[:, None] - taken[None, :]), axis=1) >= min_spacing_min]
+        if free.size == 0:
+            status = "liver"
+            break
+        trial = evaluate(_candidate_matrix(n_steps, minutes, free, cho_per_unit_g))
+        reach = reach_minutes(trial)
+        useful = reach > violation
+        if not useful.any():
+            # Il fegato resta il vincolo anche ignorando la tolleranza GI
+            status = "liver"
+            break
+        allowed = useful & (trial['max_gut_g'] <= gut_tolerance_g)
+        if not allowed.any():
+            # Colpa della tolleranza GI solo se il piano più carico possibile (un'unità ogni
+            # min_spacing_min, intestino mai vuoto) tiene il fegato sopra la soglia
+            saturated = evaluate(schedule_intake(
+                n_steps, np.arange(0, last_minute + 1, max(min_spacing_min, 1)), cho_per_unit_g
+            )[:, None])
+            status = "liver" if saturated['floor_liver_minute'][0] >= 0 else "gut"
+            break
+        score = np.lexsort((free, trial['min_liver_g'], reach))
+        best = [k for k in score[::-1] if allowed[k]][0]
+        minutes = sorted(minutes + [int(free[best])])
+        current = {key: value[best:best + 1] for key, value in trial.items()}
+
+    # Riparazione: toglie le unità superflue (la rimozione che lascia più margine per prima)
+    while status == "ok" and minutes:
+        trial = evaluate(_removal_matrix(n_steps, minutes, cho_per_unit_g))
+        feasible = ((trial['floor_liver_minute'] < 0) & (trial['floor_muscle_minute'] < 0)
+                    & (trial['max_gut_g'] <= gut_tolerance_g))
+        if not feasible.any():
+            break
+        best = int(np.argmax(np.where(feasible, trial['min_liver_g'], -np.inf)))
+        minutes = minutes[:best] + minutes[best + 1:]
+        current = {key: value[best:best + 1] for key, value in trial.items()}
+
+    if status == "muscle":
+        binding, violation = "muscle", int(current['floor_muscle_minute'][0])
+    else:
+        binding, violation = first_violation(current)
+    rate = schedule_rate_g_h(len(minutes), cho_per_unit_g, feeding_window)
+    return {
+        "feasible": status == "ok",
+        "status": status,
+        "minutes": minutes,
+        "n_units": len(minutes),
+        "unit_g": cho_per_unit_g,
+        "total_g": len(minutes) * cho_per_unit_g,
+        "equivalent_g_h": rate,
+        "plan": IntakePlan.from_schedule(minutes, cho_per_unit_g, target_g_h=max_exo * 60.0),
+        "oxidation_target_g_min": target,
+        "min_liver_g": float(current['min_liver_g'][0]),
+        "min_muscle_g": float(current['min_muscle_g'][0]),
+        "max_gut_g": float(current['max_gut_g'][0]),
+        "binding_constraint": binding,
+        "binding_minute": violation,
+        "simulations": simulations,
+    }
+
+
+def schedule_table(result):
+    """Righe della Cronotabella per un piano ottimizzato."""
+    rows = []
+    unit_g = result['unit_g']
+    for k, minute in enumerate(result['minutes'], start=1):
+        rows.append({
+            "Minuto": minute,
+            "Azione": f"Assumere 1 unità ({unit_g}g CHO)",
+            "Totale Ingerito": f"{k * unit_g}g",
+        })
+    return rows
@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Estrapolazione oltre l'ultima zona del profilo a 3 punti (z2/z3/z4): g/h per unità di intensità
+ZONE_CHO_TAIL_SLOPE = 4.0
+ZONE_FAT_TAIL_SLOPE = 0.5
+
+
+def _frozen_array(values):
+    arr = np.ascontiguousarray(values, dtype=np.float64)
+    arr.setflags(write=False)
+    return arr
+
+
+@dataclass(frozen=True, eq=False)
+class MetabolicCurve:
+    """
+    Curva metabolica compilata: nodi di intensità ordinati con CHO e FAT (g/h) in array float64
+    contigui. Fra i nodi interpola linearmente; sotto il primo nodo tiene il valore di bordo.
+    Sopra l'ultimo nodo tiene il valore di bordo (curva da laboratorio) oppure prosegue con le
+    pendenze di coda (profilo a zone, FAT limitato a zero).
+    """
+    intensity: np.ndarray
+    cho_gh: np.ndarray
+    fat_gh: np.ndarray
+    metric: str = ""
+    cho_tail_slope: float = 0.0
+    fat_tail_slope: float = 0.0
+
+    def __post_init__(self):
+        for name in ("intensity", "cho_gh", "fat_gh"):
+            object.__setattr__(self, name, _frozen_array(getattr(self, name)))
+        if not (len(self.intensity) == len(self.cho_gh) == len(self.fat_gh)):
+            raise ValueError("Intensità, CHO e FAT devono avere la stessa lunghezza")
+        if len(self.intensity) == 0:
+            raise ValueError("Curva metabolica vuota")
+
+    def __len__(self):
+        return len(self.intensity)
+
+    @property
+    def has_tail(self):
+        return self.cho_tail_slope != 0.0 or self.fat_tail_slope != 0.0
+
+    @classmethod
+    def from_frame(cls, df, x_col="Intensity", cho_col="CHO", fat_col="FAT", metric=""):
+        """Compila un DataFrame (es. output di parse_metabolic_report): righe non valide scartate, nodi ordinati."""
+        x, cho, fat = (pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+                       for col in (x_col, cho_col, fat_col))
+        valid = ~(np.isnan(x) | np.isnan(cho) | np.isnan(fat))
+        x, cho, fat = x[valid], cho[valid], fat[valid]
+        order = np.argsort(x, kind="stable")
+        return cls(x[order], cho[order], fat[order], metric=metric)
+
+    @classmethod
+    def from_report(cls, report_df, metric):
+        """Curva sulla metrica scelta (Watt/HR/Speed) a partire dal report del metabolimetro."""
+        curve_df = report_df[report_df[metric] > 0]
+        return cls.from_frame(curve_df, x_col=metric, metric=metric)
+
+    @classmethod
+    def from_zones(cls, zones, metric="HR"):
+        """Profilo a tre punti {'z2','z3','z4': {'hr','cho','fat'}} con estrapolazione lineare oltre z4."""
+        points = [zones[z] for z in ("z2", "z3", "z4")]
+        return cls([p["hr"] for p in points], [p["cho"] for p in points], [p["fat"] for p in points],
+                   metric=metric, cho_tail_slope=ZONE_CHO_TAIL_SLOPE, fat_tail_slope=ZONE_FAT_TAIL_SLOPE)
+
+    def evaluate(self, values):
+        """(CHO g/h, FAT g/h) per uno scalare o un array di intensità di qualsiasi forma."""
+        x = np.asarray(values, dtype=float)
+        cho = np.interp(x, self.intensity, self.cho_gh)
+        fat = np.interp(x, self.intensity, self.fat_gh)
+        if self.has_tail:
+            extra = np.maximum(x - self.intensity[-1], 0.0)
+            cho = cho + extra * self.cho_tail_slope
+            fat = np.where(extra > 0, np.maximum(0.0, fat - extra * self.fat_tail_slope), fat)
+        return cho, fat
+
+    def to_frame(self):
+        """Vista tabellare (grafici di anteprima)."""
+        return pd.DataFrame({"Intensity": self.intensity, "CHO": self.cho_gh, "FAT": self.fat_gh})
+
+
+def compile_metabolic_curve(curve_data, metric=""):
+    """
+    Compila DataFrame / dict a zone in una MetabolicCurve, da fare una volta prima della simulazione.
+    MetabolicCurve, None e formati non riconosciuti sono restituiti invariati.
+    """
+    if isinstance(curve_data, pd.DataFrame):
+        return MetabolicCurve.from_frame(curve_data, metric=metric)
+    if isinstance(curve_data, dict):
+        return MetabolicCurve.from_zones(curve_data)
+    return curve_data
@@ -2,21 +2,24 @@ import math
 import numpy as np
 import pandas as pd
 
-from data_models import ChoMixType, IntakeMode
+from data_models import ChoMixType, IntakeMode, IntakePlan, IntensitySeries
+from domain.metabolic_curve import MetabolicCurve, compile_metabolic_curve
+from domain.result_schema import (
+    STATUS_LIVER, STATUS_LIVER_THRESHOLD_G, STATUS_MUSCLE, STATUS_MUSCLE_THRESHOLD_G, STATUS_OK, typed_result_frame
+)
+from domain.substrate_model import (
+    MIN_EFFECTIVE_IF, calculate_rer_polynomial, cho_fraction_from_rer, crossover_shift
+)
 
-
-def calculate_rer_polynomial(intensity_factor):
-    """
-    Calcola il Respiratory Exchange Ratio basato sull'intensità relativa (IF).
-    Modello polinomiale standard per stimare il consumo di substrati.
-    """
-    if_val = intensity_factor
-    rer = (-0.000000149 * (if_val ** 6) + 141.538462237 * (if_val ** 5) - 565.128206259 * (if_val ** 4) +
-           890.333333976 * (if_val ** 3) - 691.679487060 * (if_val ** 2) + 265.460857558 * if_val - 39.525121144)
-    return max(0.70, min(1.15, rer))
+# Soglie di crisi usate nell'analisi criticità (fegato vuoto / gambe vuote)
+BONK_LIVER_G = 0.0
+BONK_MUSCLE_G = 20.0
 
 
 def interpolate_consumption(current_val, curve_data):
+    if isinstance(curve_data, MetabolicCurve):
+        cho, fat = curve_data.evaluate(current_val)
+        return float(cho), float(fat)
     if isinstance(curve_data, pd.DataFrame):
         cho = np.interp(current_val, curve_data['Intensity'], curve_data['CHO'])
         fat = np.interp(current_val, curve_data['Intensity'], curve_data['FAT'])
@@ -51,7 +54,20 @@ def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, ch
                         tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80,
                         custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY,
                         intensity_series=None, metabolic_curve=None,
-                        intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0):
+                        intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0,
+                        summary_only=False, stop_at_floors=None, intake_plan=None):
+    """
+    Simulazione minuto per minuto (implementazione di riferimento).
+    intake_plan (IntakePlan) sostituisce intake/unità/modalità/cutoff con un piano esplicito;
+    senza piano si usa quello equivalente alla strategia a rateo costante.
+    Con summary_only=True non costruisce la tabella per minuto e ritorna (None, summary) con i soli
+    aggregati (minimi, minuto di crisi, totali). stop_at_floors=(fegato_g, muscolo_g) interrompe la
+    simulazione appena una riserva scende a quella soglia.
+    """
+
+    # Serie tipizzata: un solo ricampionamento al minuto (passo del ciclo)
+    if isinstance(intensity_series, IntensitySeries):
+        intensity_series = intensity_series.values_at_step(60).tolist()
 
     results = []
     initial_muscle_glycogen = subject_data['muscle_glycogen_g']
@@ -93,12 +109,25 @@ def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, ch
         kcal_per_min_base = vo2_estimated_absolute * 4.85
 
     is_lab_data = True if metabolic_curve is not None else False
+    # Curva compilata una volta: niente accessi alle colonne pandas nel ciclo
+    metabolic_curve = compile_metabolic_curve(metabolic_curve)
+    # Riferimento scalare: polinomio esatto (i motori vettoriali usano la tabella di substrate_model)
+    if_shift = crossover_shift(crossover_pct)
+
+    # Piano di assunzione: grammi per minuto calcolati una volta, nessuna diramazione nel ciclo
+    if intake_plan is None:
+        intake_plan = IntakePlan.from_strategy(
+            constant_carb_intake_g_h, cho_per_unit_g, intake_mode, duration_min, intake_cutoff_min
+        )
+    target_intake_g_h = intake_plan.rate_g_h(duration_min)
+    intake_per_minute = intake_plan.grams_per_step(np.arange(int(duration_min) + 1)).tolist()
 
     if custom_max_exo_rate is not None:
         max_exo_rate_g_min = custom_max_exo_rate
     else:
-        max_exo_rate_g_min = estimate_max_exogenous_oxidation(
-            subject_obj.height_cm, subject_obj.weight_kg, ftp_watts, mix_type_input
+        max_exo_rate_g_min = intake_plan.blended(
+            lambda mix: estimate_max_exogenous_oxidation(subject_obj.height_cm, subject_obj.weight_kg, ftp_watts, mix),
+            mix_type_input
         )
 
     gut_accumulation_total = 0.0
@@ -111,9 +140,18 @@ def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, ch
     total_intake_cumulative = 0.0
     total_exo_oxidation_cumulative = 0.0
 
-    units_per_hour = constant_carb_intake_g_h / cho_per_unit_g if cho_per_unit_g > 0 else 0
-    intake_interval_min = round(60 / units_per_hour) if units_per_hour > 0 else duration_min + 1
-    is_input_zero = constant_carb_intake_g_h == 0
+    is_input_zero = target_intake_g_h == 0
+    # Obiettivo di ossidazione esogena (costante per tutta la gara)
+    effective_target = 0.0
+    if not is_input_zero:
+        effective_target = min(target_intake_g_h / 60.0, max_exo_rate_g_min) * oxidation_efficiency_input
+
+    # Aggregati correnti (summary / early exit)
+    min_liver = min_muscle = float('inf')
+    min_liver_minute = min_muscle_minute = 0
+    bonk_minute = None
+    stop_reason = None
+    minutes_simulated = 0
 
     # Loop Temporale
     for t in range(int(duration_min) + 1):
@@ -146,29 +184,9 @@ def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, ch
             current_kcal_demand = kcal_per_min_base * drift_factor * demand_scaling
 
         # --- INTAKE ---
-        instantaneous_input_g_min = 0.0
-        in_feeding_window = t <= (duration_min - intake_cutoff_min)
-
-        is_discrete = False
-        try:
-            if intake_mode and intake_mode.name == 'DISCRETE':
-                is_discrete = True
-        except:
-            pass
-
-        if not is_input_zero and in_feeding_window:
-            if is_discrete:
-                if t == 0 or (t > 0 and intake_interval_min > 0 and t % intake_interval_min == 0):
-                    instantaneous_input_g_min = cho_per_unit_g
-            else:
-                instantaneous_input_g_min = constant_carb_intake_g_h / 60.0
+        instantaneous_input_g_min = intake_per_minute[t]
 
         # Exogenous Oxidation Logic
-        user_intake_rate = constant_carb_intake_g_h / 60.0
-        effective_target = min(user_intake_rate, max_exo_rate_g_min) * oxidation_efficiency_input
-        if is_input_zero:
-            effective_target = 0.0
-
         if t >= 0:
             if is_input_zero:
                 current_exo_oxidation_g_min *= (1 - alpha)
@@ -205,15 +223,10 @@ def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, ch
             rer = 0.85
         else:
             # Caso 2: LOGICA STANDARD (CROSSOVER)
-            # Questa è l'unica logica rimasta dopo la rimozione di Mader
-            standard_crossover = 75.0
-            crossover_val = crossover_pct if crossover_pct else standard_crossover
-            if_shift = (standard_crossover - crossover_val) / 100.0
-            effective_if_for_rer = max(0.3, current_if_moment + if_shift)
+            effective_if_for_rer = max(MIN_EFFECTIVE_IF, current_if_moment + if_shift)
 
             rer = calculate_rer_polynomial(effective_if_for_rer)
-            base_cho_ratio = (rer - 0.70) * 3.45
-            base_cho_ratio = max(0.0, min(1.0, base_cho_ratio))
+            base_cho_ratio = float(cho_fraction_from_rer(rer))
 
             current_cho_ratio = base_cho_ratio
             if current_if_moment < 0.85 and t > 60:
@@ -258,11 +271,30 @@ def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, ch
             total_liver_used += from_liver
             total_exo_used += from_exogenous
 
-        status_label = "Ottimale"
-        if current_liver_glycogen < 20:
-            status_label = "CRITICO (Ipoglicemia)"
-        elif current_muscle_glycogen < 100:
-            status_label = "Warning (Gambe Vuote)"
+        minutes_simulated = t + 1
+        if current_liver_glycogen < min_liver:
+            min_liver, min_liver_minute = current_liver_glycogen, t
+        if current_muscle_glycogen < min_muscle:
+            min_muscle, min_muscle_minute = current_muscle_glycogen, t
+        if bonk_minute is None and (current_liver_glycogen <= BONK_LIVER_G or current_muscle_glycogen <= BONK_MUSCLE_G):
+            bonk_minute = t
+
+        if stop_at_floors is not None:
+            if current_liver_glycogen <= stop_at_floors[0]:
+                stop_reason = "liver"
+            elif current_muscle_glycogen <= stop_at_floors[1]:
+                stop_reason = "muscle"
+
+        if summary_only:
+            if stop_reason:
+                break
+            continue
+
+        status_label = STATUS_OK
+        if current_liver_glycogen < STATUS_LIVER_THRESHOLD_G:
+            status_label = STATUS_LIVER
+        elif current_muscle_glycogen < STATUS_MUSCLE_THRESHOLD_G:
+            status_label = STATUS_MUSCLE
 
         total_g_min = max(1.0, muscle_usage_g_min + from_liver + from_exogenous + g_fat)
 
@@ -272,14 +304,14 @@ def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, ch
             "Glicogeno Epatico (g)": from_liver * 60,
             "Carboidrati Esogeni (g)": from_exogenous * 60,
             "Ossidazione Lipidica (g)": g_fat * 60,
-            "Pct_Muscle": f"{(muscle_usage_g_min / total_g_min * 100):.1f}%",
-            "Pct_Liver": f"{(from_liver / total_g_min * 100):.1f}%",
-            "Pct_Exo": f"{(from_exogenous / total_g_min * 100):.1f}%",
-            "Pct_Fat": f"{(g_fat / total_g_min * 100):.1f}%",
+            "Pct_Muscle": muscle_usage_g_min / total_g_min * 100,
+            "Pct_Liver": from_liver / total_g_min * 100,
+            "Pct_Exo": from_exogenous / total_g_min * 100,
+            "Pct_Fat": g_fat / total_g_min * 100,
             "Residuo Muscolare": current_muscle_glycogen,
             "Residuo Epatico": current_liver_glycogen,
             "Residuo Totale": current_muscle_glycogen + current_liver_glycogen,
-            "Target Intake (g/h)": constant_carb_intake_g_h,
+            "Target Intake (g/h)": target_intake_g_h,
             "Gut Load": gut_accumulation_total,
             "Stato": status_label,
             "CHO %": cho_ratio * 100,
@@ -287,6 +319,8 @@ def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, ch
             "Ossidazione Cumulativa (g)": total_exo_oxidation_cumulative,
             "Intensity Factor (IF)": current_if_moment
         })
+        if stop_reason:
+            break
 
     # Statistiche Finali
     total_kcal_final = (avg_watts * duration_min * 60) / 4184 / (gross_efficiency / 100)
@@ -303,7 +337,21 @@ def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, ch
         "avg_rer": rer,
         "cho_pct": cho_ratio * 100
     }
-    return pd.DataFrame(results), stats
+    if summary_only:
+        stats.update({
+            "final_muscle_g": current_muscle_glycogen,
+            "final_liver_g": current_liver_glycogen,
+            "min_liver_g": min_liver,
+            "min_liver_minute": min_liver_minute,
+            "min_muscle_g": min_muscle,
+            "min_muscle_minute": min_muscle_minute,
+            "bonk_minute": bonk_minute,
+            "minutes_simulated": minutes_simulated,
+            "stopped_early": stop_reason is not None,
+            "stop_reason": stop_reason,
+        })
+        return None, stats
+    return typed_result_frame(results), stats
 
 
 def calculate_minimum_strategy(tank, duration, subj, params, curve_data, mix_type, intake_mode,
@@ -321,8 +369,8 @@ def calculate_minimum_strategy(tank, duration, subj, params, curve_data, mix_typ
     # Iteriamo l'intake da 0 a 120 g/h con step di 5g
     for intake in range(0, 125, 5):
 
-        # Eseguiamo la simulazione (rimossi i flag mader e running_method)
-        df, stats = simulate_metabolism(
+        # Eseguiamo la simulazione (solo aggregati, stop al primo sforamento dei limiti)
+        _, summary = simulate_metabolism(
             subject_data=tank,
             duration_min=duration,
             constant_carb_intake_g_h=intake,
@@ -336,12 +384,14 @@ def calculate_minimum_strategy(tank, duration, subj, params, curve_data, mix_typ
             intake_mode=intake_mode,
             intake_cutoff_min=intake_cutoff_min,
             variability_index=variability_index,
-            intensity_series=intensity_series
+            intensity_series=intensity_series,
+            summary_only=True,
+            stop_at_floors=(MIN_LIVER_SAFE, MIN_MUSCLE_SAFE)
         )
 
         # Verifichiamo i minimi raggiunti durante la gara
-        min_liver = df['Residuo Epatico'].min()
-        min_muscle = df['Residuo Muscolare'].min()
+        min_liver = summary['min_liver_g']
+        min_muscle = summary['min_muscle_g']
 
         # Criterio di successo: Non andiamo mai sotto i minimi di sicurezza
         if min_liver > MIN_LIVER_SAFE and min_muscle > MIN_MUSCLE_SAFE:
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from domain.incremental_engine import context_fingerprint
+
+DEFAULT_CACHE_SIZE = 128
+
+
+# --- 1. CACHE LRU PER SCENARIO ---
+
+def _detached(value):
+    """
+    Copia leggera del risultato restituito al chiamante: DataFrame in copia superficiale
+    (aggiungere o sostituire colonne non tocca la versione in cache), dict e tuple ricostruiti.
+    """
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    if isinstance(value, dict):
+        return {k: _detached(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return tuple(_detached(v) for v in value)
+    return value
+
+
+class ScenarioCache:
+    """
+    Cache LRU limitata dei risultati dei motori, con chiave = impronta sha1 di tutti gli input
+    dello scenario (soggetto, serbatoio, attività, intake, serie di intensità, curva).
+    Thread-safe; conta hit, miss ed evizioni.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        if maxsize < 1:
+            raise ValueError("maxsize deve essere >= 1")
+        self.maxsize = int(maxsize)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncached = 0
+
+    @staticmethod
+    def key(namespace, *args, **kwargs):
+        return context_fingerprint(namespace, args, kwargs)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        _missing = object()
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = compute()
+            self.put(key, value)
+        return _detached(value)
+
+    def call(self, namespace, fn, *args, **kwargs):
+        """
+        fn(*args, **kwargs) dalla cache se lo stesso scenario è già stato calcolato; input senza
+        impronta affidabile (tipi non riconosciuti) -> calcolo diretto, fuori cache.
+        """
+        try:
+            key = self.key(namespace, *args, **kwargs)
+        except TypeError:
+            self.uncached += 1
+            return fn(*args, **kwargs)
+        return self.get_or_compute(key, lambda: fn(*args, **kwargs))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "uncached": self.uncached,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._data)
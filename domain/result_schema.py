@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# Stati della riserva (categoria ordinata per gravità crescente)
+STATUS_OK = "Ottimale"
+STATUS_MUSCLE = "Warning (Gambe Vuote)"
+STATUS_LIVER = "CRITICO (Ipoglicemia)"
+STATUS_CATEGORIES = pd.CategoricalDtype([STATUS_OK, STATUS_MUSCLE, STATUS_LIVER], ordered=True)
+
+# Soglie di stato (g)
+STATUS_LIVER_THRESHOLD_G = 20.0
+STATUS_MUSCLE_THRESHOLD_G = 100.0
+
+PCT_COLUMNS = ("Pct_Muscle", "Pct_Liver", "Pct_Exo", "Pct_Fat")
+
+# Tipi delle colonne: riserve e cumulati in float64 (soglie di crisi), flussi e percentuali in float32
+RESULT_DTYPES = {
+    "Glicogeno Muscolare (g)": np.float32,
+    "Glicogeno Epatico (g)": np.float32,
+    "Carboidrati Esogeni (g)": np.float32,
+    "Ossidazione Lipidica (g)": np.float32,
+    "Pct_Muscle": np.float32,
+    "Pct_Liver": np.float32,
+    "Pct_Exo": np.float32,
+    "Pct_Fat": np.float32,
+    "Residuo Muscolare": np.float64,
+    "Residuo Epatico": np.float64,
+    "Residuo Totale": np.float64,
+    "Target Intake (g/h)": np.float32,
+    "Gut Load": np.float32,
+    "Stato": STATUS_CATEGORIES,
+    "CHO %": np.float32,
+    "Intake Cumulativo (g)": np.float64,
+    "Ossidazione Cumulativa (g)": np.float64,
+    "Intensity Factor (IF)": np.float32,
+}
+
+
+def status_codes(muscle, liver):
+    """Codici di stato (0 ok, 1 gambe vuote, 2 ipoglicemia) per array di riserve."""
+    muscle = np.asarray(muscle, dtype=float)
+    liver = np.asarray(liver, dtype=float)
+    return np.where(liver < STATUS_LIVER_THRESHOLD_G, 2,
+                    np.where(muscle < STATUS_MUSCLE_THRESHOLD_G, 1, 0)).astype(np.int8)
+
+
+def status_categorical(muscle, liver):
+    return pd.Categorical.from_codes(status_codes(muscle, liver), dtype=STATUS_CATEGORIES)
+
+
+def share_pct(part, total_g_min):
+    """Quota percentuale numerica di una fonte sul totale ossidato (minimo 1 g/min al denominatore)."""
+    return np.asarray(part, dtype=float) / np.maximum(1.0, total_g_min) * 100
+
+
+def _typed_column(name, values):
+    dtype = RESULT_DTYPES.get(name)
+    if dtype is None:
+        return values
+    if isinstance(dtype, pd.CategoricalDtype):
+        return values if isinstance(values, pd.Categorical) else pd.Categorical(values, dtype=dtype)
+    return np.asarray(values, dtype=dtype)
+
+
+def typed_result_frame(columns):
+    """
+    DataFrame risultato con i tipi di RESULT_DTYPES (colonne non elencate lasciate invariate).
+    Accetta un dict di colonne (convertite prima di costruire il frame) o una lista di righe.
+    """
+    if isinstance(columns, dict):
+        return pd.DataFrame({name: _typed_column(name, values) for name, values in columns.items()}, copy=False)
+    df = pd.DataFrame(columns)
+    dtypes = {c: d for c, d in RESULT_DTYPES.items() if c in df.columns}
+    return df.astype(dtypes)
+
+
+def format_result_table(df, decimals=1):
+    """
+    Copia per la visualizzazione tabellare: percentuali come "12.3%" e stato come testo.
+    Da chiamare solo quando la tabella viene mostrata (le serie numeriche restano per i grafici).
+    """
+    view = df.copy()
+    for col in PCT_COLUMNS:
+        if col in view.columns:
+            view[col] = [f"{v:.{decimals}f}%" for v in view[col].astype(float).tolist()]
+    if "Stato" in view.columns:
+        view["Stato"] = view["Stato"].astype(str)
+    return view
@@ -0,0 +1,170 @@
+"""
+Tapering su scala stagionale (90-365 giorni di allenamento pianificato o svolto).
+
+Il diario è consumato a blocchi di giorni: lo stato orario dei serbatoi passa in streaming a un
+riepilogo giornaliero e, se richiesto, a un file colonnare su disco. In memoria resta un solo
+blocco orario, mai l'intera timeline giorni x 24.
+"""
+import datetime
+import importlib.util
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from data_models import GlycogenState
+from domain.substrate_model import substrate_table
+from domain.tapering_engine import (
+    MAX_LIVER_G, SAFE_LIVER_G, STATUS_WORK, final_tank_state, hourly_flows, hourly_frame, tapering_reserves,
+    tapering_start
+)
+
+SEASON_MIN_DAYS = 90
+SEASON_MAX_DAYS = 365
+DEFAULT_CHUNK_DAYS = 28      # Giorni per blocco orario (672 righe)
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# Colonne del riepilogo giornaliero (livelli a fine giornata)
+DAILY_COLUMNS = (
+    "Data", "Giorno", "Ore Allenamento", "Muscolare", "Epatico", "Totale",
+    "Epatico Min", "Totale Min", "Ore Rischio", "Riempimento %",
+)
+
+
+# --- 1. DIARIO STAGIONALE ---
+
+def season_days(start_date, n_days, weekly_template):
+    """
+    Giorni pianificati (generatore) ripetendo un microciclo: weekly_template ha 7 giorni
+    (lunedì = 0) nel formato di calculate_hourly_tapering, senza date_obj.
+    """
+    if len(weekly_template) != 7:
+        raise ValueError("Il microciclo deve avere 7 giorni (lunedì-domenica)")
+    for k in range(int(n_days)):
+        date_obj = start_date + datetime.timedelta(days=k)
+        yield {**weekly_template[date_obj.weekday()], "date_obj": date_obj}
+
+
+# --- 2. STREAMING ORARIO ---
+
+def iter_tapering_blocks(subject, days, start_state: GlycogenState = GlycogenState.NORMAL,
+                         chunk_days=DEFAULT_CHUNK_DAYS):
+    """
+    Generatore di blocchi (giorni, stato orario, muscolo, fegato) di chunk_days giorni, con lo stato
+    dei serbatoi trasferito fra i blocchi: concatenati coincidono con il diario calcolato in un colpo
+    solo. days può essere a sua volta un generatore.
+    """
+    if chunk_days < 1:
+        raise ValueError("chunk_days deve essere >= 1")
+    _, max_muscle, curr_muscle, curr_liver = tapering_start(subject, start_state)
+    rer_table = substrate_table()
+    days = iter(days)
+    while True:
+        block = list(itertools.islice(days, chunk_days))
+        if not block:
+            return
+        flows = hourly_flows(subject, block, rer_table)
+        muscle, liver = tapering_reserves(flows, curr_muscle, curr_liver, max_muscle)
+        curr_muscle, curr_liver = float(muscle[-1]), float(liver[-1])
+        yield block, flows['status'], muscle, liver
+
+
+def iter_tapering_hours(subject, days, start_state: GlycogenState = GlycogenState.NORMAL,
+                        chunk_days=DEFAULT_CHUNK_DAYS):
+    """Come iter_tapering_blocks, ma ogni blocco è un DataFrame orario (colonne di calculate_hourly_tapering)."""
+    for block, status, muscle, liver in iter_tapering_blocks(subject, days, start_state, chunk_days):
+        yield hourly_frame(block, status, muscle, liver)
+
+
+def daily_summary(days_block, status, muscle, liver, max_capacity_g):
+    """Colonne del riepilogo giornaliero (array, una riga per giorno) per un blocco orario."""
+    muscle = muscle.reshape(-1, 24)
+    liver = liver.reshape(-1, 24)
+    total = muscle + liver
+    return {
+        "Data": pd.DatetimeIndex([pd.Timestamp(day['date_obj']) for day in days_block]).as_unit("us"),
+        "Giorno": [day['date_obj'].strftime("%d/%m") for day in days_block],
+        "Ore Allenamento": (status.reshape(-1, 24) == STATUS_WORK).sum(axis=1),
+        "Muscolare": muscle[:, -1],
+        "Epatico": liver[:, -1],
+        "Totale": total[:, -1],
+        "Epatico Min": liver.min(axis=1),
+        "Totale Min": total.min(axis=1),
+        "Ore Rischio": (liver <= SAFE_LIVER_G).sum(axis=1),
+        "Riempimento %": total[:, -1] / max_capacity_g * 100,
+    }
+
+
+class HourlyFileSink:
+    """
+    Timeline oraria su disco, un blocco alla volta: Parquet (un row group per blocco, richiede
+    pyarrow) oppure CSV se l'estensione è .csv (righe accodate). Nessun file se non arriva alcun blocco.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.csv = self.path.lower().endswith(".csv")
+        self.rows = 0
+        self._writer = None
+
+    def write(self, hourly):
+        if self.csv:
+            hourly.to_csv(self.path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(hourly, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        self.rows += len(hourly)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- 3. STAGIONE COMPLETA ---
+
+def run_season(subject, days, start_state: GlycogenState = GlycogenState.NORMAL, chunk_days=DEFAULT_CHUNK_DAYS,
+               hourly_path=None):
+    """
+    Stagione in streaming: riepilogo giornaliero sempre, timeline oraria su file solo con hourly_path.
+    Memoria limitata a un blocco orario più una riga per giorno.
+    Ritorna {"daily", "final_tank", "n_days", "n_hours", "hourly_path"}.
+    """
+    tank, max_muscle, curr_muscle, curr_liver = tapering_start(subject, start_state)
+    max_capacity = max_muscle + MAX_LIVER_G
+    summaries = []
+    n_hours = 0
+    sink = HourlyFileSink(hourly_path) if hourly_path else None
+    try:
+        for block, status, muscle, liver in iter_tapering_blocks(subject, days, start_state, chunk_days):
+            summaries.append(daily_summary(block, status, muscle, liver, max_capacity))
+            if sink is not None:
+                sink.write(hourly_frame(block, status, muscle, liver))
+            curr_muscle, curr_liver = float(muscle[-1]), float(liver[-1])
+            n_hours += len(muscle)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    if summaries:
+        daily = pd.DataFrame({col: np.concatenate([np.asarray(part[col]) for part in summaries])
+                              for col in DAILY_COLUMNS})
+    else:
+        daily = pd.DataFrame(columns=list(DAILY_COLUMNS))
+    return {
+        "daily": daily,
+        "final_tank": final_tank_state(tank, max_muscle, curr_muscle, curr_liver),
+        "n_days": len(daily),
+        "n_hours": n_hours,
+        "hourly_path": hourly_path if n_hours else None,
+    }
@@ -0,0 +1,347 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+import numpy as np
+import pandas as pd
+
+from data_models import ChoMixType, IntakeMode
+from domain.metabolic_curve import compile_metabolic_curve
+from domain.substrate_model import STANDARD_CROSSOVER
+from domain.tapering_engine import calculate_tank
+from domain.uncertainty_engine import chunk_sizes
+from domain.vectorized_engine import (
+    LAB_CHO_DRIFT_PER_MIN, MAX_LIVER_OUTPUT_G_MIN, MUSCLE_CONTRIBUTION_EXPONENT, exogenous_target, intake_series,
+    intensity_values, prepare_demand_series, race_summary_batch, resolve_max_exo_rate
+)
+
+GROUP_SUBJECT = "Soggetto"
+GROUP_ACTIVITY = "Attività"
+GROUP_STRATEGY = "Strategia"
+GROUP_CONSTANT = "Costante Motore"
+
+FACTOR_LABELS = {
+    "weight_kg": "Peso (kg)",
+    "height_cm": "Altezza (cm)",
+    "body_fat_pct": "Massa Grassa",
+    "glycogen_conc_g_kg": "Concentrazione Glicogeno (g/kg)",
+    "liver_glycogen_g": "Glicogeno Epatico Max (g)",
+    "filling_factor": "Fattore Riempimento",
+    "vo2_max": "VO2max",
+    "avg_watts": "Potenza Media (W)",
+    "np_watts": "Normalized Power (W)",
+    "ftp_watts": "FTP (W)",
+    "efficiency": "Efficienza Lorda (%)",
+    "avg_hr": "FC Media (bpm)",
+    "threshold_hr": "FC Soglia (bpm)",
+    "tau_absorption": "Tau Assorbimento (min)",
+    "crossover_pct": "Crossover Point (%)",
+    "oxidation_efficiency": "Efficienza Ossidazione",
+    "liver_output_cap": "Max Output Epatico (g/min)",
+    "cho_drift": "Deriva CHO Lab (/min)",
+    "muscle_exponent": "Esponente Contributo Muscolare",
+}
+
+# Limiti fisici dei range relativi
+FACTOR_BOUNDS = {
+    "body_fat_pct": (0.03, 0.60),
+    "filling_factor": (0.10, 1.25),
+    "oxidation_efficiency": (0.30, 1.0),
+    "crossover_pct": (50.0, 90.0),
+}
+
+
+# --- 1. FATTORI ---
+
+@dataclass(frozen=True)
+class SensitivityFactor:
+    name: str
+    group: str
+    nominal: float
+    low: float
+    high: float
+
+    @property
+    def label(self):
+        return FACTOR_LABELS.get(self.name, self.name)
+
+    def scale(self, unit_values):
+        """Da [0, 1] al range fisico del fattore."""
+        return self.low + np.asarray(unit_values) * (self.high - self.low)
+
+
+def build_factors(subject_obj, activity_params, tau_absorption=20, crossover_pct=75,
+                  oxidation_efficiency=0.80, rel_range=0.10, use_lab_curve=False):
+    """
+    Fattori analizzati con range nominale ±rel_range: campi del Subject, chiavi di
+    activity_params, parametri della strategia e costanti del motore.
+    I fattori senza ampiezza (es. FTP = 0) vengono esclusi; crossover solo senza curva di
+    laboratorio, deriva CHO solo con la curva.
+    """
+    mode = activity_params.get('mode', 'cycling')
+    nominal = {
+        GROUP_SUBJECT: {
+            "weight_kg": subject_obj.weight_kg,
+            "height_cm": subject_obj.height_cm,
+            "body_fat_pct": subject_obj.body_fat_pct,
+            "glycogen_conc_g_kg": subject_obj.glycogen_conc_g_kg,
+            "liver_glycogen_g": subject_obj.liver_glycogen_g,
+            "filling_factor": subject_obj.filling_factor,
+        },
+        GROUP_ACTIVITY: {},
+        GROUP_STRATEGY: {
+            "tau_absorption": tau_absorption,
+            "oxidation_efficiency": oxidation_efficiency,
+        },
+        GROUP_CONSTANT: {
+            "liver_output_cap": MAX_LIVER_OUTPUT_G_MIN,
+            "muscle_exponent": MUSCLE_CONTRIBUTION_EXPONENT,
+        },
+    }
+    if mode == 'cycling':
+        nominal[GROUP_ACTIVITY]["avg_watts"] = activity_params.get('avg_watts', 200)
+        if 'np_watts' in activity_params:
+            nominal[GROUP_ACTIVITY]["np_watts"] = activity_params['np_watts']
+        nominal[GROUP_ACTIVITY]["ftp_watts"] = activity_params.get('ftp_watts', 250)
+        nominal[GROUP_ACTIVITY]["efficiency"] = activity_params.get('efficiency', 22.0)
+    else:
+        nominal[GROUP_SUBJECT]["vo2_max"] = subject_obj.vo2_max
+        nominal[GROUP_ACTIVITY]["avg_hr"] = activity_params.get('avg_hr', 150)
+        nominal[GROUP_ACTIVITY]["threshold_hr"] = activity_params.get('threshold_hr', 170)
+    if use_lab_curve:
+        # La deriva CHO si applica solo alla curva di laboratorio
+        nominal[GROUP_CONSTANT]["cho_drift"] = LAB_CHO_DRIFT_PER_MIN
+    else:
+        nominal[GROUP_STRATEGY]["crossover_pct"] = crossover_pct if crossover_pct else STANDARD_CROSSOVER
+
+    factors = []
+    for group, values in nominal.items():
+        for name, value in values.items():
+            low, high = sorted((value * (1 - rel_range), value * (1 + rel_range)))
+            bound_low, bound_high = FACTOR_BOUNDS.get(name, (-np.inf, np.inf))
+            low, high = max(low, bound_low), min(high, bound_high)
+            if high > low:
+                factors.append(SensitivityFactor(name, group, float(value), float(low), float(high)))
+    return factors
+
+
+# --- 2. VALUTAZIONE SCENARI ---
+
+def evaluate_scenarios(context, factors, matrix):
+    """
+    Valuta gli scenari (righe di matrix, valori fisici dei fattori) con il kernel
+    race_summary_batch. Domanda e substrati sono riusati tra scenari che differiscono
+    solo in parametri che non li influenzano (tau, riserve, costanti del glicogeno).
+    Ritorna (glicogeno finale g, minuto di crisi; durata se nessuna crisi).
+    """
+    matrix = np.atleast_2d(matrix)
+    n_scen = len(matrix)
+    names = [f.name for f in factors]
+    groups = {f.name: f.group for f in factors}
+    subject_obj = context['subject_obj']
+    duration_min = context['duration_min']
+    rate = context['constant_carb_intake_g_h']
+
+    nominal_tank = calculate_tank(subject_obj)
+    tank = context['tank']
+    t = np.arange(int(duration_min) + 1)
+    intake_g = intake_series(
+        t, duration_min, rate, context['cho_per_unit_g'], context['intake_mode'], context['intake_cutoff_min']
+    )
+
+    cho_g_min = np.empty((len(t), n_scen))
+    target = np.empty(n_scen)
+    alpha = np.empty(n_scen)
+    ox_eff = np.empty(n_scen)
+    muscle0 = np.empty(n_scen)
+    liver0 = np.empty(n_scen)
+    exponent = np.empty(n_scen)
+    liver_cap = np.empty(n_scen)
+    demand_cache = {}
+
+    for s, row in enumerate(matrix):
+        values = dict(zip(names, row.tolist()))
+        subject_overrides = {k: v for k, v in values.items() if groups[k] == GROUP_SUBJECT}
+        activity_overrides = {k: v for k, v in values.items() if groups[k] == GROUP_ACTIVITY}
+        subj = replace(subject_obj, **subject_overrides)
+        params = {**context['activity_params'], **activity_overrides}
+        crossover = values.get('crossover_pct', context['crossover_pct'])
+        drift = values.get('cho_drift', LAB_CHO_DRIFT_PER_MIN)
+
+        demand_key = (subj.weight_kg, subj.vo2_max, tuple(sorted(activity_overrides.items())), crossover, drift)
+        if demand_key not in demand_cache:
+            demand_cache[demand_key] = prepare_demand_series(
+                duration_min, crossover, subj, params, context['intensity_series'],
+                context['metabolic_curve'], context['variability_index'], cho_drift=drift
+            )
+        series = demand_cache[demand_key]
+        cho_g_min[:, s] = series['cho_g_min']
+
+        ox_eff[s] = values.get('oxidation_efficiency', context['oxidation_efficiency_input'])
+        max_exo = resolve_max_exo_rate(context['custom_max_exo_rate'], subj, series['activity'], context['mix_type_input'])
+        target[s] = exogenous_target(rate, max_exo, ox_eff[s])
+        alpha[s] = 1 - np.exp(-1.0 / values.get('tau_absorption', context['tau_absorption']))
+        exponent[s] = values.get('muscle_exponent', MUSCLE_CONTRIBUTION_EXPONENT)
+        liver_cap[s] = values.get('liver_output_cap', MAX_LIVER_OUTPUT_G_MIN)
+
+        # Il tank di partenza (override inclusi) viene scalato come il tank del soggetto variato
+        scenario_tank = calculate_tank(subj) if subject_overrides else nominal_tank
+        muscle0[s] = tank['muscle_glycogen_g'] * _ratio(scenario_tank['muscle_glycogen_g'], nominal_tank['muscle_glycogen_g'])
+        liver0[s] = tank['liver_glycogen_g'] * _ratio(scenario_tank['liver_glycogen_g'], nominal_tank['liver_glycogen_g'])
+
+    summary = race_summary_batch(
+        cho_g_min, intake_g, target, alpha, ox_eff, muscle0, liver0, exponent=exponent, liver_cap=liver_cap
+    )
+    final_glycogen = summary['final_muscle_g'] + summary['final_liver_g']
+    bonk_minute = np.where(summary['bonk_minute'] >= 0, summary['bonk_minute'], int(duration_min)).astype(float)
+    return final_glycogen, bonk_minute
+
+
+def _ratio(value, reference):
+    return value / reference if reference > 0 else 1.0
+
+
+def _evaluate_chunk(task):
+    context, factors, matrix = task
+    return evaluate_scenarios(context, factors, matrix)
+
+
+def evaluate_parallel(context, factors, matrix, n_workers=None, chunk_size=250):
+    """Divide gli scenari in blocchi e li valuta su un pool di processi."""
+    sizes = chunk_sizes(len(matrix), chunk_size)
+    bounds = np.cumsum([0] + sizes)
+    tasks = [(context, factors, matrix[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers <= 1 or len(tasks) == 1:
+        results = [_evaluate_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks))) as pool:
+            results = list(pool.map(_evaluate_chunk, tasks))
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+# --- 3. DISEGNO DI MORRIS (ELEMENTARY EFFECTS) ---
+
+def morris_design(n_factors, n_trajectories, rng, levels=4):
+    """
+    Traiettorie di Morris su griglia a `levels` livelli in [0, 1]^k.
+    Ritorna (punti (r, k+1, k), ordine dei fattori (r, k), passo con segno (r, k)).
+    """
+    delta = levels / (2.0 * (levels - 1))
+    grid = np.arange(levels) / (levels - 1)
+    points = np.empty((n_trajectories, n_factors + 1, n_factors))
+    orders = np.empty((n_trajectories, n_factors), dtype=int)
+    steps = np.empty((n_trajectories, n_factors))
+
+    for r in range(n_trajectories):
+        x = rng.choice(grid, n_factors)
+        points[r, 0] = x
+        orders[r] = rng.permutation(n_factors)
+        for j, f in enumerate(orders[r]):
+            step = delta if x[f] + delta <= 1.0 + 1e-12 else -delta
+            x = x.copy()
+            x[f] += step
+            points[r, j + 1] = x
+            steps[r, j] = step
+    return points, orders, steps
+
+
+def elementary_effects(outputs, orders, steps):
+    """Effetti elementari (r, k) da output (r, k+1) ordinati lungo le traiettorie."""
+    n_trajectories, n_factors = orders.shape
+    effects = np.empty((n_trajectories, n_factors))
+    diffs = np.diff(outputs, axis=1) / steps
+    rows = np.arange(n_trajectories)[:, None]
+    effects[rows, orders] = diffs
+    return effects
+
+
+# --- 4. ANALISI COMPLETA ---
+
+def run_sensitivity_analysis(tank, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+                             tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80,
+                             custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY,
+                             intensity_series=None, metabolic_curve=None,
+                             intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0,
+                             factors=None, rel_range=0.10, n_trajectories=100, seed=0, n_workers=None):
+    """
+    Classifica i fattori che determinano glicogeno finale e minuto di crisi.
+    Combina il metodo di Morris (μ*: effetto medio assoluto, σ: non linearità/interazioni,
+    normalizzati sull'intero range del fattore) con un one-at-a-time ai due estremi per il tornado.
+    Ritorna un dict con la tabella 'tornado' (ordinata per μ* sul glicogeno), il caso base
+    e il numero di simulazioni eseguite.
+    """
+    if factors is None:
+        factors = build_factors(
+            subject_obj, activity_params, tau_absorption, crossover_pct, oxidation_efficiency_input,
+            rel_range=rel_range, use_lab_curve=metabolic_curve is not None
+        )
+    context = {
+        "tank": tank,
+        "duration_min": duration_min,
+        "constant_carb_intake_g_h": constant_carb_intake_g_h,
+        "cho_per_unit_g": cho_per_unit_g,
+        "crossover_pct": crossover_pct,
+        "tau_absorption": tau_absorption,
+        "subject_obj": subject_obj,
+        "activity_params": activity_params,
+        "oxidation_efficiency_input": oxidation_efficiency_input,
+        "custom_max_exo_rate": custom_max_exo_rate,
+        "mix_type_input": mix_type_input,
+        "intensity_series": None if intensity_series is None else intensity_values(intensity_series),
+        "metabolic_curve": compile_metabolic_curve(metabolic_curve),
+        "intake_mode": intake_mode,
+        "intake_cutoff_min": intake_cutoff_min,
+        "variability_index": variability_index,
+    }
+    k = len(factors)
+    lows = np.array([f.low for f in factors])
+    highs = np.array([f.high for f in factors])
+    nominal = np.array([f.nominal for f in factors])
+
+    # Traiettorie di Morris + caso base + estremi one-at-a-time in un'unica matrice
+    points, orders, steps = morris_design(k, n_trajectories, np.random.default_rng(seed))
+    morris_matrix = lows + points.reshape(-1, k) * (highs - lows)
+    oat_matrix = np.repeat(nominal[None, :], 2 * k + 1, axis=0)
+    for j in range(k):
+        oat_matrix[1 + 2 * j, j] = lows[j]
+        oat_matrix[2 + 2 * j, j] = highs[j]
+    matrix = np.vstack([morris_matrix, oat_matrix])
+
+    glycogen, bonk = evaluate_parallel(context, factors, matrix, n_workers=n_workers)
+    n_morris = len(morris_matrix)
+
+    columns = {}
+    for key, output in (("Glicogeno", glycogen), ("Minuto Crisi", bonk)):
+        effects = elementary_effects(output[:n_morris].reshape(n_trajectories, k + 1), orders, steps)
+        columns[f"μ* {key}"] = np.abs(effects).mean(axis=0)
+        columns[f"μ {key}"] = effects.mean(axis=0)
+        columns[f"σ {key}"] = effects.std(axis=0, ddof=1) if n_trajectories > 1 else np.zeros(k)
+
+    oat_glycogen = glycogen[n_morris:]
+    oat_bonk = bonk[n_morris:]
+    base_glycogen, base_bonk = oat_glycogen[0], oat_bonk[0]
+
+    tornado = pd.DataFrame({
+        "Parametro": [f.label for f in factors],
+        "Gruppo": [f.group for f in factors],
+        "Nominale": nominal,
+        "Basso": lows,
+        "Alto": highs,
+        "Δ Glicogeno @Basso (g)": oat_glycogen[1::2] - base_glycogen,
+        "Δ Glicogeno @Alto (g)": oat_glycogen[2::2] - base_glycogen,
+        "Δ Crisi @Basso (min)": oat_bonk[1::2] - base_bonk,
+        "Δ Crisi @Alto (min)": oat_bonk[2::2] - base_bonk,
+        **columns,
+    })
+    tornado["Swing Glicogeno (g)"] = (tornado["Δ Glicogeno @Alto (g)"] - tornado["Δ Glicogeno @Basso (g)"]).abs()
+    tornado = tornado.sort_values(["μ* Glicogeno", "μ* Minuto Crisi"], ascending=False).reset_index(drop=True)
+    tornado.insert(0, "Rank", np.arange(1, k + 1))
+
+    return {
+        "tornado": tornado,
+        "baseline": {"final_glycogen_g": float(base_glycogen), "bonk_minute": float(base_bonk)},
+        "factors": factors,
+        "simulations": len(matrix),
+        "trajectories": n_trajectories,
+    }
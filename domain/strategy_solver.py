@@ -0,0 +1,225 @@
+import math
+import numpy as np
+
+from domain.gradient_engine import simulate_metabolism_gradients
+from domain.vectorized_engine import prepare_demand_series, run_intake_scenario
+
+# Limiti di sicurezza (stessi di calculate_minimum_strategy)
+MIN_LIVER_SAFE = 5.0    # Grammi minimi fegato
+MIN_MUSCLE_SAFE = 20.0  # Grammi minimi muscolo
+
+SOLVER_BISECTION = "bisection"
+SOLVER_NEWTON = "newton"
+NEWTON_MAX_ITERATIONS = 12
+
+
+def evaluate_reserve_floors(liver, muscle, min_liver_safe=MIN_LIVER_SAFE, min_muscle_safe=MIN_MUSCLE_SAFE):
+    """
+    Verifica i limiti di sicurezza su una traiettoria di riserve.
+    Ritorna un dict con esito, minimi raggiunti e vincolo più stretto (liver/muscle) con il suo minuto:
+    il primo minuto di violazione se la strategia fallisce, altrimenti il minuto del minimo.
+    """
+    liver = np.asarray(liver)
+    muscle = np.asarray(muscle)
+    min_liver = float(liver.min())
+    min_muscle = float(muscle.min())
+    liver_margin = min_liver - min_liver_safe
+    muscle_margin = min_muscle - min_muscle_safe
+    feasible = liver_margin > 0 and muscle_margin > 0
+
+    if feasible:
+        binding = "liver" if liver_margin <= muscle_margin else "muscle"
+        binding_minute = int(np.argmin(liver if binding == "liver" else muscle))
+    else:
+        # Primo limite violato in ordine di tempo
+        crossings = {}
+        if liver_margin <= 0:
+            crossings["liver"] = int(np.argmax(liver <= min_liver_safe))
+        if muscle_margin <= 0:
+            crossings["muscle"] = int(np.argmax(muscle <= min_muscle_safe))
+        binding = min(crossings, key=crossings.get)
+        binding_minute = crossings[binding]
+
+    return {
+        "feasible": feasible,
+        "min_liver_g": min_liver,
+        "min_muscle_g": min_muscle,
+        "binding_constraint": binding,
+        "binding_minute": binding_minute,
+    }
+
+
+def evaluate_summary_floors(summary, min_liver_safe=MIN_LIVER_SAFE, min_muscle_safe=MIN_MUSCLE_SAFE):
+    """
+    Come evaluate_reserve_floors ma sugli aggregati di una simulazione summary_only
+    eseguita con stop_at_floors=(min_liver_safe, min_muscle_safe).
+    """
+    if summary['stopped_early']:
+        feasible = False
+        binding = summary['stop_reason']
+        binding_minute = summary['minutes_simulated'] - 1
+    else:
+        feasible = True
+        liver_margin = summary['min_liver_g'] - min_liver_safe
+        muscle_margin = summary['min_muscle_g'] - min_muscle_safe
+        binding = "liver" if liver_margin <= muscle_margin else "muscle"
+        binding_minute = summary['min_liver_minute'] if binding == "liver" else summary['min_muscle_minute']
+
+    return {
+        "feasible": feasible,
+        "min_liver_g": float(summary['min_liver_g']),
+        "min_muscle_g": float(summary['min_muscle_g']),
+        "binding_constraint": binding,
+        "binding_minute": int(binding_minute),
+    }
+
+
+def _floor_probe(series, tank, duration, subj, mix_type, intake_mode, intake_cutoff_min, tolerance_g_h,
+                 max_intake_g_h, cho_per_unit_g, tau_absorption):
+    """Prova memorizzata sulla griglia (passo tolerance_g_h): summary_only, stop alla prima violazione."""
+    probes = {}
+
+    def probe(step):
+        intake = min(step * tolerance_g_h, max_intake_g_h)
+        if step not in probes:
+            _, _, _, state = run_intake_scenario(
+                series, tank, duration, intake, cho_per_unit_g, tau_absorption, subj,
+                mix_type_input=mix_type, intake_mode=intake_mode, intake_cutoff_min=intake_cutoff_min,
+                summary_only=True, stop_at_floors=(MIN_LIVER_SAFE, MIN_MUSCLE_SAFE)
+            )
+            probes[step] = evaluate_summary_floors(state)
+        return probes[step]
+    return probe, probes
+
+
+def _bisect(probe, lo, hi):
+    """Invariante: lo non sostenibile, hi sostenibile. Ritorna il primo passo sostenibile."""
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if probe(mid)['feasible']:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def _solution(probes, solution, hi, tolerance_g_h, max_intake_g_h):
+    final = probes[solution if solution is not None else hi]
+    intake_g_h = None
+    if solution is not None:
+        intake_g_h = round(min(solution * tolerance_g_h, max_intake_g_h), 6)
+    return {
+        "intake_g_h": intake_g_h,
+        "simulations": len(probes),
+        "tolerance_g_h": tolerance_g_h,
+        **final,
+    }
+
+
+def solve_minimum_strategy(tank, duration, subj, params, curve_data, mix_type, intake_mode,
+                           intake_cutoff_min=0, variability_index=1.0, intensity_series=None,
+                           tolerance_g_h=1.0, max_intake_g_h=120.0, cho_per_unit_g=30, crossover_pct=75,
+                           tau_absorption=20):
+    """
+    Intake minimo (g/h) che mantiene fegato e muscolo sopra i limiti di sicurezza.
+    Il criterio è monotono nell'intake: si cerca per bisezione sulla griglia di passo
+    tolerance_g_h tra 0 e max_intake_g_h, riusando domanda e substrati per ogni prova;
+    ogni prova gira in modalità summary_only e si interrompe alla prima violazione.
+    crossover_pct, tau_absorption e cho_per_unit_g devono essere quelli della simulazione di gara.
+    Ritorna un dict con intake (None se irraggiungibile), numero di simulazioni e vincolo limitante.
+    """
+    series = prepare_demand_series(
+        duration, crossover_pct, subj, params, intensity_series, curve_data, variability_index
+    )
+    probe, probes = _floor_probe(series, tank, duration, subj, mix_type, intake_mode, intake_cutoff_min,
+                                 tolerance_g_h, max_intake_g_h, cho_per_unit_g, tau_absorption)
+    lo, hi = 0, math.ceil(max_intake_g_h / tolerance_g_h)
+
+    if probe(lo)['feasible']:
+        solution = lo
+    elif not probe(hi)['feasible']:
+        solution = None
+    else:
+        solution = _bisect(probe, lo, hi)
+    return _solution(probes, solution, hi, tolerance_g_h, max_intake_g_h)
+
+
+def reserve_margins(result):
+    """Margini (g) sui limiti di sicurezza e loro derivate rispetto all'intake, da simulate_metabolism_gradients."""
+    values, gradients = result['values'], result['gradients']
+    return {
+        "liver": (values['min_liver_g'] - MIN_LIVER_SAFE, gradients['min_liver_g']['intake_g_h']),
+        "muscle": (values['min_muscle_g'] - MIN_MUSCLE_SAFE, gradients['min_muscle_g']['intake_g_h']),
+    }
+
+
+def solve_minimum_strategy_newton(tank, duration, subj, params, curve_data, mix_type, intake_mode,
+                                  intake_cutoff_min=0, variability_index=1.0, intensity_series=None,
+                                  tolerance_g_h=1.0, max_intake_g_h=120.0, cho_per_unit_g=30, crossover_pct=75,
+                                  tau_absorption=20):
+    """
+    Stesso risultato di solve_minimum_strategy con meno simulazioni: Newton (protetto da un
+    intervallo, bisezione se il passo esce o nessuna derivata è positiva) sui margini continui dei
+    limiti di sicurezza, con le derivate rispetto all'intake da simulate_metabolism_gradients
+    (fegato "virtuale" non limitato a zero, così il margine resta derivabile anche oltre il limite).
+    La stima si arrotonda alla griglia e si conferma con le prove standard: soluzione e vincolo
+    sono quelli della bisezione (criterio monotono). "simulations" conta anche le valutazioni con
+    gradiente ("gradient_evaluations").
+    """
+    series = prepare_demand_series(
+        duration, crossover_pct, subj, params, intensity_series, curve_data, variability_index
+    )
+    probe, probes = _floor_probe(series, tank, duration, subj, mix_type, intake_mode, intake_cutoff_min,
+                                 tolerance_g_h, max_intake_g_h, cho_per_unit_g, tau_absorption)
+    lo, hi = 0, math.ceil(max_intake_g_h / tolerance_g_h)
+
+    def margins(rate):
+        return reserve_margins(simulate_metabolism_gradients(
+            tank, duration, rate, cho_per_unit_g, crossover_pct, tau_absorption, subj, params, mix_type_input=mix_type,
+            intensity_series=intensity_series, metabolic_curve=curve_data, intake_mode=intake_mode,
+            intake_cutoff_min=intake_cutoff_min, variability_index=variability_index,
+            parameters=("intake_g_h",), clamp_reserves=False, series=series
+        ))
+
+    gradient_evaluations = 0
+    if probe(lo)['feasible']:
+        solution = lo
+    elif not probe(hi)['feasible']:
+        solution = None
+    else:
+        # Newton sul margine continuo: intervallo [low, high] con margine(low) <= 0 < margine(high)
+        low, high = 0.0, float(max_intake_g_h)
+        rate = 0.0
+        for _ in range(NEWTON_MAX_ITERATIONS):
+            current = margins(rate)
+            gradient_evaluations += 1
+            if min(value for value, _ in current.values()) > 0:
+                high = rate
+            else:
+                low = rate
+            # Passo sul vincolo più stretto fra quelli che l'intake sposta (il muscolo di solito no)
+            sloped = [(value, slope) for value, slope in current.values() if slope > 0]
+            step = None
+            if sloped:
+                value, slope = min(sloped)
+                step = rate - value / slope
+            if step is None or not low < step < high:
+                step = 0.5 * (low + high)
+            converged = abs(step - rate) < tolerance_g_h
+            rate = step
+            if converged or high - low <= tolerance_g_h:
+                break
+
+        # Conferma sulla griglia: guess e vicino decidono, altrimenti bisezione sul lato giusto
+        guess = min(max(math.ceil(rate / tolerance_g_h - 1e-9), lo + 1), hi - 1)
+        if probe(guess)['feasible']:
+            solution = guess if not probe(guess - 1)['feasible'] else _bisect(probe, lo, guess - 1)
+        elif probe(guess + 1)['feasible']:
+            solution = guess + 1
+        else:
+            solution = _bisect(probe, guess + 1, hi)
+
+    result = _solution(probes, solution, hi, tolerance_g_h, max_intake_g_h)
+    result["simulations"] += gradient_evaluations
+    result["gradient_evaluations"] = gradient_evaluations
+    return result
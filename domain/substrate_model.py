@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+# Coefficienti del polinomio RER(IF) dal grado 6 al termine noto
+RER_POLYNOMIAL_COEFFS = (-0.000000149, 141.538462237, -565.128206259, 890.333333976,
+                         -691.679487060, 265.460857558, -39.525121144)
+RER_MIN = 0.70
+RER_MAX = 1.15
+CHO_RATIO_SLOPE = 3.45
+STANDARD_CROSSOVER = 75.0
+MIN_EFFECTIVE_IF = 0.3
+
+# Estremo superiore della tabella: oltre ~1.107 il polinomio resta saturo a RER_MAX
+TABLE_IF_MAX = 1.2
+DEFAULT_TABLE_POINTS = 4096
+
+
+# --- 1. POLINOMIO DI RIFERIMENTO ---
+
+def rer_polynomial(intensity_factor):
+    """Polinomio RER(IF) saturato in [0.70, 1.15]; accetta scalari o array."""
+    if_val = np.asarray(intensity_factor, dtype=float)
+    rer = np.polyval(RER_POLYNOMIAL_COEFFS, if_val)
+    return np.clip(rer, RER_MIN, RER_MAX)
+
+
+def calculate_rer_polynomial(intensity_factor):
+    """
+    Calcola il Respiratory Exchange Ratio basato sull'intensità relativa (IF).
+    Modello polinomiale standard per stimare il consumo di substrati.
+    """
+    return float(rer_polynomial(intensity_factor))
+
+
+def cho_fraction_from_rer(rer):
+    """Frazione di energia da carboidrati associata al RER (0-1)."""
+    return np.clip((np.asarray(rer, dtype=float) - RER_MIN) * CHO_RATIO_SLOPE, 0.0, 1.0)
+
+
+def crossover_shift(crossover_pct):
+    """Spostamento dell'IF dovuto al crossover personale (0 o None = standard)."""
+    if np.ndim(crossover_pct):
+        crossover_val = np.where(np.asarray(crossover_pct, dtype=float) != 0, crossover_pct, STANDARD_CROSSOVER)
+    else:
+        crossover_val = crossover_pct if crossover_pct else STANDARD_CROSSOVER
+    return (STANDARD_CROSSOVER - crossover_val) / 100.0
+
+
+# --- 2. TABELLA DENSA IF -> (RER, FRAZIONE CHO) ---
+
+def _kink_points(lo, hi):
+    """IF in cui il polinomio tocca le saturazioni (RER e frazione CHO): nodi obbligati della tabella."""
+    knots = []
+    for level in (RER_MIN, RER_MAX, RER_MIN + 1.0 / CHO_RATIO_SLOPE):
+        coeffs = np.array(RER_POLYNOMIAL_COEFFS)
+        coeffs[-1] -= level
+        roots = np.roots(coeffs)
+        real = roots[np.abs(roots.imag) < 1e-9].real
+        knots.extend(r for r in real if lo < r < hi)
+    return np.array(knots, dtype=float)
+
+
+@lru_cache(maxsize=8)
+def _effective_table(n_points):
+    """Griglia sull'IF effettivo (già traslato e limitato a 0.3), condivisa da tutti i crossover."""
+    grid = np.union1d(np.linspace(MIN_EFFECTIVE_IF, TABLE_IF_MAX, n_points),
+                      _kink_points(MIN_EFFECTIVE_IF, TABLE_IF_MAX))
+    rer = rer_polynomial(grid)
+    cho = cho_fraction_from_rer(rer)
+
+    # Errore massimo dell'interpolazione lineare, misurato su una griglia di controllo 10x più fitta
+    check = np.linspace(MIN_EFFECTIVE_IF, TABLE_IF_MAX, 10 * n_points + 7)
+    exact_rer = rer_polynomial(check)
+    max_rer_error = float(np.max(np.abs(np.interp(check, grid, rer) - exact_rer)))
+    max_cho_error = float(np.max(np.abs(np.interp(check, grid, cho) - cho_fraction_from_rer(exact_rer))))
+
+    for arr in (grid, rer, cho):
+        arr.setflags(write=False)
+    return grid, rer, cho, max_rer_error, max_cho_error
+
+
+@dataclass(frozen=True)
+class SubstrateTable:
+    """
+    Ripartizione dei substrati tabulata sull'IF istantaneo per un crossover dato.
+    Sotto la griglia vale il limite IF effettivo 0.3, sopra il RER è saturo: np.interp
+    estende i valori di bordo, quindi la tabella copre qualsiasi IF.
+    """
+    crossover_pct: float
+    if_grid: np.ndarray
+    rer: np.ndarray
+    cho_fraction: np.ndarray
+    max_error: float
+    max_cho_error: float
+
+    def __len__(self):
+        return len(self.if_grid)
+
+    def lookup(self, if_moment):
+        """(RER, frazione CHO base) per un IF scalare o un array di qualsiasi forma."""
+        x = np.asarray(if_moment, dtype=float)
+        return np.interp(x, self.if_grid, self.rer), np.interp(x, self.if_grid, self.cho_fraction)
+
+    def cho_fraction_at(self, if_moment):
+        return np.interp(np.asarray(if_moment, dtype=float), self.if_grid, self.cho_fraction)
+
+
+@lru_cache(maxsize=64)
+def _cached_table(crossover_pct, n_points):
+    grid, rer, cho, max_rer_error, max_cho_error = _effective_table(n_points)
+    if_grid = grid - crossover_shift(crossover_pct)
+    if_grid.setflags(write=False)
+    return SubstrateTable(crossover_pct, if_grid, rer, cho, max_rer_error, max_cho_error)
+
+
+def substrate_table(crossover_pct=STANDARD_CROSSOVER, n_points=DEFAULT_TABLE_POINTS):
+    """Tabella costruita una sola volta per crossover (cache di processo)."""
+    crossover_val = float(crossover_pct) if crossover_pct else STANDARD_CROSSOVER
+    return _cached_table(crossover_val, int(n_points))
+
+
+def substrate_partition(if_moment, crossover_pct, n_points=DEFAULT_TABLE_POINTS):
+    """
+    (RER, frazione CHO base) per una serie di IF.
+    Con crossover scalare usa la tabella del crossover; con un crossover per scenario
+    (array broadcastabile con if_moment) trasla la query sulla griglia dell'IF effettivo.
+    """
+    if not np.ndim(crossover_pct):
+        return substrate_table(crossover_pct, n_points).lookup(if_moment)
+    grid, rer, cho, _, _ = _effective_table(int(n_points))
+    effective_if = np.asarray(if_moment, dtype=float) + crossover_shift(crossover_pct)
+    return np.interp(effective_if, grid, rer), np.interp(effective_if, grid, cho)
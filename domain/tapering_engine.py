@@ -1,6 +1,20 @@
+import functools
+
+import numpy as np
 import pandas as pd
 
 from data_models import Subject, GlycogenState
+from domain.substrate_model import substrate_table
+
+# Costanti fisiologiche orarie del tapering
+LIVER_DRAIN_H = 4.0          # Consumo cervello/organi (g/h)
+MAX_LIVER_G = 100.0
+WORK_LIVER_SHARE = 0.15      # Quota epatica del consumo di allenamento
+SAFE_LIVER_G = 20.0          # Sopra questa soglia la zona è "Sicura"
+
+# Stato orario: codici e etichette (colonna Status)
+STATUS_REST, STATUS_SLEEP, STATUS_WORK = 0, 1, 2
+STATUS_LABELS = np.array(["REST", "SLEEP", "WORK"], dtype=object)
 
 
 def calculate_tank(subject: Subject):
@@ -46,7 +60,8 @@ def calculate_tank(subject: Subject):
     }
 
 
-def calculate_hourly_tapering(subject, days_data, start_state: GlycogenState = GlycogenState.NORMAL):
+def calculate_hourly_tapering_reference(subject, days_data, start_state: GlycogenState = GlycogenState.NORMAL):
+    """Versione a ciclo ora per ora (riferimento per calculate_hourly_tapering)."""
 
     # 1. Inizializzazione Serbatoi
     tank = calculate_tank(subject)
@@ -64,6 +79,9 @@ def calculate_hourly_tapering(subject, days_data, start_state: GlycogenState = G
     LIVER_DRAIN_H = 4.0  # Consumo cervello/organi (g/h)
     NEAT_DRAIN_H = (1.0 * subject.weight_kg) / 16.0  # NEAT spalmato sulle 16h di veglia (g/h)
 
+    # Stessa ripartizione IF -> frazione CHO del motore gara (crossover standard)
+    rer_table = substrate_table()
+
     # Ciclo sui Giorni
     for day_idx, day in enumerate(days_data):
         date_label = day['date_obj'].strftime("%d/%m")
@@ -130,10 +148,8 @@ def calculate_hourly_tapering(subject, days_data, start_state: GlycogenState = G
                 intensity = day.get('calculated_if', 0)
                 # Stima Kcal/h lavoro
                 kcal_work = (day.get('val', 0) * 60) / 4.184 / 0.22 if day.get('type') == 'Ciclismo' else 600 * intensity
-                # CHO usage durante lavoro (dipende da intensità, usiamo stima RER macro)
-                # IF 0.6 -> 20% CHO, IF 0.8 -> 60% CHO, IF 0.9 -> 80% CHO
-                cho_pct = max(0, (intensity - 0.5) * 2.5)
-                cho_pct = min(1.0, cho_pct)
+                # CHO usage durante lavoro: tabella RER condivisa con il motore gara
+                cho_pct = float(rer_table.cho_fraction_at(intensity))
                 g_cho_work = (kcal_work * cho_pct) / 4.1
 
                 # Split consumo lavoro (Muscolo vs Fegato)
@@ -215,3 +231,164 @@ def calculate_hourly_tapering(subject, days_data, start_state: GlycogenState = G
     final_tank['fill_pct'] = (curr_muscle + curr_liver) / (MAX_MUSCLE + MAX_LIVER) * 100
 
     return pd.DataFrame(hourly_log), final_tank
+
+
+def _clock_hours(t):
+    return t.hour + (t.minute / 60)
+
+
+@functools.lru_cache(maxsize=256)
+def day_status_mask(sleep_start, sleep_end, work_start, work_end):
+    """
+    Stato delle 24 ore (STATUS_*) per un orario di sonno/allenamento in ore decimali: condiviso
+    fra i giorni con lo stesso orario. L'allenamento prevale sul sonno (come nel riferimento).
+    """
+    hours = np.arange(24)
+    if sleep_start > sleep_end:  # Scavalca la mezzanotte (es. 23 -> 07)
+        sleeping = (hours >= sleep_start) | (hours < sleep_end)
+    else:
+        sleeping = (sleep_start <= hours) & (hours < sleep_end)
+    working = (work_start <= hours) & (hours < work_end)
+    mask = np.where(working, STATUS_WORK, np.where(sleeping, STATUS_SLEEP, STATUS_REST))
+    mask.flags.writeable = False
+    return mask
+
+
+def _work_cho_g_h(day, rer_table):
+    """CHO (g/h) consumati nelle ore di allenamento del giorno."""
+    intensity = day.get('calculated_if', 0)
+    kcal_work = (day.get('val', 0) * 60) / 4.184 / 0.22 if day.get('type') == 'Ciclismo' else 600 * intensity
+    cho_pct = float(rer_table.cho_fraction_at(intensity))
+    return (kcal_work * cho_pct) / 4.1
+
+
+def hourly_flows(subject, days_data, rer_table=None):
+    """
+    Flussi orari di tutto il diario come array (giorni x 24 in fila): stato, ingresso CHO,
+    uscite epatica e muscolare, efficienza di stoccaggio del giorno.
+    """
+    rer_table = substrate_table() if rer_table is None else rer_table
+    neat_drain_h = (1.0 * subject.weight_kg) / 16.0  # NEAT spalmato sulle 16h di veglia (g/h)
+    n_days = len(days_data)
+    status = np.empty((n_days, 24), dtype=np.int8)
+    cho_rate = np.zeros(n_days)
+    work_cho = np.zeros(n_days)
+    sleep_factor = np.zeros(n_days)
+    for d, day in enumerate(days_data):
+        work_start = _clock_hours(day['workout_start'])
+        mask = day_status_mask(_clock_hours(day['sleep_start']), _clock_hours(day['sleep_end']),
+                               work_start, work_start + day['duration'] / 60.0)
+        status[d] = mask
+        waking_hours = int(np.count_nonzero(mask == STATUS_REST))
+        cho_rate[d] = day['cho_in'] / waking_hours if waking_hours > 0 else 0
+        if (mask == STATUS_WORK).any():
+            work_cho[d] = _work_cho_g_h(day, rer_table)
+        sleep_factor[d] = day['sleep_factor']
+
+    rest = status == STATUS_REST
+    work = status == STATUS_WORK
+    hourly_in = np.where(rest, cho_rate[:, None], 0.0)
+    out_liver = np.where(work, LIVER_DRAIN_H + work_cho[:, None] * WORK_LIVER_SHARE, LIVER_DRAIN_H)
+    out_muscle = np.where(work, work_cho[:, None] * (1 - WORK_LIVER_SHARE), np.where(rest, neat_drain_h, 0.0))
+    return {
+        "status": status.ravel(),
+        "hourly_in": hourly_in.ravel(),
+        "out_liver": out_liver.ravel(),
+        "out_muscle": out_muscle.ravel(),
+        "efficiency": np.repeat(sleep_factor, 24),
+    }
+
+
+def tapering_reserves(flows, curr_muscle, curr_liver, max_muscle, max_liver=MAX_LIVER_G):
+    """
+    Bilancio ora per ora: ripartizioni (ricarica 70/30, deficit 80/20 a riposo, flussi separati in
+    allenamento) precalcolate come array, logica di overflow e clamp identica al riferimento.
+    Ritorna (muscolo, fegato) per ora.
+    """
+    net_flow = flows['hourly_in'] - (flows['out_liver'] + flows['out_muscle'])
+    real_storage = net_flow * flows['efficiency']
+    deficit = np.abs(net_flow)
+    work = flows['status'] == STATUS_WORK
+    # Deficit: allenamento -> uscite dirette (l'ingresso è nullo); riposo/sonno -> fegato 80%, muscolo 20%
+    drain_liver = np.where(work, flows['out_liver'] - flows['hourly_in'], deficit * 0.8)
+    drain_muscle = np.where(work, flows['out_muscle'], deficit * 0.2)
+
+    n = len(net_flow)
+    muscle_out = np.empty(n)
+    liver_out = np.empty(n)
+    rows = zip(
+        (net_flow > 0).tolist(), (real_storage * 0.7).tolist(), (real_storage * 0.3).tolist(),
+        drain_liver.tolist(), drain_muscle.tolist(),
+    )
+    for i, (refill, to_muscle, to_liver, d_liver, d_muscle) in enumerate(rows):
+        if refill:
+            # Overflow: l'eccesso muscolare passa al fegato
+            if curr_muscle + to_muscle > max_muscle:
+                overflow = (curr_muscle + to_muscle) - max_muscle
+                to_muscle -= overflow
+                to_liver += overflow
+            curr_muscle = min(max_muscle, curr_muscle + to_muscle)
+            curr_liver = min(max_liver, curr_liver + to_liver)
+        else:
+            curr_liver -= d_liver
+            curr_muscle -= d_muscle
+        curr_muscle = max(0, curr_muscle)
+        curr_liver = max(0, curr_liver)
+        muscle_out[i] = curr_muscle
+        liver_out[i] = curr_liver
+    return muscle_out, liver_out
+
+
+def tapering_start(subject, start_state: GlycogenState = GlycogenState.NORMAL):
+    """Serbatoio del soggetto, capienza muscolare utile e livelli iniziali (muscolo, fegato)."""
+    tank = calculate_tank(subject)
+    max_muscle = tank['max_capacity_g'] - 100
+    start_factor = start_state.factor
+    curr_muscle = min(max_muscle * start_factor, max_muscle)
+    curr_liver = min(MAX_LIVER_G * start_factor, MAX_LIVER_G)
+    return tank, max_muscle, curr_muscle, curr_liver
+
+
+def hourly_frame(days_data, status, muscle, liver):
+    """DataFrame orario (colonne del diario) per i giorni dati: timeline costruita in un colpo solo."""
+    n_days = len(days_data)
+    day_start = pd.DatetimeIndex([pd.Timestamp(day['date_obj']) for day in days_data]).as_unit("us")
+    timestamps = day_start.repeat(24) + pd.to_timedelta(np.tile(np.arange(24), n_days), unit="h").as_unit("us")
+    return pd.DataFrame({
+        "Timestamp": timestamps,
+        "Giorno": np.repeat([day['date_obj'].strftime("%d/%m") for day in days_data], 24).astype(object),
+        "Ora": np.tile(np.arange(24, dtype=np.int64), n_days),
+        "Status": STATUS_LABELS[status],
+        "Muscolare": muscle,
+        "Epatico": liver,
+        "Totale": muscle + liver,
+        "Zona": np.where(liver > SAFE_LIVER_G, "Sicura", "Rischio").astype(object),
+    })
+
+
+def final_tank_state(tank, max_muscle, curr_muscle, curr_liver):
+    """Serbatoio a fine diario (stesse chiavi di calculate_tank)."""
+    final_tank = tank.copy()
+    final_tank['muscle_glycogen_g'] = curr_muscle
+    final_tank['liver_glycogen_g'] = curr_liver
+    final_tank['actual_available_g'] = curr_muscle + curr_liver
+    final_tank['fill_pct'] = (curr_muscle + curr_liver) / (max_muscle + MAX_LIVER_G) * 100
+    return final_tank
+
+
+def calculate_hourly_tapering(subject, days_data, start_state: GlycogenState = GlycogenState.NORMAL):
+    """
+    Simulazione oraria dei giorni di scarico. Stessi risultati di calculate_hourly_tapering_reference:
+    maschere di stato per orario condivise fra i giorni, flussi orari come array, timeline costruita
+    una volta; solo il bilancio dei serbatoi (overflow e clamp) resta sequenziale.
+    Ritorna (DataFrame orario, serbatoio finale).
+    """
+    tank, max_muscle, curr_muscle, curr_liver = tapering_start(subject, start_state)
+    if days_data:
+        flows = hourly_flows(subject, days_data)
+        muscle, liver = tapering_reserves(flows, curr_muscle, curr_liver, max_muscle)
+        curr_muscle, curr_liver = float(muscle[-1]), float(liver[-1])
+        df = hourly_frame(days_data, flows['status'], muscle, liver)
+    else:
+        df = pd.DataFrame([])
+    return df, final_tank_state(tank, max_muscle, curr_muscle, curr_liver)
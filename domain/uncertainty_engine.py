@@ -0,0 +1,267 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+import numpy as np
+import pandas as pd
+
+from data_models import ChoMixType, IntakeMode
+from domain.metabolic_curve import compile_metabolic_curve
+from domain.metabolism_engine import BONK_LIVER_G, BONK_MUSCLE_G
+from domain.tapering_engine import calculate_tank
+from domain.vectorized_engine import (
+    build_intensity_timeline, exogenous_oxidation_batch, exogenous_target, glycogen_recurrence_batch,
+    intake_series, intensity_values, kcal_demand_series, resolve_activity, resolve_max_exo_rate, substrate_series
+)
+
+# Parametri campionabili: campi del Subject, chiavi di activity_params e input del motore
+UNCERTAIN_PARAMETERS = (
+    "glycogen_conc_g_kg",   # Subject: concentrazione glicogeno (g/kg muscolo)
+    "body_fat_pct",         # Subject: massa grassa (frazione)
+    "efficiency",           # activity_params: efficienza lorda (%)
+    "tau_absorption",       # costante di assorbimento (min)
+    "crossover_pct",        # crossover point (% soglia)
+    "oxidation_efficiency", # frazione dei CHO ingeriti effettivamente ossidabile
+)
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+# --- 1. DISTRIBUZIONI ---
+
+@dataclass(frozen=True)
+class Distribution:
+    """
+    Distribuzione di un parametro incerto, troncata a [low, high].
+    kind: 'normal' (loc=media, scale=dev. std), 'uniform' (tra low e high),
+    'triangular' (moda loc tra low e high) o 'fixed' (valore loc).
+    """
+    kind: str
+    loc: float = 0.0
+    scale: float = 0.0
+    low: float = -math.inf
+    high: float = math.inf
+
+    def sample(self, rng, n):
+        if self.kind == 'normal':
+            values = rng.normal(self.loc, self.scale, n)
+        elif self.kind == 'uniform':
+            values = rng.uniform(self.low, self.high, n)
+        elif self.kind == 'triangular':
+            values = rng.triangular(self.low, self.loc, self.high, n)
+        elif self.kind == 'fixed':
+            values = np.full(n, float(self.loc))
+        else:
+            raise ValueError(f"Distribuzione non supportata: {self.kind}")
+        return np.clip(values, self.low, self.high)
+
+
+def default_distributions(subject_obj, activity_params, tau_absorption=20, crossover_pct=75,
+                          oxidation_efficiency=0.80, spread=1.0):
+    """
+    Incertezze tipiche (1 dev. std) attorno alle stime puntuali usate dall'app:
+    concentrazione da VO2max ±10%, massa grassa ±10%, efficienza ±1 punto,
+    tau ±25%, crossover ±5 punti, efficienza di ossidazione ±0.05.
+    spread moltiplica tutte le deviazioni standard.
+    """
+    efficiency = activity_params.get('efficiency', 22.0)
+    crossover = crossover_pct if crossover_pct else 75
+    return {
+        "glycogen_conc_g_kg": Distribution('normal', subject_obj.glycogen_conc_g_kg,
+                                           subject_obj.glycogen_conc_g_kg * 0.10 * spread, low=8.0, high=35.0),
+        "body_fat_pct": Distribution('normal', subject_obj.body_fat_pct,
+                                     subject_obj.body_fat_pct * 0.10 * spread, low=0.03, high=0.60),
+        "efficiency": Distribution('normal', efficiency, 1.0 * spread, low=15.0, high=30.0),
+        "tau_absorption": Distribution('normal', tau_absorption, tau_absorption * 0.25 * spread, low=5.0, high=90.0),
+        "crossover_pct": Distribution('normal', crossover, 5.0 * spread, low=50.0, high=90.0),
+        "oxidation_efficiency": Distribution('normal', oxidation_efficiency, 0.05 * spread, low=0.50, high=1.0),
+    }
+
+
+def sample_parameters(distributions, rng, n):
+    """Campiona n valori per ogni parametro incerto (dict nome -> array)."""
+    unknown = set(distributions) - set(UNCERTAIN_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Parametri non campionabili: {sorted(unknown)}")
+    return {name: dist.sample(rng, n) for name, dist in distributions.items()}
+
+
+# --- 2. SIMULAZIONE DI UN BLOCCO DI CAMPIONI ---
+
+def sample_tanks(tank, subject_obj, samples, n):
+    """
+    Riserve iniziali per campione. Il serbatoio di partenza (eventuali override inclusi)
+    viene scalato con il rapporto tra il tank del soggetto campionato e quello nominale.
+    """
+    muscle = np.full(n, float(tank['muscle_glycogen_g']))
+    liver = np.full(n, float(tank['liver_glycogen_g']))
+    subject_fields = [name for name in ("glycogen_conc_g_kg", "body_fat_pct") if name in samples]
+    if not subject_fields:
+        return muscle, liver
+
+    nominal = calculate_tank(subject_obj)
+    if nominal['muscle_glycogen_g'] <= 0:
+        return muscle, liver
+    for i in range(n):
+        sampled = replace(subject_obj, **{name: float(samples[name][i]) for name in subject_fields})
+        muscle[i] *= calculate_tank(sampled)['muscle_glycogen_g'] / nominal['muscle_glycogen_g']
+    return muscle, liver
+
+
+def simulate_samples(context, samples, n):
+    """
+    Simula n campioni in lock-step (array tempo x campioni), senza DataFrame.
+    Ritorna (residuo muscolare, residuo epatico, minuto di crisi per campione; -1 se assente).
+    """
+    subject_obj = context['subject_obj']
+    activity = resolve_activity(context['activity_params'], subject_obj)
+    activity['gross_efficiency'] = samples.get('efficiency', activity['gross_efficiency'])
+    t, values, if_moment = build_intensity_timeline(
+        context['duration_min'], activity, context['intensity_series'], context['variability_index']
+    )
+    col_t, col_values, col_if = t[:, None], values[:, None], if_moment[:, None]
+
+    kcal_demand = kcal_demand_series(col_t, col_values, col_if, activity)
+    crossover = samples.get('crossover_pct', context['crossover_pct'])
+    cho_g_min, _, _, _ = substrate_series(col_t, col_values, col_if, kcal_demand, crossover, context['metabolic_curve'])
+    cho_g_min = np.broadcast_to(cho_g_min, (len(t), n))
+
+    rate = context['constant_carb_intake_g_h']
+    ox_eff = samples.get('oxidation_efficiency', context['oxidation_efficiency_input'])
+    tau = samples.get('tau_absorption', context['tau_absorption'])
+    max_exo = resolve_max_exo_rate(context['custom_max_exo_rate'], subject_obj, activity, context['mix_type_input'])
+    target = np.broadcast_to(exogenous_target(rate, max_exo, ox_eff), (n,))
+    alpha = np.broadcast_to(1 - np.exp(-1.0 / np.asarray(tau, dtype=float)), (n,))
+
+    intake_g = intake_series(
+        t, context['duration_min'], rate, context['cho_per_unit_g'],
+        context['intake_mode'], context['intake_cutoff_min']
+    )
+    exo_g_min, _ = exogenous_oxidation_batch(np.broadcast_to(intake_g[:, None], (len(t), n)), target, alpha, ox_eff)
+
+    muscle0, liver0 = sample_tanks(context['tank'], subject_obj, samples, n)
+    state = glycogen_recurrence_batch(cho_g_min, exo_g_min, muscle0, liver0)
+
+    bonk = (state['liver'] <= BONK_LIVER_G) | (state['muscle'] <= BONK_MUSCLE_G)
+    bonk_minute = np.where(bonk.any(axis=0), bonk.argmax(axis=0), -1)
+    return state['muscle'], state['liver'], bonk_minute
+
+
+def _simulate_chunk(task):
+    """Unità di lavoro del pool: campiona con il proprio stream RNG e simula il blocco."""
+    seed_seq, n, distributions, context = task
+    rng = np.random.default_rng(seed_seq)
+    samples = sample_parameters(distributions, rng, n)
+    muscle, liver, bonk_minute = simulate_samples(context, samples, n)
+    return muscle.astype(np.float32), liver.astype(np.float32), bonk_minute, samples
+
+
+# --- 3. MONTE CARLO ---
+
+@dataclass
+class MonteCarloResult:
+    """
+    Bande percentili delle riserve (dict percentile -> array sul tempo) e
+    probabilità cumulata di crisi (fegato vuoto o muscolo < 20 g) entro ogni minuto.
+    """
+    time: np.ndarray
+    percentiles: tuple
+    muscle_bands: dict
+    liver_bands: dict
+    total_bands: dict
+    bonk_probability: np.ndarray
+    bonk_minutes: np.ndarray
+    samples: dict = field(repr=False)
+    n_samples: int = 0
+    seed: int = 0
+
+    @property
+    def final_bonk_probability(self):
+        return float(self.bonk_probability[-1]) if len(self.bonk_probability) else 0.0
+
+    def bands_frame(self, reserve='total'):
+        """DataFrame (Time, P5, P25, ...) di una riserva: 'total', 'muscle' o 'liver'."""
+        bands = {'total': self.total_bands, 'muscle': self.muscle_bands, 'liver': self.liver_bands}[reserve]
+        data = {"Time (min)": self.time}
+        data.update({f"P{p:g}": bands[p] for p in self.percentiles})
+        data["Prob. Crisi"] = self.bonk_probability
+        return pd.DataFrame(data)
+
+
+def chunk_sizes(n_samples, chunk_size):
+    """Divide n_samples in blocchi di dimensione quasi uguale (al massimo chunk_size)."""
+    n_chunks = max(1, math.ceil(n_samples / chunk_size))
+    base, extra = divmod(n_samples, n_chunks)
+    return [base + (1 if i < extra else 0) for i in range(n_chunks)]
+
+
+def run_monte_carlo(tank, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+                    tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80,
+                    custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY,
+                    intensity_series=None, metabolic_curve=None,
+                    intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0,
+                    distributions=None, n_samples=2000, seed=0, n_workers=None, chunk_size=500,
+                    percentiles=DEFAULT_PERCENTILES):
+    """
+    Ripete la simulazione di gara su n_samples combinazioni di parametri incerti.
+    I campioni sono divisi in blocchi fissi, ognuno con il proprio stream RNG
+    (SeedSequence.spawn), quindi il risultato dipende solo da seed e chunk_size e
+    non dal numero di processi. Con n_workers=1 tutto gira nel processo corrente.
+    """
+    if distributions is None:
+        distributions = default_distributions(
+            subject_obj, activity_params, tau_absorption, crossover_pct, oxidation_efficiency_input
+        )
+    context = {
+        "tank": tank,
+        "duration_min": duration_min,
+        "constant_carb_intake_g_h": constant_carb_intake_g_h,
+        "cho_per_unit_g": cho_per_unit_g,
+        "crossover_pct": crossover_pct,
+        "tau_absorption": tau_absorption,
+        "subject_obj": subject_obj,
+        "activity_params": activity_params,
+        "oxidation_efficiency_input": oxidation_efficiency_input,
+        "custom_max_exo_rate": custom_max_exo_rate,
+        "mix_type_input": mix_type_input,
+        "intensity_series": None if intensity_series is None else intensity_values(intensity_series),
+        "metabolic_curve": compile_metabolic_curve(metabolic_curve),
+        "intake_mode": intake_mode,
+        "intake_cutoff_min": intake_cutoff_min,
+        "variability_index": variability_index,
+    }
+
+    sizes = chunk_sizes(n_samples, chunk_size)
+    streams = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(stream, size, distributions, context) for stream, size in zip(streams, sizes)]
+
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers <= 1 or len(tasks) == 1:
+        chunks = [_simulate_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks))) as pool:
+            chunks = list(pool.map(_simulate_chunk, tasks))
+
+    muscle = np.concatenate([c[0] for c in chunks], axis=1)
+    liver = np.concatenate([c[1] for c in chunks], axis=1)
+    bonk_minutes = np.concatenate([c[2] for c in chunks])
+    samples = {name: np.concatenate([c[3][name] for c in chunks]) for name in distributions}
+
+    def bands(values):
+        levels = np.percentile(values, percentiles, axis=1)
+        return {p: levels[k] for k, p in enumerate(percentiles)}
+
+    n_steps = muscle.shape[0]
+    bonk_counts = np.bincount(bonk_minutes[bonk_minutes >= 0], minlength=n_steps)
+    return MonteCarloResult(
+        time=np.arange(n_steps),
+        percentiles=tuple(percentiles),
+        muscle_bands=bands(muscle),
+        liver_bands=bands(liver),
+        total_bands=bands(muscle + liver),
+        bonk_probability=np.cumsum(bonk_counts) / n_samples,
+        bonk_minutes=bonk_minutes,
+        samples=samples,
+        n_samples=n_samples,
+        seed=seed,
+    )
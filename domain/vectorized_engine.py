@@ -0,0 +1,898 @@
+import math
+from dataclasses import dataclass, field
+import numpy as np
+
+from data_models import ChoMixType, IntakeMode, IntakePlan, IntensitySeries
+from domain.gut_model import (
+    GUT_MODEL_BUCKET, GUT_MODEL_COMPARTMENTS, GUT_MODELS, compartment_oxidation_series, glucose_fraction
+)
+from domain.metabolism_engine import BONK_LIVER_G, BONK_MUSCLE_G, estimate_max_exogenous_oxidation
+from domain.metabolic_curve import MetabolicCurve, compile_metabolic_curve
+from domain.result_schema import share_pct, status_categorical, typed_result_frame
+from domain.substrate_model import substrate_partition
+
+# Costanti del modello (identiche al motore di riferimento in domain.metabolism_engine)
+MAX_LIVER_OUTPUT_G_MIN = 1.2
+MUSCLE_CONTRIBUTION_EXPONENT = 0.6
+LAB_CHO_DRIFT_PER_MIN = 0.0006   # Deriva CHO dopo 60' con curva di laboratorio
+LAB_FAT_DRIFT_PER_MIN = 0.0003   # Deriva FAT dopo 60' con curva di laboratorio
+
+
+
+# --- 1. PARAMETRI ATTIVITÀ ---
+
+def resolve_activity(activity_params, subject_obj):
+    """
+    Estrae i parametri dell'attività e le grandezze di riferimento (IF, kcal base)
+    con le stesse regole di simulate_metabolism.
+    """
+    avg_watts = activity_params.get('avg_watts', 200)
+    np_watts = activity_params.get('np_watts', avg_watts)
+    ftp_watts = activity_params.get('ftp_watts', 250)
+    threshold_hr = activity_params.get('threshold_hr', 170)
+    gross_efficiency = activity_params.get('efficiency', 22.0)
+    mode = activity_params.get('mode', 'cycling')
+    avg_hr = activity_params.get('avg_hr', 150)
+
+    threshold_ref = ftp_watts if mode == 'cycling' else threshold_hr
+    base_val = avg_watts if mode == 'cycling' else avg_hr
+
+    if mode == 'cycling' and ftp_watts > 0:
+        intensity_factor_reference = np_watts / ftp_watts
+    elif threshold_ref > 0:
+        intensity_factor_reference = base_val / threshold_ref
+    else:
+        intensity_factor_reference = 0.8
+
+    if mode == 'cycling':
+        kcal_per_min_base = (avg_watts * 60) / 4184 / (gross_efficiency / 100.0)
+    else:
+        vo2_estimated_relative = subject_obj.vo2_max * 0.90 * intensity_factor_reference
+        vo2_estimated_absolute = (vo2_estimated_relative * subject_obj.weight_kg) / 1000.0
+        kcal_per_min_base = vo2_estimated_absolute * 4.85
+
+    return {
+        "mode": mode,
+        "avg_watts": avg_watts,
+        "ftp_watts": ftp_watts,
+        "gross_efficiency": gross_efficiency,
+        "threshold_ref": threshold_ref,
+        "base_val": base_val,
+        "intensity_factor_reference": intensity_factor_reference,
+        "kcal_per_min_base": kcal_per_min_base,
+    }
+
+
+# --- 2. SERIE PRECALCOLATE (INDIPENDENTI DAL GLICOGENO) ---
+
+def n_time_steps(duration_min, step_s=60):
+    """Numero di campioni della timeline (estremi inclusi) per un passo di step_s secondi."""
+    if step_s == 60:
+        return int(duration_min) + 1
+    if step_s <= 0 or 60 % step_s:
+        raise ValueError(f"Passo temporale non supportato: {step_s}s (deve dividere 60)")
+    return int(round(duration_min * 60)) // int(step_s) + 1
+
+
+def intensity_values(intensity_series, step_s=60):
+    """
+    Valori della serie di intensità al passo del motore. Una IntensitySeries viene ricampionata
+    (una sola volta) dalla sua frequenza; una lista semplice è un valore al minuto.
+    """
+    if isinstance(intensity_series, IntensitySeries):
+        return intensity_series.values_at_step(step_s)
+    series = np.asarray(intensity_series, dtype=float)
+    if step_s != 60:
+        series = np.repeat(series, 60 // int(step_s))
+    return series
+
+
+def build_intensity_timeline(duration_min, activity, intensity_series=None, variability_index=1.0, step_s=60):
+    """
+    Ritorna (t, valore istantaneo, IF istantaneo) su tutta la durata.
+    t è in minuti, un campione ogni step_s secondi (default: uno al minuto).
+    """
+    n = n_time_steps(duration_min, step_s)
+    t = np.arange(n) if step_s == 60 else np.arange(n) * (step_s / 60.0)
+    threshold_ref = activity['threshold_ref']
+
+    values = np.full(n, float(activity['base_val']))
+    if_moment = np.full(n, float(activity['intensity_factor_reference']))
+
+    n_series = 0
+    if intensity_series is not None:
+        series = intensity_values(intensity_series, step_s)
+        n_series = min(len(series), n)
+        values[:n_series] = series[:n_series]
+        if threshold_ref > 0:
+            if_moment[:n_series] = values[:n_series] / threshold_ref
+        else:
+            if_moment[:n_series] = 0.8
+
+    # Il VI si applica solo ai minuti non coperti dalla serie
+    if variability_index > 1.0:
+        if_moment[n_series:] *= variability_index
+
+    return t, values, if_moment
+
+
+def kcal_demand_series(t, values, if_moment, activity):
+    """Domanda energetica (kcal/min) con perdita di efficienza / drift dopo il minuto 60."""
+    if activity['mode'] == 'cycling':
+        gross_efficiency = activity['gross_efficiency']
+        current_eff = np.where(t > 60, np.maximum(15.0, gross_efficiency - (t - 60) * 0.02), gross_efficiency)
+        return (values * 60) / 4184 / (current_eff / 100.0)
+
+    drift_factor = np.where(t > 60, 1.0 + (t - 60) * 0.0005, 1.0)
+    if_reference = activity['intensity_factor_reference']
+    demand_scaling = if_moment / if_reference if if_reference > 0 else np.ones_like(if_moment)
+    return activity['kcal_per_min_base'] * drift_factor * demand_scaling
+
+
+def interpolate_consumption_array(values, curve_data):
+    """Versione vettoriale di interpolate_consumption: ritorna (CHO g/h, FAT g/h)."""
+    curve = compile_metabolic_curve(curve_data)
+    if isinstance(curve, MetabolicCurve):
+        return curve.evaluate(values)
+    zeros = np.zeros_like(np.asarray(values, dtype=float))
+    return zeros, zeros.copy()
+
+
+def substrate_series(t, values, if_moment, kcal_demand, crossover_pct, metabolic_curve=None,
+                     cho_drift=LAB_CHO_DRIFT_PER_MIN):
+    """
+    Ripartizione CHO/FAT per ogni minuto.
+    Ritorna (CHO g/min, FAT g/min, RER, frazione CHO). Con t/valori/IF a colonna (tempo, 1)
+    e crossover o domanda per scenario il risultato ha forma (tempo, scenari).
+    """
+    if metabolic_curve is not None:
+        cho_rate_gh, fat_rate_gh = interpolate_consumption_array(values, metabolic_curve)
+        late = t > 60
+        cho_rate_gh = np.where(late, cho_rate_gh * (1.0 + ((t - 60) * cho_drift)), cho_rate_gh)
+        fat_rate_gh = np.where(late, fat_rate_gh * (1.0 - ((t - 60) * LAB_FAT_DRIFT_PER_MIN)), fat_rate_gh)
+        rer = np.full(len(t), 0.85)
+        cho_ratio = np.ones(len(t))
+        return cho_rate_gh / 60.0, fat_rate_gh / 60.0, rer, cho_ratio
+
+    # RER e frazione CHO base dalla tabella condivisa (crossover, limite IF 0.3 e saturazioni inclusi)
+    rer, base_cho_ratio = substrate_partition(if_moment, crossover_pct)
+
+    hours_past = np.maximum(t - 60, 0) / 60.0
+    metabolic_shift = 0.05 * (hours_past ** 1.2)
+    shifted = (if_moment < 0.85) & (t > 60)
+    cho_ratio = np.where(shifted, np.maximum(0.05, base_cho_ratio - metabolic_shift), base_cho_ratio)
+
+    cho_g_min = (kcal_demand * cho_ratio) / 4.1
+    fat_g_min = np.where(kcal_demand > 0, kcal_demand * (1.0 - cho_ratio) / 9.0, 0.0)
+    return cho_g_min, fat_g_min, rer, cho_ratio
+
+
+def intake_series(t, duration_min, constant_carb_intake_g_h, cho_per_unit_g, intake_mode, intake_cutoff_min,
+                  step_s=60):
+    """Grammi di CHO ingeriti in ogni passo per la strategia a rateo costante (vedi IntakePlan.from_strategy)."""
+    plan = IntakePlan.from_strategy(constant_carb_intake_g_h, cho_per_unit_g, intake_mode, duration_min,
+                                    intake_cutoff_min)
+    return plan.grams_per_step(t, step_s)
+
+
+def exogenous_oxidation_series(intake_g, effective_target, alpha, oxidation_efficiency, is_input_zero, dt_min=1.0,
+                               initial_exo=0.0, initial_gut=0.0):
+    """
+    Filtro di assorbimento del primo ordine limitato dal contenuto intestinale.
+    Non dipende dal glicogeno, quindi si risolve prima della ricorsione principale.
+    dt_min è la durata del passo in minuti (1/60 in modalità 1 Hz); initial_exo/initial_gut
+    riprendono il filtro da uno stato salvato.
+    Ritorna (ossidazione esogena g/min, gut load g).
+    """
+    n = len(intake_g)
+    exo_out = np.zeros(n)
+    gut_out = np.zeros(n)
+    if is_input_zero:
+        return exo_out, gut_out
+
+    exo = initial_exo
+    gut = initial_gut
+    for i, g_in in enumerate(intake_g.tolist()):
+        exo += alpha * (effective_target - exo)
+        if exo < 0.0:
+            exo = 0.0
+        gut += g_in * oxidation_efficiency
+        if gut < exo * dt_min:
+            exo = gut / dt_min
+        gut -= exo * dt_min
+        if gut < 0:
+            gut = 0
+        exo_out[i] = exo
+        gut_out[i] = gut
+    return exo_out, gut_out
+
+
+# --- 3. RICORSIONE GLICOGENO (UNICA PARTE DIPENDENTE DALLO STATO) ---
+
+def _stop_floors(stop_at_floors):
+    if stop_at_floors is None:
+        return -math.inf, -math.inf
+    return stop_at_floors
+
+
+def glycogen_recurrence(cho_g_min, exo_g_min, initial_muscle, initial_liver, stop_at_floors=None, dt_min=1.0,
+                        start_index=0, reference_muscle=None):
+    """
+    Ripartizione muscolo / fegato / esogeni passo per passo (dt_min minuti per passo).
+    Ritorna un dict di array: uso muscolare, epatico, esogeno (g/min) e residui.
+    Con stop_at_floors=(fegato_g, muscolo_g) gli array si fermano al primo minuto
+    in cui una riserva scende alla soglia (stop_reason indica quale).
+    Per riprendere da uno stato salvato: start_index è l'indice del primo passo e
+    reference_muscle il glicogeno muscolare iniziale della gara (riempimento relativo).
+    """
+    n = len(cho_g_min)
+    muscle_use = np.zeros(n)
+    liver_use = np.zeros(n)
+    exo_use = np.zeros(n)
+    muscle_left = np.zeros(n)
+    liver_left = np.zeros(n)
+
+    muscle = initial_muscle
+    liver = initial_liver
+    muscle_ref = initial_muscle if reference_muscle is None else reference_muscle
+    exponent = MUSCLE_CONTRIBUTION_EXPONENT
+    liver_cap = MAX_LIVER_OUTPUT_G_MIN
+    liver_floor, muscle_floor = _stop_floors(stop_at_floors)
+    stop_reason = None
+    n_done = n
+
+    for i, (cho, exo) in enumerate(zip(cho_g_min.tolist(), exo_g_min.tolist()), start=start_index):
+        if muscle <= 0:
+            from_muscle = 0.0
+        else:
+            muscle_fill_state = muscle / muscle_ref if muscle_ref > 0 else 0
+            from_muscle = cho * math.pow(muscle_fill_state, exponent)
+        blood_demand = cho - from_muscle
+        from_exo = blood_demand if blood_demand < exo else exo
+        remaining = blood_demand - from_exo
+        from_liver = remaining if remaining < liver_cap else liver_cap
+        if liver <= 0:
+            from_liver = 0.0
+
+        if i > 0:
+            muscle -= from_muscle * dt_min
+            liver -= from_liver * dt_min
+            if muscle < 0:
+                muscle = 0
+            if liver < 0:
+                liver = 0
+
+        k = i - start_index
+        muscle_use[k] = from_muscle
+        liver_use[k] = from_liver
+        exo_use[k] = from_exo
+        muscle_left[k] = muscle
+        liver_left[k] = liver
+
+        if liver <= liver_floor:
+            stop_reason = "liver"
+        elif muscle <= muscle_floor:
+            stop_reason = "muscle"
+        if stop_reason:
+            n_done = k + 1
+            break
+
+    return {
+        "muscle_use": muscle_use[:n_done],
+        "liver_use": liver_use[:n_done],
+        "exo_use": exo_use[:n_done],
+        "muscle": muscle_left[:n_done],
+        "liver": liver_left[:n_done],
+        "stop_reason": stop_reason,
+    }
+
+
+def glycogen_summary(cho_g_min, exo_g_min, initial_muscle, initial_liver, stop_at_floors=None, dt_min=1.0):
+    """
+    Stessa ricorsione di glycogen_recurrence ma senza array per minuto: conserva solo
+    minimi, minuto di crisi, totali e riserve finali. Pensata per ottimizzatori e sweep.
+    """
+    muscle = initial_muscle
+    liver = initial_liver
+    exponent = MUSCLE_CONTRIBUTION_EXPONENT
+    liver_cap = MAX_LIVER_OUTPUT_G_MIN
+    liver_floor, muscle_floor = _stop_floors(stop_at_floors)
+
+    min_liver = min_muscle = math.inf
+    min_liver_minute = min_muscle_minute = 0
+    bonk_minute = None
+    stop_reason = None
+    total_muscle = total_liver = total_exo = 0.0
+    minutes_simulated = 0
+
+    for i, (cho, exo) in enumerate(zip(cho_g_min.tolist(), exo_g_min.tolist())):
+        if muscle <= 0:
+            from_muscle = 0.0
+        else:
+            muscle_fill_state = muscle / initial_muscle if initial_muscle > 0 else 0
+            from_muscle = cho * math.pow(muscle_fill_state, exponent)
+        blood_demand = cho - from_muscle
+        from_exo = blood_demand if blood_demand < exo else exo
+        remaining = blood_demand - from_exo
+        from_liver = remaining if remaining < liver_cap else liver_cap
+        if liver <= 0:
+            from_liver = 0.0
+
+        if i > 0:
+            muscle -= from_muscle * dt_min
+            liver -= from_liver * dt_min
+            if muscle < 0:
+                muscle = 0
+            if liver < 0:
+                liver = 0
+            total_muscle += from_muscle * dt_min
+            total_liver += from_liver * dt_min
+            total_exo += from_exo * dt_min
+
+        minutes_simulated = i + 1
+        if liver < min_liver:
+            min_liver, min_liver_minute = liver, i
+        if muscle < min_muscle:
+            min_muscle, min_muscle_minute = muscle, i
+        if bonk_minute is None and (liver <= BONK_LIVER_G or muscle <= BONK_MUSCLE_G):
+            bonk_minute = i
+
+        if liver <= liver_floor:
+            stop_reason = "liver"
+        elif muscle <= muscle_floor:
+            stop_reason = "muscle"
+        if stop_reason:
+            break
+
+    return {
+        "final_muscle_g": muscle,
+        "final_liver_g": liver,
+        "min_liver_g": min_liver,
+        "min_liver_minute": min_liver_minute,
+        "min_muscle_g": min_muscle,
+        "min_muscle_minute": min_muscle_minute,
+        "bonk_minute": bonk_minute,
+        "minutes_simulated": minutes_simulated,
+        "stopped_early": stop_reason is not None,
+        "stop_reason": stop_reason,
+        "totals": {"muscle": total_muscle, "liver": total_liver, "exo": total_exo},
+    }
+
+
+def _sequential_total(values):
+    """Somma in ordine temporale (stesso arrotondamento del ciclo di riferimento)."""
+    return float(np.cumsum(values)[-1]) if len(values) else 0.0
+
+
+# --- 4. MOTORE VETTORIALE ---
+
+def is_constant_intensity(intensity_series=None, metabolic_curve=None):
+    """Senza serie né curva di laboratorio l'intensità è costante: la domanda dipende solo da t."""
+    return intensity_series is None and metabolic_curve is None
+
+
+def constant_intensity_series(t, activity, crossover_pct, variability_index=1.0):
+    """
+    Percorso rapido a intensità costante: IF e ripartizione base sono scalari (una sola lettura
+    della tabella dei substrati), efficienza / drift e shift metabolico restano espressioni in t.
+    Stessi valori di build_intensity_timeline + kcal_demand_series + substrate_series.
+    Ritorna (valori, IF, kcal/min, CHO g/min, FAT g/min, RER, frazione CHO).
+    """
+    n = len(t)
+    value = float(activity['base_val'])
+    if_value = float(activity['intensity_factor_reference'])
+    if variability_index > 1.0:
+        if_value *= variability_index
+    kcal_demand = kcal_demand_series(t, value, if_value, activity)
+    cho_g_min, fat_g_min, rer, cho_ratio = substrate_series(t, value, if_value, kcal_demand, crossover_pct)
+    return (np.full(n, value), np.full(n, if_value), np.broadcast_to(kcal_demand, (n,)).copy(), cho_g_min,
+            fat_g_min, np.full(n, float(rer)), np.broadcast_to(cho_ratio, (n,)).copy())
+
+
+def prepare_demand_series(duration_min, crossover_pct, subject_obj, activity_params,
+                          intensity_series=None, metabolic_curve=None, variability_index=1.0,
+                          cho_drift=LAB_CHO_DRIFT_PER_MIN, step_s=60):
+    """
+    Serie condivise da tutti gli scenari con lo stesso soggetto e la stessa intensità:
+    timeline, domanda energetica e ripartizione dei substrati (un campione ogni step_s secondi).
+    """
+    activity = resolve_activity(activity_params, subject_obj)
+    metabolic_curve = compile_metabolic_curve(metabolic_curve)
+    if is_constant_intensity(intensity_series, metabolic_curve):
+        n = n_time_steps(duration_min, step_s)
+        t = np.arange(n) if step_s == 60 else np.arange(n) * (step_s / 60.0)
+        values, if_moment, kcal_demand, cho_g_min, fat_g_min, rer, cho_ratio = constant_intensity_series(
+            t, activity, crossover_pct, variability_index
+        )
+    else:
+        t, values, if_moment = build_intensity_timeline(
+            duration_min, activity, intensity_series, variability_index, step_s=step_s
+        )
+        kcal_demand = kcal_demand_series(t, values, if_moment, activity)
+        cho_g_min, fat_g_min, rer, cho_ratio = substrate_series(
+            t, values, if_moment, kcal_demand, crossover_pct, metabolic_curve, cho_drift=cho_drift
+        )
+    return {
+        "activity": activity,
+        "step_s": step_s,
+        "dt_min": step_s / 60.0,
+        "t": t,
+        "values": values,
+        "if_moment": if_moment,
+        "kcal_demand": kcal_demand,
+        "cho_g_min": cho_g_min,
+        "fat_g_min": fat_g_min,
+        "rer": rer,
+        "cho_ratio": cho_ratio,
+    }
+
+
+def resolve_max_exo_rate(custom_max_exo_rate, subject_obj, activity, mix_type):
+    if custom_max_exo_rate is not None:
+        return custom_max_exo_rate
+    return estimate_max_exogenous_oxidation(
+        subject_obj.height_cm, subject_obj.weight_kg, activity['ftp_watts'], mix_type
+    )
+
+
+def plan_max_exo_rate(custom_max_exo_rate, subject_obj, activity, mix_type, intake_plan):
+    """Ossidazione esogena massima del piano: prodotti diversi pesati sui grammi assunti."""
+    if custom_max_exo_rate is not None:
+        return custom_max_exo_rate
+    return intake_plan.blended(lambda mix: resolve_max_exo_rate(None, subject_obj, activity, mix), mix_type)
+
+
+def exogenous_target(constant_carb_intake_g_h, max_exo_rate_g_min, oxidation_efficiency):
+    if constant_carb_intake_g_h == 0:
+        return 0.0
+    return min(constant_carb_intake_g_h / 60.0, max_exo_rate_g_min) * oxidation_efficiency
+
+
+def summary_stats(series, duration_min, final_muscle, final_liver, totals, n_steps=None):
+    """Dizionario stats con le stesse chiavi del motore di riferimento (fino a n_steps passi simulati)."""
+    activity = series['activity']
+    dt_min = series.get('dt_min', 1.0)
+    n_steps = len(series['t']) if n_steps is None else n_steps
+    total_kcal_final = (activity['avg_watts'] * duration_min * 60) / 4184 / (activity['gross_efficiency'] / 100)
+    return {
+        "final_glycogen": float(final_muscle + final_liver),
+        "total_muscle_used": totals['muscle'],
+        "total_liver_used": totals['liver'],
+        "total_exo_used": totals['exo'],
+        "fat_total_g": _sequential_total(series['fat_g_min'][1:n_steps] * dt_min),
+        "kcal_total_h": total_kcal_final,
+        "intensity_factor": activity['intensity_factor_reference'],
+        "avg_rer": float(series['rer'][n_steps - 1]),
+        "cho_pct": float(series['cho_ratio'][n_steps - 1] * 100)
+    }
+
+
+def run_intake_scenario(series, subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g,
+                        tau_absorption, subject_obj, oxidation_efficiency_input=0.80, custom_max_exo_rate=None,
+                        mix_type_input=ChoMixType.GLUCOSE_ONLY, intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0,
+                        summary_only=False, stop_at_floors=None, intake_plan=None, gut_model=GUT_MODEL_BUCKET):
+    """
+    Esegue una strategia di intake sulle serie già preparate da prepare_demand_series.
+    intake_plan (IntakePlan) sostituisce intake/unità/modalità/cutoff con un piano esplicito;
+    senza piano si usa quello equivalente alla strategia a rateo costante.
+    gut_model: "bucket" (serbatoio unico, default) o "compartments" (domain.gut_model).
+    Ritorna (intake g, ossidazione esogena g/min, gut load g, stato glicogeno); con
+    summary_only lo stato è il dict di aggregati di glycogen_summary.
+    """
+    step_s = series.get('step_s', 60)
+    dt_min = series.get('dt_min', 1.0)
+    if intake_plan is None:
+        intake_plan = IntakePlan.from_strategy(
+            constant_carb_intake_g_h, cho_per_unit_g, intake_mode, duration_min, intake_cutoff_min
+        )
+    rate_g_h = intake_plan.rate_g_h(duration_min)
+    max_exo_rate_g_min = plan_max_exo_rate(
+        custom_max_exo_rate, subject_obj, series['activity'], mix_type_input, intake_plan
+    )
+    effective_target = exogenous_target(rate_g_h, max_exo_rate_g_min, oxidation_efficiency_input)
+    alpha = 1 - np.exp(-dt_min / tau_absorption)
+
+    intake_g = intake_plan.grams_per_step(series['t'], step_s)
+    if gut_model == GUT_MODEL_COMPARTMENTS:
+        # Stesso tetto di ossidazione del modello storico a intake saturante (capacità x efficienza)
+        exo_g_min, gut_load, _ = compartment_oxidation_series(
+            intake_g, max_exo_rate_g_min * oxidation_efficiency_input, tau_absorption,
+            intake_plan.blended(glucose_fraction, mix_type_input), oxidation_efficiency_input, dt_min=dt_min
+        )
+    elif gut_model == GUT_MODEL_BUCKET:
+        exo_g_min, gut_load = exogenous_oxidation_series(
+            intake_g, effective_target, alpha, oxidation_efficiency_input, rate_g_h == 0, dt_min=dt_min
+        )
+    else:
+        raise ValueError(f"Modello intestinale non valido: {gut_model} ({' | '.join(GUT_MODELS)})")
+    kernel = glycogen_summary if summary_only else glycogen_recurrence
+    state = kernel(
+        series['cho_g_min'], exo_g_min, subject_data['muscle_glycogen_g'], subject_data['liver_glycogen_g'],
+        stop_at_floors=stop_at_floors, dt_min=dt_min
+    )
+    return intake_g, exo_g_min, gut_load, state
+
+
+def simulate_metabolism_vectorized(subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+                                   tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80,
+                                   custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY,
+                                   intensity_series=None, metabolic_curve=None,
+                                   intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0,
+                                   summary_only=False, stop_at_floors=None, time_step_s=60, intake_plan=None,
+                                   gut_model=GUT_MODEL_BUCKET):
+    """
+    Stessa firma e stessi risultati di domain.metabolism_engine.simulate_metabolism (che resta
+    l'implementazione di riferimento, con il polinomio RER esatto: qui la tabella dei substrati,
+    entro il suo max_error). intake_plan (IntakePlan) sostituisce la strategia a rateo
+    costante con un piano esplicito (es. rifornimenti ai ristori, prodotti diversi).
+    Domanda, RER, intake e ossidazione esogena sono calcolati su tutta la timeline con NumPy;
+    solo la ripartizione muscolo/fegato resta un ciclo.
+    gut_model="compartments" usa il modello intestinale multi-compartimento (domain.gut_model).
+    time_step_s < 60 (es. 1 per FIT a 1 Hz) integra al passo indicato; tabella e minuti
+    restituiti restano per minuto.
+    """
+    series = prepare_demand_series(
+        duration_min, crossover_pct, subject_obj, activity_params,
+        intensity_series, metabolic_curve, variability_index, step_s=time_step_s
+    )
+    dt_min = series['dt_min']
+    intake_g, exo_g_min, gut_load, state = run_intake_scenario(
+        series, subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g, tau_absorption,
+        subject_obj, oxidation_efficiency_input, custom_max_exo_rate, mix_type_input,
+        intake_mode, intake_cutoff_min, summary_only=summary_only, stop_at_floors=stop_at_floors,
+        intake_plan=intake_plan, gut_model=gut_model
+    )
+
+    if summary_only:
+        totals = state.pop('totals')
+        stats = summary_stats(
+            series, duration_min, state['final_muscle_g'], state['final_liver_g'], totals,
+            n_steps=state['minutes_simulated']
+        )
+        if time_step_s != 60:
+            # Indici di passo -> minuti
+            t = series['t']
+            for key in ('min_liver_minute', 'min_muscle_minute', 'bonk_minute'):
+                if state[key] is not None:
+                    state[key] = float(t[state[key]])
+            state['minutes_simulated'] = float(t[state['minutes_simulated'] - 1]) + 1
+        stats.update(state)
+        return None, stats
+
+    n = len(state['muscle'])
+    frame_inputs = (
+        series['t'][:n], state, series['fat_g_min'][:n], gut_load[:n], intake_g[:n], exo_g_min[:n],
+        series['cho_ratio'][:n], series['if_moment'][:n]
+    )
+    if time_step_s != 60:
+        frame_inputs = aggregate_steps_to_minutes(*frame_inputs, steps_per_min=60 // int(time_step_s))
+    target_intake_g_h = constant_carb_intake_g_h if intake_plan is None else intake_plan.rate_g_h(duration_min)
+    df = build_result_frame(*frame_inputs, target_intake_g_h)
+
+    totals = {
+        "muscle": _sequential_total(state['muscle_use'][1:] * dt_min),
+        "liver": _sequential_total(state['liver_use'][1:] * dt_min),
+        "exo": _sequential_total(state['exo_use'][1:] * dt_min),
+    }
+    stats = summary_stats(series, duration_min, state['muscle'][-1], state['liver'][-1], totals, n_steps=n)
+    return df, stats
+
+
+def aggregate_steps_to_minutes(t, state, fat_g_min, gut_load, intake_g, exo_g_min, cho_ratio, if_moment,
+                               steps_per_min):
+    """
+    Riduce una simulazione a passo fine a una riga per minuto: riserve e gut load al minuto,
+    flussi (g/min, %, IF) mediati sul minuto precedente, grammi ingeriti sommati.
+    """
+    n = len(t)
+    rows = np.arange(0, n, steps_per_min)
+    if rows[-1] != n - 1:
+        rows = np.append(rows, n - 1)
+
+    def block_mean(x):
+        if len(rows) == 1:
+            return x[:1].copy()
+        sums = np.add.reduceat(x[1:], rows[:-1])
+        return np.concatenate([x[:1], sums / np.diff(rows)])
+
+    def block_sum(x):
+        if len(rows) == 1:
+            return x[:1].copy()
+        return np.concatenate([x[:1], np.add.reduceat(x[1:], rows[:-1])])
+
+    minute_state = {
+        "muscle_use": block_mean(state['muscle_use']),
+        "liver_use": block_mean(state['liver_use']),
+        "exo_use": block_mean(state['exo_use']),
+        "muscle": state['muscle'][rows],
+        "liver": state['liver'][rows],
+    }
+    return (
+        t[rows], minute_state, block_mean(fat_g_min), gut_load[rows], block_sum(intake_g),
+        block_mean(exo_g_min), block_mean(cho_ratio), block_mean(if_moment)
+    )
+
+
+def build_result_frame(t, state, fat_g_min, gut_load, intake_g, exo_g_min, cho_ratio, if_moment, target_intake_g_h):
+    """
+    Assembla il DataFrame con le stesse colonne del motore di riferimento, tipizzato a colonne:
+    percentuali numeriche e Stato categoriale (testo solo con format_result_table).
+    """
+    muscle_use = state['muscle_use']
+    liver_use = state['liver_use']
+    exo_use = state['exo_use']
+    muscle = state['muscle']
+    liver = state['liver']
+
+    total_g_min = muscle_use + liver_use + exo_use + fat_g_min
+
+    return typed_result_frame({
+        "Time (min)": t,
+        "Glicogeno Muscolare (g)": muscle_use * 60,
+        "Glicogeno Epatico (g)": liver_use * 60,
+        "Carboidrati Esogeni (g)": exo_use * 60,
+        "Ossidazione Lipidica (g)": fat_g_min * 60,
+        "Pct_Muscle": share_pct(muscle_use, total_g_min),
+        "Pct_Liver": share_pct(liver_use, total_g_min),
+        "Pct_Exo": share_pct(exo_use, total_g_min),
+        "Pct_Fat": share_pct(fat_g_min, total_g_min),
+        "Residuo Muscolare": muscle,
+        "Residuo Epatico": liver,
+        "Residuo Totale": muscle + liver,
+        "Target Intake (g/h)": np.full(len(t), target_intake_g_h, dtype=np.float32),
+        "Gut Load": gut_load,
+        "Stato": status_categorical(muscle, liver),
+        "CHO %": cho_ratio * 100,
+        "Intake Cumulativo (g)": np.cumsum(intake_g),
+        "Ossidazione Cumulativa (g)": np.cumsum(exo_g_min),
+        "Intensity Factor (IF)": if_moment,
+    })
+
+
+# --- 5. SIMULAZIONE MULTI-SCENARIO (BATCH) ---
+
+BATCH_VARIABLES = (
+    "muscle_use",       # g/min da glicogeno muscolare
+    "liver_use",        # g/min da glicogeno epatico
+    "exo_use",          # g/min da CHO esogeni
+    "muscle",           # residuo muscolare (g)
+    "liver",            # residuo epatico (g)
+    "gut_load",         # accumulo intestinale (g)
+    "intake",           # grammi ingeriti nel minuto
+    "exo_oxidation",    # ossidazione esogena disponibile (g/min)
+)
+
+
+@dataclass
+class BatchSimulationResult:
+    """
+    Risultato compatto di simulate_metabolism_batch.
+    values ha forma (scenari, tempo, variabili) con le variabili in BATCH_VARIABLES;
+    le serie comuni a tutti gli scenari (grassi, RER, IF...) stanno in shared.
+    """
+    time: np.ndarray
+    values: np.ndarray
+    scenarios: list
+    stats: list
+    shared: dict = field(repr=False)
+    variables: tuple = BATCH_VARIABLES
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def variable(self, name):
+        """Matrice (scenari, tempo) di una variabile."""
+        return self.values[:, :, self.variables.index(name)]
+
+    def to_frame(self, index):
+        """DataFrame dello scenario `index` nel formato di simulate_metabolism."""
+        data = self.values[index]
+        state = {name: data[:, k] for k, name in enumerate(self.variables)}
+        return build_result_frame(
+            self.time, state, self.shared['fat_g_min'], state['gut_load'], state['intake'],
+            state['exo_oxidation'], self.shared['cho_ratio'], self.shared['if_moment'],
+            self.scenarios[index]['constant_carb_intake_g_h']
+        )
+
+
+def _broadcast_scenarios(**columns):
+    """Espande scalari e sequenze in una lista di scenari della stessa lunghezza."""
+    lengths = {len(v) for v in columns.values() if isinstance(v, (list, tuple, np.ndarray))}
+    if len(lengths) > 1:
+        raise ValueError(f"Lunghezze scenari incoerenti: {sorted(lengths)}")
+    n = lengths.pop() if lengths else 1
+    expanded = {
+        k: list(v) if isinstance(v, (list, tuple, np.ndarray)) else [v] * n
+        for k, v in columns.items()
+    }
+    return [{k: expanded[k][i] for k in columns} for i in range(n)]
+
+
+def exogenous_oxidation_batch(intake_g, effective_target, alpha, oxidation_efficiency):
+    """
+    Come exogenous_oxidation_series ma con tutti gli scenari in parallelo.
+    intake_g ha forma (tempo, scenari); target e alpha sono vettori per scenario.
+    """
+    n_steps, n_scen = intake_g.shape
+    exo_out = np.empty((n_steps, n_scen))
+    gut_out = np.empty((n_steps, n_scen))
+    exo = np.zeros(n_scen)
+    gut = np.zeros(n_scen)
+    gut_input = intake_g * oxidation_efficiency
+    for i in range(n_steps):
+        exo += alpha * (effective_target - exo)
+        np.maximum(exo, 0.0, out=exo)
+        gut += gut_input[i]
+        np.minimum(exo, gut, out=exo)
+        gut -= exo
+        np.maximum(gut, 0.0, out=gut)
+        exo_out[i] = exo
+        gut_out[i] = gut
+    return exo_out, gut_out
+
+
+def glycogen_recurrence_batch(cho_g_min, exo_g_min, initial_muscle, initial_liver,
+                              exponent=MUSCLE_CONTRIBUTION_EXPONENT, liver_cap=MAX_LIVER_OUTPUT_G_MIN):
+    """
+    Ricorsione muscolo/fegato in lock-step su tutti gli scenari.
+    cho_g_min ed exo_g_min hanno forma (tempo, scenari) (cho anche (tempo,) se condiviso);
+    riserve iniziali, esponente e limite epatico possono essere scalari o vettori per scenario.
+    """
+    n_steps, n_scen = exo_g_min.shape
+    cho_g_min = np.broadcast_to(np.asarray(cho_g_min, dtype=float).reshape(n_steps, -1), (n_steps, n_scen))
+
+    muscle = np.array(np.broadcast_to(initial_muscle, (n_scen,)), dtype=float)
+    liver = np.array(np.broadcast_to(initial_liver, (n_scen,)), dtype=float)
+    has_initial = muscle > 0
+    initial_safe = np.where(has_initial, muscle, 1.0)
+
+    out = {name: np.empty((n_steps, n_scen)) for name in ("muscle_use", "liver_use", "exo_use", "muscle", "liver")}
+    for i in range(n_steps):
+        cho = cho_g_min[i]
+        fill_state = np.where(has_initial, muscle / initial_safe, 0.0)
+        from_muscle = np.where(muscle <= 0, 0.0, cho * np.power(fill_state, exponent))
+        blood_demand = cho - from_muscle
+        from_exo = np.minimum(blood_demand, exo_g_min[i])
+        from_liver = np.minimum(blood_demand - from_exo, liver_cap)
+        from_liver = np.where(liver <= 0, 0.0, from_liver)
+
+        if i > 0:
+            muscle = np.maximum(muscle - from_muscle, 0.0)
+            liver = np.maximum(liver - from_liver, 0.0)
+
+        out["muscle_use"][i] = from_muscle
+        out["liver_use"][i] = from_liver
+        out["exo_use"][i] = from_exo
+        out["muscle"][i] = muscle
+        out["liver"][i] = liver
+    return out
+
+
+def race_summary_batch(cho_g_min, intake_g, effective_target, alpha, oxidation_efficiency,
+                       initial_muscle, initial_liver,
+                       exponent=MUSCLE_CONTRIBUTION_EXPONENT, liver_cap=MAX_LIVER_OUTPUT_G_MIN, floors=None):
+    """
+    Assorbimento e ricorsione glicogeno fusi in un unico ciclo, senza matrici (tempo, scenari)
+    in uscita: per ogni scenario ritorna riserve finali, minimi, picco di gut load e minuto di
+    crisi (-1 se assente). Con floors=(fegato_g, muscolo_g) aggiunge il primo minuto in cui
+    fegato (floor_liver_minute) o muscolo (floor_muscle_minute) scendono alla soglia.
+    Pensata per sweep con migliaia di scenari (sensibilità, ottimizzatori).
+    """
+    cho_g_min = np.asarray(cho_g_min, dtype=float)
+    n_steps = cho_g_min.shape[0]
+    n_scen = len(np.atleast_1d(effective_target)) if cho_g_min.ndim == 1 else cho_g_min.shape[1]
+    cho_g_min = np.broadcast_to(cho_g_min.reshape(n_steps, -1), (n_steps, n_scen))
+    intake_g = np.broadcast_to(np.asarray(intake_g, dtype=float).reshape(n_steps, -1), (n_steps, n_scen))
+
+    muscle = np.array(np.broadcast_to(initial_muscle, (n_scen,)), dtype=float)
+    liver = np.array(np.broadcast_to(initial_liver, (n_scen,)), dtype=float)
+    has_initial = muscle > 0
+    initial_safe = np.where(has_initial, muscle, 1.0)
+    exo = np.zeros(n_scen)
+    gut = np.zeros(n_scen)
+    min_liver = np.full(n_scen, np.inf)
+    min_muscle = np.full(n_scen, np.inf)
+    max_gut = np.zeros(n_scen)
+    bonk_minute = np.full(n_scen, -1)
+    liver_floor, muscle_floor = _stop_floors(floors)
+    floor_liver_minute = np.full(n_scen, -1)
+    floor_muscle_minute = np.full(n_scen, -1)
+
+    for i in range(n_steps):
+        exo += alpha * (effective_target - exo)
+        np.maximum(exo, 0.0, out=exo)
+        gut += intake_g[i] * oxidation_efficiency
+        np.minimum(exo, gut, out=exo)
+        gut -= exo
+        np.maximum(gut, 0.0, out=gut)
+        np.maximum(max_gut, gut, out=max_gut)
+
+        cho = cho_g_min[i]
+        fill_state = np.where(has_initial, muscle / initial_safe, 0.0)
+        from_muscle = np.where(muscle <= 0, 0.0, cho * np.power(fill_state, exponent))
+        blood_demand = cho - from_muscle
+        from_liver = np.minimum(blood_demand - np.minimum(blood_demand, exo), liver_cap)
+        from_liver = np.where(liver <= 0, 0.0, from_liver)
+
+        if i > 0:
+            muscle = np.maximum(muscle - from_muscle, 0.0)
+            liver = np.maximum(liver - from_liver, 0.0)
+
+        np.minimum(min_liver, liver, out=min_liver)
+        np.minimum(min_muscle, muscle, out=min_muscle)
+        new_bonk = (bonk_minute < 0) & ((liver <= BONK_LIVER_G) | (muscle <= BONK_MUSCLE_G))
+        bonk_minute[new_bonk] = i
+        if floors is not None:
+            floor_liver_minute[(floor_liver_minute < 0) & (liver <= liver_floor)] = i
+            floor_muscle_minute[(floor_muscle_minute < 0) & (muscle <= muscle_floor)] = i
+
+    summary = {
+        "final_muscle_g": muscle,
+        "final_liver_g": liver,
+        "min_liver_g": min_liver,
+        "min_muscle_g": min_muscle,
+        "max_gut_g": max_gut,
+        "bonk_minute": bonk_minute,
+    }
+    if floors is not None:
+        summary["floor_liver_minute"] = floor_liver_minute
+        summary["floor_muscle_minute"] = floor_muscle_minute
+    return summary
+
+
+def simulate_metabolism_batch(subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+                              tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80,
+                              custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY,
+                              intensity_series=None, metabolic_curve=None,
+                              intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0):
+    """
+    Più strategie per lo stesso soggetto e la stessa serie di intensità in un unico passaggio.
+    Intake (g/h), grammi per unità, tau, mix, modalità e cutoff accettano uno scalare
+    o una sequenza (uno per scenario); gli scenari avanzano insieme come array 2-D.
+    """
+    scenarios = _broadcast_scenarios(
+        constant_carb_intake_g_h=constant_carb_intake_g_h,
+        cho_per_unit_g=cho_per_unit_g,
+        tau_absorption=tau_absorption,
+        mix_type_input=mix_type_input,
+        intake_mode=intake_mode,
+        intake_cutoff_min=intake_cutoff_min,
+    )
+    series = prepare_demand_series(
+        duration_min, crossover_pct, subject_obj, activity_params,
+        intensity_series, metabolic_curve, variability_index
+    )
+    t = series['t']
+
+    intake_g = np.column_stack([
+        intake_series(t, duration_min, sc['constant_carb_intake_g_h'], sc['cho_per_unit_g'],
+                      sc['intake_mode'], sc['intake_cutoff_min'])
+        for sc in scenarios
+    ])
+    effective_target = np.array([
+        exogenous_target(
+            sc['constant_carb_intake_g_h'],
+            resolve_max_exo_rate(custom_max_exo_rate, subject_obj, series['activity'], sc['mix_type_input']),
+            oxidation_efficiency_input
+        )
+        for sc in scenarios
+    ])
+    alpha = 1 - np.exp(-1.0 / np.array([sc['tau_absorption'] for sc in scenarios], dtype=float))
+
+    exo_g_min, gut_load = exogenous_oxidation_batch(intake_g, effective_target, alpha, oxidation_efficiency_input)
+    state = glycogen_recurrence_batch(
+        series['cho_g_min'], exo_g_min, subject_data['muscle_glycogen_g'], subject_data['liver_glycogen_g']
+    )
+    state.update({"gut_load": gut_load, "intake": intake_g, "exo_oxidation": exo_g_min})
+
+    # (tempo, scenari, variabili) -> (scenari, tempo, variabili)
+    values = np.stack([state[name] for name in BATCH_VARIABLES], axis=-1).transpose(1, 0, 2)
+
+    totals = {key: np.cumsum(state[f"{key}_use"][1:], axis=0) for key in ("muscle", "liver", "exo")}
+    stats = []
+    for k in range(len(scenarios)):
+        scenario_totals = {key: float(cum[-1, k]) if len(cum) else 0.0 for key, cum in totals.items()}
+        stats.append(summary_stats(series, duration_min, state['muscle'][-1, k], state['liver'][-1, k], scenario_totals))
+
+    shared = {key: series[key] for key in ("fat_g_min", "cho_ratio", "if_moment", "rer", "kcal_demand")}
+    return BatchSimulationResult(time=t, values=values, scenarios=scenarios, stats=stats, shared=shared)
@@ -1,11 +1,37 @@
 import math
-import numpy as np
-import pandas as pd
 from data_models import Subject, Sex, ChoMixType, FatigueState, GlycogenState, IntakeMode, SportType
 
-from domain.metabolism_engine import simulate_metabolism as _simulate_metabolism
-from domain.metabolism_engine import calculate_minimum_strategy as _calculate_minimum_strategy
+from domain.vectorized_engine import simulate_metabolism_vectorized as _simulate_metabolism
+from domain.vectorized_engine import simulate_metabolism_batch as _simulate_metabolism_batch
+from domain.strategy_solver import solve_minimum_strategy as _solve_minimum_strategy
+from domain.strategy_solver import solve_minimum_strategy_newton as _solve_minimum_strategy_newton
+from domain.strategy_solver import MIN_LIVER_SAFE, MIN_MUSCLE_SAFE, SOLVER_BISECTION, SOLVER_NEWTON
+from domain.gradient_engine import GRADIENT_PARAMETERS
+from domain.gradient_engine import simulate_metabolism_gradients as _simulate_metabolism_gradients
+from domain.uncertainty_engine import default_distributions as _default_distributions
+from domain.uncertainty_engine import run_monte_carlo as _run_monte_carlo
+from domain.sensitivity_engine import run_sensitivity_analysis as _run_sensitivity_analysis
 from domain.tapering_engine import calculate_hourly_tapering as _calculate_hourly_tapering
+from domain.season_engine import run_season as _run_season
+from domain.season_engine import season_days as _season_days
+from domain.season_engine import DEFAULT_CHUNK_DAYS, PARQUET_AVAILABLE, SEASON_MAX_DAYS, SEASON_MIN_DAYS
+from domain.substrate_model import calculate_rer_polynomial
+from domain.metabolism_engine import interpolate_consumption
+from domain.metabolic_curve import MetabolicCurve
+from domain.result_schema import format_result_table as _format_result_table
+from domain.incremental_engine import IncrementalSimulator as _IncrementalSimulator
+from domain.intake_optimizer import optimize_intake_schedule as _optimize_intake_schedule
+from domain.intake_optimizer import schedule_table as _schedule_table
+from domain.envelope_solver import solve_envelope as _solve_envelope
+from domain.envelope_solver import default_intensity_grid as _default_intensity_grid
+from domain.incremental_engine import context_fingerprint as _context_fingerprint
+from domain.result_cache import ScenarioCache as _ScenarioCache
+from domain.gut_model import GUT_MODEL_BUCKET, GUT_MODEL_COMPARTMENTS
+from domain.adaptive_engine import simulate_metabolism_adaptive as _simulate_metabolism_adaptive
+from profiling import profiled
+
+# Cache LRU dei risultati dei motori (chiave = impronta di tutti gli input dello scenario)
+_SIMULATION_CACHE = _ScenarioCache(maxsize=128)
 
 # --- 1. FUNZIONI HELPER ---
 
@@ -13,16 +39,6 @@ def get_concentration_from_vo2max(vo2_max):
     conc = 13.0 + (vo2_max - 30.0) * 0.24
     return max(12.0, min(26.0, conc))
 
-def calculate_rer_polynomial(intensity_factor):
-    """
-    Calcola il Respiratory Exchange Ratio basato sull'intensità relativa (IF).
-    Modello polinomiale standard per stimare il consumo di substrati.
-    """
-    if_val = intensity_factor
-    rer = (-0.000000149 * (if_val**6) + 141.538462237 * (if_val**5) - 565.128206259 * (if_val**4) + 
-           890.333333976 * (if_val**3) - 691.679487060 * (if_val**2) + 265.460857558 * if_val - 39.525121144)
-    return max(0.70, min(1.15, rer))
-
 def calculate_depletion_factor(steps, activity_min, s_fatigue):
     steps_base = 10000 
     steps_factor = (steps - steps_base) / 5000 * 0.1 * 0.4
@@ -52,6 +68,7 @@ def calculate_filling_factor_from_diet(weight_kg, cho_d1, cho_d2, s_fatigue, s_s
     final_filling = diet_factor * depletion * s_sleep.factor
     return final_filling, diet_factor, avg_cho_gk, cho_d1_gk, cho_d2_gk
 
+@profiled("tank")
 def calculate_tank(subject: Subject):
     if subject.muscle_mass_kg is not None and subject.muscle_mass_kg > 0:
         total_muscle = subject.muscle_mass_kg
@@ -90,25 +107,6 @@ def calculate_tank(subject: Subject):
         "muscle_source_note": muscle_source_note
     }
 
-def interpolate_consumption(current_val, curve_data):
-    if isinstance(curve_data, pd.DataFrame):
-        cho = np.interp(current_val, curve_data['Intensity'], curve_data['CHO'])
-        fat = np.interp(current_val, curve_data['Intensity'], curve_data['FAT'])
-        return cho, fat
-    elif isinstance(curve_data, dict):
-        p1, p2, p3 = curve_data['z2'], curve_data['z3'], curve_data['z4']
-        if current_val <= p1['hr']: return p1['cho'], p1['fat'] 
-        if current_val <= p2['hr']:
-            ratio = (current_val - p1['hr']) / (p2['hr'] - p1['hr'])
-            return p1['cho'] + ratio*(p2['cho']-p1['cho']), p1['fat'] + ratio*(p2['fat']-p1['fat'])
-        elif current_val <= p3['hr']:
-            ratio = (current_val - p2['hr']) / (p3['hr'] - p2['hr'])
-            return p2['cho'] + ratio*(p3['cho']-p2['cho']), p2['fat'] + ratio*(p3['fat']-p2['fat'])
-        else:
-            extra = current_val - p3['hr']
-            return p3['cho'] + (extra * 4.0), max(0.0, p3['fat'] - extra * 0.5)
-    return 0, 0
-
 def estimate_max_exogenous_oxidation(height_cm, weight_kg, ftp_watts, mix_type: ChoMixType):
     base_rate = 0.8 
     if height_cm > 170: base_rate += (height_cm - 170) * 0.015
@@ -117,38 +115,254 @@ def estimate_max_exogenous_oxidation(height_cm, weight_kg, ftp_watts, mix_type:
     final_rate_g_min = min(estimated_rate_gh / 60, mix_type.max_rate_gh / 60)
     return final_rate_g_min
 
+def build_metabolic_curve(report_df, metric):
+    """Compila il report del metabolimetro sulla metrica scelta (da salvare in session state)."""
+    return MetabolicCurve.from_report(report_df, metric)
+
 # --- 2. MOTORE TAPERING (LOGICA ORARIA AVANZATA) ---
 
+@profiled("tapering")
 def calculate_hourly_tapering(subject, days_data, start_state: GlycogenState = GlycogenState.NORMAL):
     return _calculate_hourly_tapering(subject, days_data, start_state=start_state)
 
+
+def season_days(start_date, n_days, weekly_template):
+    return _season_days(start_date, n_days, weekly_template)
+
+
+@profiled("tapering.season")
+def run_season_tapering(subject, days, start_state: GlycogenState = GlycogenState.NORMAL,
+                        chunk_days=DEFAULT_CHUNK_DAYS, hourly_path=None):
+    """Stagione (90-365 giorni) in streaming: riepilogo giornaliero + timeline oraria opzionale su file."""
+    return _run_season(subject, days, start_state=start_state, chunk_days=chunk_days, hourly_path=hourly_path)
+
 # --- 3. SIMULAZIONE METABOLICA (NO MADER - SOLO CROSSOVER) ---
 
+@profiled("engine.simulate_metabolism")
 def simulate_metabolism(subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct, 
                         tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80, 
                         custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY, 
                         intensity_series=None, metabolic_curve=None, 
-                        intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0):
-    return _simulate_metabolism(
+                        intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0,
+                        summary_only=False, stop_at_floors=None, time_step_s=60, intake_plan=None,
+                        gut_model=GUT_MODEL_BUCKET, adaptive=False):
+    # adaptive: passo variabile con controllo d'errore (tabella a nodi non equispaziati)
+    engine = _simulate_metabolism_adaptive if adaptive else _simulate_metabolism
+    return _SIMULATION_CACHE.call(
+        "simulate_metabolism_adaptive" if adaptive else "simulate_metabolism", engine,
         subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
         tau_absorption, subject_obj, activity_params,
         oxidation_efficiency_input=oxidation_efficiency_input,
         custom_max_exo_rate=custom_max_exo_rate, mix_type_input=mix_type_input,
         intensity_series=intensity_series, metabolic_curve=metabolic_curve,
         intake_mode=intake_mode, intake_cutoff_min=intake_cutoff_min,
-        variability_index=variability_index
-    )
+        variability_index=variability_index,
+        summary_only=summary_only, stop_at_floors=stop_at_floors,
+        time_step_s=time_step_s, intake_plan=intake_plan, gut_model=gut_model
+    )
+
+@profiled("engine.simulate_metabolism_batch")
+def simulate_metabolism_batch(subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+                              tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80,
+                              custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY,
+                              intensity_series=None, metabolic_curve=None,
+                              intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0):
+    """
+    Simula più strategie (intake, tau, mix, cutoff) in un unico passaggio.
+    Ritorna un BatchSimulationResult (scenari x tempo x variabili).
+    """
+    return _SIMULATION_CACHE.call(
+        "simulate_metabolism_batch", _simulate_metabolism_batch,
+        subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+        tau_absorption, subject_obj, activity_params,
+        oxidation_efficiency_input=oxidation_efficiency_input,
+        custom_max_exo_rate=custom_max_exo_rate, mix_type_input=mix_type_input,
+        intensity_series=intensity_series, metabolic_curve=metabolic_curve,
+        intake_mode=intake_mode, intake_cutoff_min=intake_cutoff_min,
+        variability_index=variability_index
+    )
+
+@profiled("engine.gradients")
+def simulate_metabolism_gradients(subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+                                  tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80,
+                                  custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY,
+                                  intensity_series=None, metabolic_curve=None,
+                                  intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0,
+                                  parameters=GRADIENT_PARAMETERS):
+    """
+    Riserve finali, minimi, esogeni totali e istante di crisi con le derivate (forward mode)
+    rispetto a intake, tau, efficienza, crossover e glicogeno iniziale (vedi GRADIENT_PARAMETERS).
+    """
+    return _SIMULATION_CACHE.call(
+        "simulate_metabolism_gradients", _simulate_metabolism_gradients,
+        subject_data, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+        tau_absorption, subject_obj, activity_params,
+        oxidation_efficiency_input=oxidation_efficiency_input,
+        custom_max_exo_rate=custom_max_exo_rate, mix_type_input=mix_type_input,
+        intensity_series=intensity_series, metabolic_curve=metabolic_curve,
+        intake_mode=intake_mode, intake_cutoff_min=intake_cutoff_min,
+        variability_index=variability_index, parameters=tuple(parameters)
+    )
+
+def default_uncertainty(subject_obj, activity_params, tau_absorption=20, crossover_pct=75,
+                        oxidation_efficiency=0.80, spread=1.0):
+    """Distribuzioni di default dei parametri incerti (spread scala tutte le deviazioni standard)."""
+    return _default_distributions(
+        subject_obj, activity_params, tau_absorption, crossover_pct, oxidation_efficiency, spread=spread
+    )
+
+@profiled("engine.monte_carlo")
+def run_monte_carlo(tank, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+                    tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80,
+                    custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY,
+                    intensity_series=None, metabolic_curve=None,
+                    intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0,
+                    distributions=None, n_samples=2000, seed=0, n_workers=None):
+    """
+    Analisi di incertezza Monte Carlo della gara.
+    Ritorna un MonteCarloResult con bande percentili delle riserve e probabilità di crisi per minuto.
+    """
+    return _run_monte_carlo(
+        tank, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+        tau_absorption, subject_obj, activity_params,
+        oxidation_efficiency_input=oxidation_efficiency_input,
+        custom_max_exo_rate=custom_max_exo_rate, mix_type_input=mix_type_input,
+        intensity_series=intensity_series, metabolic_curve=metabolic_curve,
+        intake_mode=intake_mode, intake_cutoff_min=intake_cutoff_min,
+        variability_index=variability_index,
+        distributions=distributions, n_samples=n_samples, seed=seed, n_workers=n_workers
+    )
+
+@profiled("engine.sensitivity")
+def run_sensitivity_analysis(tank, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+                             tau_absorption, subject_obj, activity_params, oxidation_efficiency_input=0.80,
+                             custom_max_exo_rate=None, mix_type_input=ChoMixType.GLUCOSE_ONLY,
+                             intensity_series=None, metabolic_curve=None,
+                             intake_mode=IntakeMode.DISCRETE, intake_cutoff_min=0, variability_index=1.0,
+                             rel_range=0.10, n_trajectories=100, seed=0, n_workers=None):
+    """
+    Analisi di sensibilità globale (Morris): quali parametri pesano di più su glicogeno finale e crisi.
+    Ritorna un dict con la tabella 'tornado' già ordinata.
+    """
+    return _run_sensitivity_analysis(
+        tank, duration_min, constant_carb_intake_g_h, cho_per_unit_g, crossover_pct,
+        tau_absorption, subject_obj, activity_params,
+        oxidation_efficiency_input=oxidation_efficiency_input,
+        custom_max_exo_rate=custom_max_exo_rate, mix_type_input=mix_type_input,
+        intensity_series=intensity_series, metabolic_curve=metabolic_curve,
+        intake_mode=intake_mode, intake_cutoff_min=intake_cutoff_min,
+        variability_index=variability_index,
+        rel_range=rel_range, n_trajectories=n_trajectories, seed=seed, n_workers=n_workers
+    )
+
+def simulation_cache_stats():
+    """Dimensione, hit, miss ed evizioni della cache dei risultati."""
+    return _SIMULATION_CACHE.stats()
+
+def clear_simulation_cache():
+    _SIMULATION_CACHE.clear()
 
 # --- 4. CALCOLO REVERSE STRATEGY (AGGIORNATA SENZA MADER) ---
 
-def calculate_minimum_strategy(tank, duration, subj, params, curve_data, mix_type, intake_mode, intake_cutoff_min=0, variability_index=1.0, intensity_series=None):
+def format_simulation_table(df, decimals=1):
+    """Percentuali e stato in formato testo, solo per la tabella mostrata a video."""
+    return _format_result_table(df, decimals=decimals)
+
+def incremental_simulator(store, key, subject_data, duration_min, crossover_pct, subject_obj, activity_params,
+                          intensity_series=None, metabolic_curve=None, variability_index=1.0, checkpoint_stride=10):
+    """
+    Simulatore con checkpoint conservato in `store` (es. st.session_state) sotto `key`.
+    Viene ricreato solo se cambia il contesto (soggetto, durata, intensità, curva); i cambi di
+    intake o di cutoff ricalcolano solo la coda della gara. A intensità costante anche la durata
+    riusa i checkpoint (set_duration).
+    """
+    context = (subject_data, duration_min, crossover_pct, subject_obj, activity_params,
+               intensity_series, metabolic_curve, variability_index)
+    sim = store.get(key)
+    if sim is None or not sim.matches(*context):
+        sim = _IncrementalSimulator(*context, checkpoint_stride=checkpoint_stride)
+        store[key] = sim
+    else:
+        sim.set_duration(duration_min)
+    return sim
+
+@profiled("engine.intake_optimizer")
+def optimize_intake_schedule(tank, duration, subj, params, cho_per_unit_g, crossover_pct=75, tau_absorption=20,
+                             curve_data=None, mix_type=ChoMixType.GLUCOSE_ONLY, oxidation_efficiency=0.80,
+                             custom_max_exo_rate=None, intake_cutoff_min=0, variability_index=1.0,
+                             intensity_series=None, gut_tolerance_g=30.0, min_spacing_min=5, max_units=None):
+    return _optimize_intake_schedule(
+        tank, duration, subj, params, cho_per_unit_g, crossover_pct=crossover_pct, tau_absorption=tau_absorption,
+        curve_data=curve_data, mix_type=mix_type, oxidation_efficiency=oxidation_efficiency,
+        custom_max_exo_rate=custom_max_exo_rate, intake_cutoff_min=intake_cutoff_min,
+        variability_index=variability_index, intensity_series=intensity_series,
+        gut_tolerance_g=gut_tolerance_g, min_spacing_min=min_spacing_min, max_units=max_units
+    )
+
+def intake_schedule_table(plan):
+    return _schedule_table(plan)
+
+@profiled("engine.envelope")
+def sustainability_envelope(store, key, tank, subj, params, crossover_pct=75, tau_absorption=20, cho_per_unit_g=30,
+                            intake_mode=IntakeMode.DISCRETE, mix_type=ChoMixType.GLUCOSE_ONLY,
+                            oxidation_efficiency=0.80, custom_max_exo_rate=None, metabolic_curve=None,
+                            compute=True):
+    """
+    Inviluppo durata x intensità x intake conservato in `store` sotto `key`:
+    ricalcolato solo se cambiano soggetto, attività, griglia o parametri di assorbimento.
+    Con compute=False non simula: ritorna l'ultima superficie conservata (anche di un contesto precedente).
+    Ritorna {"envelope": superficie o None, "current": True se calcolata per questo contesto}.
+    """
+    kwargs = dict(crossover_pct=crossover_pct, tau_absorption=tau_absorption, cho_per_unit_g=cho_per_unit_g,
+                  intake_mode=intake_mode, mix_type=mix_type, oxidation_efficiency=oxidation_efficiency,
+                  custom_max_exo_rate=custom_max_exo_rate, metabolic_curve=metabolic_curve)
+    # L'intensità corrente entra nell'impronta solo tramite la griglia (che ne dipende senza soglia)
+    intensities = _default_intensity_grid(params, subj)
+    base_params = {k: v for k, v in params.items() if k not in ('avg_watts', 'avg_hr', 'np_watts')}
+    fingerprint = _context_fingerprint(tank, subj, base_params, intensities, kwargs)
+    cached = store.get(key)
+    current = cached is not None and cached[0] == fingerprint
+    if compute and not current:
+        cached = (fingerprint, _solve_envelope(tank, subj, params, intensities=intensities, **kwargs))
+        store[key] = cached
+        current = True
+    return {"envelope": cached[1] if cached is not None else None, "current": current}
+
+def calculate_minimum_strategy(tank, duration, subj, params, curve_data, mix_type, intake_mode, intake_cutoff_min=0, variability_index=1.0, intensity_series=None, tolerance_g_h=1.0, cho_per_unit_g=30, crossover_pct=75, tau_absorption=20):
     """
     Calcola la strategia nutrizionale minima necessaria.
-    Itera simulazioni aumentando l'intake finché i serbatoi non rimangono sopra la soglia di sicurezza.
-    """
-    return _calculate_minimum_strategy(
-        tank, duration, subj, params, curve_data, mix_type, intake_mode,
-        intake_cutoff_min=intake_cutoff_min,
-        variability_index=variability_index,
-        intensity_series=intensity_series
-    )
+    Cerca per bisezione l'intake minimo che mantiene i serbatoi sopra la soglia di sicurezza.
+    """
+    return solve_minimum_strategy(
+        tank, duration, subj, params, curve_data, mix_type, intake_mode,
+        intake_cutoff_min=intake_cutoff_min,
+        variability_index=variability_index,
+        intensity_series=intensity_series,
+        tolerance_g_h=tolerance_g_h,
+        cho_per_unit_g=cho_per_unit_g,
+        crossover_pct=crossover_pct,
+        tau_absorption=tau_absorption
+    )['intake_g_h']
+
+@profiled("engine.minimum_strategy")
+def solve_minimum_strategy(tank, duration, subj, params, curve_data, mix_type, intake_mode, intake_cutoff_min=0, variability_index=1.0, intensity_series=None, tolerance_g_h=1.0, method=SOLVER_BISECTION, cho_per_unit_g=30, crossover_pct=75, tau_absorption=20):
+    """
+    Come calculate_minimum_strategy ma ritorna il dettaglio: intake, numero di simulazioni,
+    vincolo limitante (fegato/muscolo) e minuto in cui si verifica.
+    method: "bisection" o "newton" (derivate rispetto all'intake, stesso risultato con meno simulazioni).
+    cho_per_unit_g, crossover_pct e tau_absorption: gli stessi della simulazione di gara.
+    """
+    if method not in (SOLVER_BISECTION, SOLVER_NEWTON):
+        raise ValueError(f"Metodo non valido: {method} ({SOLVER_BISECTION} | {SOLVER_NEWTON})")
+    solver = _solve_minimum_strategy_newton if method == SOLVER_NEWTON else _solve_minimum_strategy
+    return _SIMULATION_CACHE.call(
+        f"solve_minimum_strategy.{method}", solver,
+        tank, duration, subj, params, curve_data, mix_type, intake_mode,
+        intake_cutoff_min=intake_cutoff_min,
+        variability_index=variability_index,
+        intensity_series=intensity_series,
+        tolerance_g_h=tolerance_g_h,
+        cho_per_unit_g=cho_per_unit_g,
+        crossover_pct=crossover_pct,
+        tau_absorption=tau_absorption
+    )
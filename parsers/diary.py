@@ -0,0 +1,61 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from parsers.roster import _is_missing
+
+# Colonne obbligatorie del diario di allenamento (una riga per giorno)
+DIARY_REQUIRED_COLUMNS = ("date",)
+
+# Tipi attività del diario (come nella tab tapering)
+CYCLING_TYPE = "Ciclismo"
+
+
+def _time(value):
+    return value if isinstance(value, datetime.time) else datetime.time.fromisoformat(str(value))
+
+
+def parse_days_data(days):
+    """Giorni del diario (date ISO, orari "HH:MM") nel formato di calculate_hourly_tapering."""
+    parsed = []
+    for day in days:
+        parsed.append({
+            "date_obj": datetime.date.fromisoformat(str(day["date"])),
+            "type": day.get("type", "Riposo"),
+            "val": float(day.get("val", 0)),
+            "duration": float(day.get("duration", 0)),
+            "calculated_if": float(day.get("calculated_if", 0.0)),
+            "cho_in": float(day.get("cho_in", 0.0)),
+            "sleep_factor": float(day.get("sleep_factor", 1.0)),
+            "sleep_start": _time(day.get("sleep_start", "23:00")),
+            "sleep_end": _time(day.get("sleep_end", "07:00")),
+            "workout_start": _time(day.get("workout_start", "18:00")),
+        })
+    return parsed
+
+
+def read_diary(source, ftp_watts, threshold_hr):
+    """
+    Diario di allenamento svolto o pianificato (CSV, oppure Parquet con pyarrow): colonne come i campi
+    di parse_days_data, celle vuote -> default. Senza calculated_if l'intensità è val/FTP per il
+    ciclismo e val/FC soglia per gli altri sport. Ritorna i giorni in ordine di data.
+    """
+    name = str(getattr(source, "name", source))
+    ext = os.path.splitext(name)[1].lower()
+    df = pd.read_parquet(source) if ext in (".parquet", ".pq") else pd.read_csv(source)
+    df.columns = [str(c).strip() for c in df.columns]
+    missing = [c for c in DIARY_REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Colonne mancanti nel diario: {', '.join(missing)}")
+
+    rows = []
+    for row in df.to_dict(orient="records"):
+        day = {k: (v.item() if isinstance(v, np.generic) else v) for k, v in row.items() if not _is_missing(v)}
+        day["date"] = pd.Timestamp(day["date"]).date().isoformat()
+        if "calculated_if" not in day:
+            ref = ftp_watts if day.get("type") == CYCLING_TYPE else threshold_hr
+            day["calculated_if"] = float(day.get("val", 0)) / ref if ref else 0.0
+        rows.append(day)
+    return sorted(parse_days_data(rows), key=lambda day: day["date_obj"])
@@ -4,38 +4,42 @@ import pandas as pd
 import fitparse
 
 from calculations.normalized_power import calculate_normalized_power
-from data_models import SportType
+from data_models import IntensitySeries, SportType
+from profiling import profiled, stage
 
 
+@profiled("fit.process")
 def process_fit_data(fit_file_object):
     """
     Legge file .FIT, normalizza, pulisce pause e restituisce DataFrame.
     """
-    try:
-        fit_file_object.seek(0)
-        fitfile = fitparse.FitFile(fit_file_object)
-    except Exception as e:
-        return None, f"Errore file FIT: {e}"
-
-    data_list = []
-    for record in fitfile.get_messages("record"):
-        r_data = {}
-        for field in record:
-            r_data[field.name] = field.value
-        if 'timestamp' in r_data:
-            data_list.append(r_data)
+    with stage("fit.decode"):
+        try:
+            fit_file_object.seek(0)
+            fitfile = fitparse.FitFile(fit_file_object)
+        except Exception as e:
+            return None, f"Errore file FIT: {e}"
+
+        data_list = []
+        for record in fitfile.get_messages("record"):
+            r_data = {}
+            for field in record:
+                r_data[field.name] = field.value
+            if 'timestamp' in r_data:
+                data_list.append(r_data)
 
     if not data_list:
         return None, "Nessun dato record."
 
-    df_raw = pd.DataFrame(data_list)
-    df_raw = df_raw.set_index('timestamp').sort_index()
+    with stage("fit.reindex_ffill"):
+        df_raw = pd.DataFrame(data_list)
+        df_raw = df_raw.set_index('timestamp').sort_index()
 
-    # Normalizzazione Temporale (1s)
-    if not df_raw.empty:
-        full_idx = pd.date_range(start=df_raw.index.min(), end=df_raw.index.max(), freq='1s')
-        # Forward fill limitato (max 5 sec) per evitare di inventare dati in pause lunghe
-        df_raw = df_raw.reindex(full_idx).ffill(limit=5).fillna(0)
+        # Normalizzazione Temporale (1s)
+        if not df_raw.empty:
+            full_idx = pd.date_range(start=df_raw.index.min(), end=df_raw.index.max(), freq='1s')
+            # Forward fill limitato (max 5 sec) per evitare di inventare dati in pause lunghe
+            df_raw = df_raw.reindex(full_idx).ffill(limit=5).fillna(0)
 
     col_map = {
         'power': ['power', 'accumulated_power'],
@@ -66,29 +70,31 @@ def process_fit_data(fit_file_object):
     # 1. Soglia velocità: < 2.5 km/h è pausa (camminata lenta/fermo)
     # 2. Potenza zero: Se power=0 E speed < 5 km/h per più di 10s -> Pausa
     # 3. Cadenza zero: Se cadenza=0 E speed < 5 km/h -> Pausa (Ciclismo)
-    is_stopped = df_clean['speed_kmh'] < 2.5
+    with stage("fit.pause_filter"):
+        is_stopped = df_clean['speed_kmh'] < 2.5
 
-    # Maschera finale
-    df_final = df_clean[~is_stopped].copy()
+        # Maschera finale
+        df_final = df_clean[~is_stopped].copy()
 
-    # Ricalcolo asse temporale continuo (Moving Time)
-    df_final['moving_time_min'] = np.arange(len(df_final)) / 60.0
+        # Ricalcolo asse temporale continuo (Moving Time)
+        df_final['moving_time_min'] = np.arange(len(df_final)) / 60.0
 
     return df_final, None
 
 
+@profiled("fit.parse")
 def parse_fit_file_wrapper(uploaded_file, sport_type):
     """
     Estrae dati dal FIT file.
     Ritorna:
-    1. simulation_series (lista valori per simulazione, es. 1 al secondo)
+    1. simulation_series (IntensitySeries a 1 Hz sul tempo in movimento)
     2. statistiche scalari (duration, avg, etc)
     3. graphs_data (Dizionario con liste per grafici alta risoluzione)
     """
     df, error = process_fit_data(uploaded_file)
     if error or df is None or df.empty:
         # Ritorna anche graphs_data vuoto alla fine
-        return [], 0, 0, 0, 0, 0, 0, 0, None, {}
+        return IntensitySeries(np.zeros(0), 1.0), 0, 0, 0, 0, 0, 0, 0, None, {}
 
     # --- 1. Statistiche Scalari ---
     avg_power = df['power'].mean() if 'power' in df.columns else 0
@@ -111,9 +117,10 @@ def parse_fit_file_wrapper(uploaded_file, sport_type):
     work_kj = (avg_power * len(df)) / 1000 if 'power' in df.columns else 0
 
     # --- 2. Preparazione Dati Grafici (Sampling ogni 10s) ---
-    df_active = df.reset_index(drop=True)
-    # Raggruppa ogni 10 secondi per non appesantire i grafici
-    df_res = df_active.groupby(df_active.index // 10).mean()
+    with stage("fit.resample"):
+        df_active = df.reset_index(drop=True)
+        # Raggruppa ogni 10 secondi per non appesantire i grafici
+        df_res = df_active.groupby(df_active.index // 10).mean()
 
     graphs_data = {
         'x_dist': [], 'pace': [], 'lap_pace': [],
@@ -155,13 +162,11 @@ def parse_fit_file_wrapper(uploaded_file, sport_type):
             lap_pace_dict = ((1000 / split_speeds) / 60).to_dict()
             graphs_data['lap_pace'] = [lap_pace_dict.get(k, 0) for k in res_split_idx]
 
-    # --- 3. Serie per Simulazione (Sampling 1 min o 1 sec) ---
-    # Per la simulazione metabolica, preferiamo dati al secondo ma qui restituiamo la lista
-    # Se logic.simulate accetta liste lunghe, passiamo df['power'] o df['heart_rate'] raw.
+    # --- 3. Serie per Simulazione (1 Hz, ricampionata dal motore al suo passo) ---
     target_col = 'power' if (sport_type == SportType.CYCLING and 'power' in df.columns) else 'heart_rate'
 
-    simulation_series = []
+    simulation_series = IntensitySeries(np.zeros(0), 1.0)
     if target_col in df.columns:
-        simulation_series = df[target_col].fillna(0).tolist()
+        simulation_series = IntensitySeries.from_frame(df, target_col, unit='W' if target_col == 'power' else 'bpm')
 
     return simulation_series, total_duration_min, avg_power, avg_hr, norm_power, dist, elev_gain, work_kj, df, graphs_data
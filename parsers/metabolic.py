@@ -2,7 +2,10 @@ import math
 import pandas as pd
 import numpy as np
 
+from profiling import profiled, stage
 
+
+@profiled("metabolic.parse")
 def parse_metabolic_report(uploaded_file):
     filename = uploaded_file.name.lower()
     df = None
@@ -122,12 +125,14 @@ def parse_metabolic_report(uploaded_file):
             clean_df['FAT'] *= 60
 
         # --- 3. SMOOTHING (Pulizia Rumore) ---
-        smoothed_df = apply_smoothing(clean_df, metrics)
+        with stage("metabolic.smoothing"):
+            smoothed_df = apply_smoothing(clean_df, metrics)
 
         # --- 4. RESAMPLING UNITARIO (La tua richiesta) ---
         # Interpoliamo per avere 1 riga per ogni Watt/Bpm
         primary_metric = metrics[0]  # Usa la prima disponibile (es. Watt o HR)
-        final_df = resample_to_unit_intervals(smoothed_df, primary_metric)
+        with stage("metabolic.resample"):
+            final_df = resample_to_unit_intervals(smoothed_df, primary_metric)
 
         # Ricalcoliamo le metriche disponibili nel df finale
         final_metrics = [c for c in metrics if c in final_df.columns]
@@ -0,0 +1,201 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_models import ChoMixType, GlycogenState, IntakeMode, IntensitySeries, Sex, Subject, SportType
+
+# Colonne obbligatorie della rosa (una riga per atleta)
+REQUIRED_COLUMNS = ("athlete", "weight_kg", "height_cm", "body_fat_pct", "sex", "sport", "duration_min")
+
+# Valori di default delle colonne opzionali
+ROSTER_DEFAULTS = {
+    "vo2_max": 55.0,
+    "glycogen_conc_g_kg": None,   # None = stimata dal VO2max
+    "muscle_mass_kg": None,
+    "uses_creatine": False,
+    "ftp_watts": 250.0,
+    "threshold_hr": 170.0,
+    "avg_watts": 200.0,
+    "np_watts": None,
+    "avg_hr": 150.0,
+    "efficiency": 22.0,
+    "intensity_file": None,
+    "task": "simulate",           # simulate | strategy
+    "carb_intake_g_h": 60.0,
+    "cho_per_unit_g": 30.0,
+    "crossover_pct": 75.0,
+    "tau_absorption": 20.0,
+    "mix_type": "GLUCOSE_ONLY",
+    "intake_mode": "DISCRETE",
+    "intake_cutoff_min": 0.0,
+    "variability_index": 1.0,
+    "adaptive": False,            # integrazione a passo adattivo (solo aggregati)
+    "taper_days": 0,
+    "taper_cho_g_kg": 5.0,
+    "taper_start_state": "NORMAL",
+}
+
+SEX_ALIASES = {"m": Sex.MALE, "male": Sex.MALE, "uomo": Sex.MALE, "f": Sex.FEMALE, "female": Sex.FEMALE,
+               "donna": Sex.FEMALE}
+SPORT_ALIASES = {"cycling": SportType.CYCLING, "ciclismo": SportType.CYCLING, "running": SportType.RUNNING,
+                 "corsa": SportType.RUNNING, "triathlon": SportType.TRIATHLON, "xc_skiing": SportType.XC_SKIING,
+                 "swimming": SportType.SWIMMING}
+
+# Colonne riconosciute nei file di intensità tabellari (prima trovata vince)
+INTENSITY_COLUMNS = {
+    SportType.CYCLING: ("power", "watts", "avg_watts"),
+    "default": ("heart_rate", "hr", "avg_hr"),
+}
+
+
+# --- 1. LETTURA ROSA ---
+
+def read_table(path):
+    """CSV o Parquet in base all'estensione (Parquet richiede pyarrow o fastparquet)."""
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext in (".parquet", ".pq"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def read_roster(path):
+    """Rosa atleti con le colonne opzionali completate dai default."""
+    df = read_table(path)
+    df.columns = [str(c).strip() for c in df.columns]
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Colonne mancanti nella rosa: {', '.join(missing)}")
+    for col, default in ROSTER_DEFAULTS.items():
+        if col not in df.columns:
+            df[col] = default
+    # Celle vuote -> default della colonna
+    df = df.astype(object)
+    for col, default in ROSTER_DEFAULTS.items():
+        df[col] = pd.Series([default if _is_missing(v) else v for v in df[col]], index=df.index, dtype=object)
+    return df
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, (float, np.floating)) and np.isnan(value)) or value is pd.NA
+
+
+def _enum_member(enum_cls, value, aliases=None):
+    if isinstance(value, enum_cls):
+        return value
+    key = str(value).strip()
+    if aliases and key.lower() in aliases:
+        return aliases[key.lower()]
+    try:
+        return enum_cls[key.upper()]
+    except KeyError:
+        raise ValueError(f"Valore non valido per {enum_cls.__name__}: {value}")
+
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "si", "sì", "y")
+    return bool(value)
+
+
+# --- 2. RIGA -> INPUT DEL MOTORE ---
+
+def build_subject(row, concentration_from_vo2max):
+    """Subject dalla riga (body_fat_pct in percentuale, valori <= 1 intesi come frazione)."""
+    weight = float(row['weight_kg'])
+    body_fat = float(row['body_fat_pct'])
+    vo2 = float(row['vo2_max'])
+    conc = row['glycogen_conc_g_kg']
+    return Subject(
+        weight_kg=weight,
+        height_cm=float(row['height_cm']),
+        body_fat_pct=body_fat / 100.0 if body_fat > 1 else body_fat,
+        sex=_enum_member(Sex, row['sex'], SEX_ALIASES),
+        glycogen_conc_g_kg=float(conc) if conc is not None else concentration_from_vo2max(vo2),
+        sport=_enum_member(SportType, row['sport'], SPORT_ALIASES),
+        uses_creatine=_as_bool(row['uses_creatine']),
+        vo2_max=vo2,
+        vo2max_absolute_l_min=(vo2 * weight) / 1000,
+        muscle_mass_kg=float(row['muscle_mass_kg']) if row['muscle_mass_kg'] is not None else None,
+    )
+
+
+def build_activity_params(row, subject):
+    """Parametri attività con le stesse chiavi usate dalla tab simulazione."""
+    if subject.sport == SportType.CYCLING:
+        avg = float(row['avg_watts'])
+        np_watts = float(row['np_watts']) if row['np_watts'] is not None else avg
+        return {'mode': 'cycling', 'avg_watts': avg, 'np_watts': np_watts,
+                'ftp_watts': float(row['ftp_watts']), 'efficiency': float(row['efficiency'])}
+    return {'mode': 'running', 'avg_hr': float(row['avg_hr']), 'threshold_hr': float(row['threshold_hr'])}
+
+
+def load_intensity_file(path, sport, base_dir=None):
+    """
+    IntensitySeries da file atleta: .fit (parser FIT, richiede fitparse) oppure tabella CSV/Parquet
+    con una colonna potenza/FC a 1 Hz (colonna opzionale sample_rate_hz per altre frequenze).
+    """
+    if base_dir and not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".fit":
+        from parsers.fit import parse_fit_file_wrapper
+        with open(path, "rb") as fh:
+            series = parse_fit_file_wrapper(fh, sport)[0]
+        if len(series) == 0:
+            raise ValueError(f"Nessun dato di intensità in {path}")
+        return series
+
+    df = read_table(path)
+    candidates = INTENSITY_COLUMNS.get(sport, ()) + INTENSITY_COLUMNS["default"]
+    column = next((c for c in candidates if c in df.columns), None)
+    if column is None:
+        raise ValueError(f"Nessuna colonna di intensità in {path} (attese: {', '.join(candidates)})")
+    rate = float(df['sample_rate_hz'].iloc[0]) if 'sample_rate_hz' in df.columns else 1.0
+    unit = 'W' if column in INTENSITY_COLUMNS[SportType.CYCLING] else 'bpm'
+    return IntensitySeries.from_frame(df, column, sample_rate_hz=rate, unit=unit)
+
+
+def taper_days_data(row, subject, race_date=None):
+    """
+    Giorni di scarico generici per calculate_hourly_tapering: riposo, CHO costanti (g/kg),
+    sonno 23:00-07:00 di buona qualità. Lista vuota se taper_days = 0.
+    """
+    n_days = int(row['taper_days'])
+    race_date = race_date or datetime.date.today()
+    cho_in = float(row['taper_cho_g_kg']) * subject.weight_kg
+    days = []
+    for k in range(n_days, 0, -1):
+        days.append({
+            "date_obj": race_date - datetime.timedelta(days=k),
+            "type": "Riposo", "val": 0, "duration": 0, "calculated_if": 0.0,
+            "cho_in": cho_in, "sleep_factor": 1.0,
+            "sleep_start": datetime.time(23, 0), "sleep_end": datetime.time(7, 0),
+            "workout_start": datetime.time(9, 0),
+        })
+    return days
+
+
+def roster_race_settings(row):
+    """Parametri di gara/strategia della riga come kwargs del motore."""
+    return {
+        "task": str(row['task']).strip().lower(),
+        "duration_min": float(row['duration_min']),
+        "carb_intake_g_h": float(row['carb_intake_g_h']),
+        "cho_per_unit_g": float(row['cho_per_unit_g']),
+        "crossover_pct": float(row['crossover_pct']),
+        "tau_absorption": float(row['tau_absorption']),
+        "mix_type": _enum_member(ChoMixType, row['mix_type']),
+        "intake_mode": _enum_member(IntakeMode, row['intake_mode']),
+        "intake_cutoff_min": float(row['intake_cutoff_min']),
+        "variability_index": float(row['variability_index']),
+        "adaptive": _as_bool(row['adaptive']),
+        "taper_start_state": _enum_member(GlycogenState, row['taper_start_state']),
+    }
+
+
+def records(df):
+    """Righe della rosa come dict di valori Python (serializzabili verso i processi worker)."""
+    return [{k: (v.item() if isinstance(v, np.generic) else v) for k, v in row.items()}
+            for row in df.to_dict(orient="records")]
@@ -2,8 +2,10 @@ import math
 import xml.etree.ElementTree as ET
 
 from data_models import SportType
+from profiling import profiled
 
 
+@profiled("zwo.parse")
 def parse_zwo_file(uploaded_file, ftp_watts, thr_hr, sport_type):
     try:
         xml_content = uploaded_file.getvalue().decode('utf-8')
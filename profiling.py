@@ -0,0 +1,210 @@
+"""
+Strumentazione opzionale della pipeline (parsing, motori, grafici).
+
+Disattivata per default: stage() e @profiled costano solo un controllo di una ContextVar.
+Per attivarla si crea un Profiler e lo si rende attivo nel contesto corrente:
+
+    prof = Profiler(track_memory=True)
+    with prof.active():
+        ...                      # ogni stage("nome") registra tempo, chiamate e picco di memoria
+    prof.summary_frame()         # tabella per stage
+    prof.export_chrome_trace("trace.json")   # apribile in chrome://tracing o Perfetto
+
+Con GLICOGENO_PROFILE=1 nell'ambiente, session_profiler() ne crea uno per ogni esecuzione.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+_ACTIVE = contextvars.ContextVar("glicogeno_profiler", default=None)
+
+
+class _Frame:
+    __slots__ = ("name", "start", "start_mem", "max_seen")
+
+    def __init__(self, name, start, start_mem, max_seen):
+        self.name = name
+        self.start = start
+        self.start_mem = start_mem
+        self.max_seen = max_seen
+
+
+class Profiler:
+    """
+    Raccoglie gli stage annidati di un'esecuzione: un evento per chiamata (per la traccia)
+    e aggregati per nome (chiamate, tempo totale/massimo, picco di memoria allocata nello stage).
+    """
+
+    def __init__(self, track_memory=True):
+        self.track_memory = track_memory
+        self.events = []
+        self._stack = []
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+
+    # --- attivazione ---
+
+    @contextmanager
+    def active(self):
+        token = _ACTIVE.set(self)
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        try:
+            yield self
+        finally:
+            _ACTIVE.reset(token)
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+    # --- stage ---
+
+    def _memory(self):
+        if self.track_memory and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()
+        return None
+
+    def enter(self, name):
+        mem = self._memory()
+        if mem is not None:
+            current, peak = mem
+            if self._stack:
+                parent = self._stack[-1]
+                parent.max_seen = max(parent.max_seen, peak)
+            tracemalloc.reset_peak()
+            self._stack.append(_Frame(name, time.perf_counter(), current, current))
+        else:
+            self._stack.append(_Frame(name, time.perf_counter(), 0, 0))
+
+    def exit(self):
+        frame = self._stack.pop()
+        end = time.perf_counter()
+        peak_kb = None
+        mem = self._memory()
+        if mem is not None:
+            _, peak = mem
+            frame.max_seen = max(frame.max_seen, peak)
+            peak_kb = max(frame.max_seen - frame.start_mem, 0) / 1024.0
+            if self._stack:
+                parent = self._stack[-1]
+                parent.max_seen = max(parent.max_seen, frame.max_seen)
+        self.events.append({
+            "name": frame.name,
+            "start_ms": (frame.start - self._origin) * 1000.0,
+            "duration_ms": (end - frame.start) * 1000.0,
+            "depth": len(self._stack),
+            "peak_kb": peak_kb,
+            "thread": threading.get_ident(),
+        })
+
+    # --- risultati ---
+
+    def summary_frame(self):
+        """Una riga per stage: chiamate, tempo totale/medio/massimo (ms), picco memoria (kB)."""
+        columns = ["Stage", "Chiamate", "Totale (ms)", "Medio (ms)", "Max (ms)", "Picco Memoria (kB)"]
+        if not self.events:
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame(self.events)
+        grouped = df.groupby("name", sort=False).agg(
+            calls=("duration_ms", "size"), total=("duration_ms", "sum"), max=("duration_ms", "max"),
+            peak=("peak_kb", "max"), first=("start_ms", "min"),
+        ).sort_values("first")
+        out = pd.DataFrame({
+            "Stage": grouped.index,
+            "Chiamate": grouped["calls"].to_numpy(),
+            "Totale (ms)": grouped["total"].to_numpy(),
+            "Medio (ms)": (grouped["total"] / grouped["calls"]).to_numpy(),
+            "Max (ms)": grouped["max"].to_numpy(),
+            "Picco Memoria (kB)": grouped["peak"].to_numpy(dtype=float),
+        })
+        return out.reset_index(drop=True)
+
+    def chrome_trace(self):
+        """Eventi in formato Trace Event (chrome://tracing, Perfetto): una durata "X" per stage."""
+        pid = os.getpid()
+        events = []
+        for e in self.events:
+            args = {"depth": e["depth"]}
+            if e["peak_kb"] is not None:
+                args["peak_kb"] = round(e["peak_kb"], 1)
+            events.append({
+                "name": e["name"], "cat": e["name"].split(".")[0], "ph": "X",
+                "ts": e["start_ms"] * 1000.0, "dur": e["duration_ms"] * 1000.0,
+                "pid": pid, "tid": e["thread"], "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def chrome_trace_json(self):
+        return json.dumps(self.chrome_trace())
+
+    def export_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(self.chrome_trace_json())
+        return path
+
+
+# --- HOOK PER IL CODICE STRUMENTATO ---
+
+def current_profiler():
+    return _ACTIVE.get()
+
+
+@contextmanager
+def _profiled_stage(profiler, name):
+    profiler.enter(name)
+    try:
+        yield
+    finally:
+        profiler.exit()
+
+
+class _NullStage:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """Context manager di uno stage; senza profiler attivo non fa nulla."""
+    profiler = _ACTIVE.get()
+    if profiler is None:
+        return _NULL_STAGE
+    return _profiled_stage(profiler, name)
+
+
+def profiled(name):
+    """Decoratore: l'intera chiamata è uno stage `name`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = _ACTIVE.get()
+            if profiler is None:
+                return fn(*args, **kwargs)
+            with _profiled_stage(profiler, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def env_enabled():
+    return os.environ.get("GLICOGENO_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def session_profiler(enabled=None, track_memory=True):
+    """Profiler per un'esecuzione (None se disattivato; default da GLICOGENO_PROFILE)."""
+    if enabled is None:
+        enabled = env_enabled()
+    return Profiler(track_memory=track_memory) if enabled else None
@@ -0,0 +1,113 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+import logic
+from batch_runner import run_athlete
+from data_models import GlycogenState
+from parsers.diary import parse_days_data
+from parsers.roster import ROSTER_DEFAULTS, _enum_member, build_subject, taper_days_data
+
+SUBJECT_FIELDS = ("weight_kg", "height_cm", "body_fat_pct", "sex", "sport")
+
+# Endpoint POST esposti dal servizio (nome -> funzione eseguita nei processi worker)
+ENDPOINTS = ("tank", "tapering", "season", "simulate", "strategy")
+
+
+# --- 1. INPUT JSON -> INPUT DEL MOTORE ---
+
+def roster_row(payload, required=SUBJECT_FIELDS):
+    """Richiesta JSON come riga di rosa: stessi campi di batch_runner, default per quelli assenti."""
+    missing = [name for name in required if payload.get(name) is None]
+    if missing:
+        raise ValueError(f"Campi mancanti: {', '.join(missing)}")
+    row = dict(ROSTER_DEFAULTS)
+    row.update({k: v for k, v in payload.items() if v is not None})
+    row.setdefault("athlete", "api")
+    return row
+
+
+def to_json(obj):
+    """Converte risultati del motore (numpy, pandas, date, enum) in tipi JSON."""
+    if isinstance(obj, dict):
+        return {str(k): to_json(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_json(v) for v in obj]
+    if isinstance(obj, pd.DataFrame):
+        # Formato colonnare: {colonna: [valori]}
+        return {col: to_json(obj[col].tolist()) for col in obj.columns}
+    if isinstance(obj, np.ndarray):
+        return to_json(obj.tolist())
+    if isinstance(obj, (np.floating, float)):
+        value = float(obj)
+        return value if np.isfinite(value) else None
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, (pd.Timestamp, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if hasattr(obj, "name") and hasattr(obj, "value") and not isinstance(obj, str):
+        return obj.name
+    return obj
+
+
+# --- 2. CALCOLI ---
+
+def _taper_start_state(row):
+    """Condizione iniziale del diario: solo il campo che serve (niente parametri di gara obbligatori)."""
+    return _enum_member(GlycogenState, row['taper_start_state'])
+
+
+def compute_tank(payload):
+    row = roster_row(payload)
+    subject = build_subject(row, logic.get_concentration_from_vo2max)
+    return logic.calculate_tank(subject)
+
+
+def compute_tapering(payload):
+    """Diario esplicito (days) o blocco di scarico generico (taper_days, taper_cho_g_kg)."""
+    row = roster_row(payload)
+    subject = build_subject(row, logic.get_concentration_from_vo2max)
+    days = parse_days_data(payload["days"]) if payload.get("days") else taper_days_data(row, subject)
+    if not days:
+        raise ValueError("Serve 'days' o 'taper_days' > 0")
+    start_state = _taper_start_state(row)
+    df_hourly, final_tank = logic.calculate_hourly_tapering(subject, days, start_state=start_state)
+    return {"final_tank": final_tank, "hourly": df_hourly}
+
+
+def compute_season(payload):
+    """Stagione da diario esplicito (days): riepilogo giornaliero, niente timeline oraria."""
+    row = roster_row(payload)
+    subject = build_subject(row, logic.get_concentration_from_vo2max)
+    if not payload.get("days"):
+        raise ValueError("Serve 'days'")
+    start_state = _taper_start_state(row)
+    season = logic.run_season_tapering(subject, parse_days_data(payload["days"]), start_state=start_state)
+    return {"final_tank": season["final_tank"], "daily": season["daily"]}
+
+
+def _race(payload, task):
+    result = run_athlete({**roster_row(payload, SUBJECT_FIELDS + ("duration_min",)), "task": task})
+    if result["status"] == "error":
+        raise ValueError(result["error"])
+    return result
+
+
+def compute_simulate(payload):
+    return _race(payload, "simulate")
+
+
+def compute_strategy(payload):
+    return _race(payload, "strategy")
+
+
+def compute(endpoint, payload):
+    """Punto di ingresso dei worker: risultato già convertito in tipi JSON."""
+    handlers = {"tank": compute_tank, "tapering": compute_tapering, "season": compute_season,
+                "simulate": compute_simulate, "strategy": compute_strategy}
+    if endpoint not in handlers:
+        raise KeyError(endpoint)
+    return to_json(handlers[endpoint](payload))
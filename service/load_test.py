@@ -0,0 +1,137 @@
+"""
+Generatore di carico per il servizio JSON: latenza p50/p99 e throughput per livello di concorrenza.
+
+Uso:
+    python -m service.load_test --url http://127.0.0.1:8765 --concurrency 1 4 16 --requests 200
+    python -m service.load_test --spawn --workers 4      # avvia un server locale temporaneo
+
+--unique controlla la quota di richieste distinte (1.0 = nessun riuso di cache, 0.1 = molte ripetute).
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_CONCURRENCY = (1, 4, 16)
+DEFAULT_REQUESTS = 200
+
+
+# --- 1. RICHIESTE ---
+
+def sample_payloads(n, unique_fraction=1.0, seed=0):
+    """Corpi /simulate plausibili; con unique_fraction < 1 una parte si ripete (cache/accorpamento)."""
+    rng = np.random.default_rng(seed)
+    n_unique = max(1, int(round(n * unique_fraction)))
+    base = []
+    for k in range(n_unique):
+        base.append({
+            "athlete": f"load-{k}",
+            "weight_kg": round(float(rng.uniform(55, 90)), 1),
+            "height_cm": 180, "body_fat_pct": 12, "sex": "M", "sport": "cycling",
+            "avg_watts": round(float(rng.uniform(150, 280)), 1), "ftp_watts": 280,
+            "duration_min": int(rng.choice([120, 180, 240, 300])),
+            "carb_intake_g_h": int(rng.choice([40, 60, 90])),
+        })
+    return [base[i % n_unique] for i in rng.permutation(n)]
+
+
+def post(url, payload, timeout=60):
+    """Latenza (s), codice HTTP e intestazione X-Cache di una richiesta."""
+    data = json.dumps(payload).encode()
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return time.perf_counter() - started, response.status, response.headers.get("X-Cache")
+    except urllib.error.HTTPError as e:
+        e.read()
+        return time.perf_counter() - started, e.code, None
+
+
+# --- 2. CAMPAGNA DI CARICO ---
+
+def run_level(url, payloads, concurrency):
+    """Esegue tutte le richieste con `concurrency` client paralleli."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda p: post(url, p), payloads))
+    wall = time.perf_counter() - started
+    latency_ms = np.array([r[0] for r in results]) * 1000
+    codes = [r[1] for r in results]
+    origins = [r[2] for r in results]
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": sum(c == 200 for c in codes),
+        "errors": sum(c != 200 for c in codes),
+        "p50_ms": float(np.percentile(latency_ms, 50)),
+        "p99_ms": float(np.percentile(latency_ms, 99)),
+        "max_ms": float(latency_ms.max()),
+        "throughput_rps": len(results) / wall if wall > 0 else float("inf"),
+        "cache_hits": origins.count("hit"),
+        "coalesced": origins.count("coalesced"),
+    }
+
+
+def run_load_test(base_url, concurrency_levels=DEFAULT_CONCURRENCY, n_requests=DEFAULT_REQUESTS,
+                  unique_fraction=1.0, endpoint="simulate", seed=0):
+    """
+    Una riga per livello di concorrenza. Ogni livello usa payload con seed diverso,
+    così la cache del livello precedente non falsa le misure.
+    """
+    url = f"{base_url.rstrip('/')}/{endpoint}"
+    rows = []
+    for k, level in enumerate(concurrency_levels):
+        payloads = sample_payloads(n_requests, unique_fraction, seed=seed + 1000 * k)
+        rows.append(run_level(url, payloads, level))
+    return rows
+
+
+def format_report(rows):
+    header = f"{'conc':>5} {'req':>6} {'err':>4} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} {'hit':>5} {'coal':>5}"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(f"{r['concurrency']:>5} {r['requests']:>6} {r['errors']:>4} {r['p50_ms']:>9.2f} "
+                     f"{r['p99_ms']:>9.2f} {r['throughput_rps']:>9.1f} {r['cache_hits']:>5} {r['coalesced']:>5}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generatore di carico per service.server.")
+    parser.add_argument("--url", default=None, help="URL base del servizio (es. http://127.0.0.1:8765)")
+    parser.add_argument("--spawn", action="store_true", help="Avvia un server temporaneo su porta libera")
+    parser.add_argument("--workers", type=int, default=None, help="Worker del server avviato con --spawn")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY))
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument("--unique", type=float, default=1.0, help="Quota di richieste distinte (0-1]")
+    parser.add_argument("--endpoint", default="simulate", choices=["simulate", "strategy"])
+    args = parser.parse_args(argv)
+
+    server = service = None
+    url = args.url
+    if args.spawn:
+        from service.server import create_server
+        server, service = create_server(port=0, n_workers=args.workers)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+    if not url:
+        parser.error("serve --url oppure --spawn")
+
+    try:
+        rows = run_load_test(url, args.concurrency, args.requests, args.unique, args.endpoint)
+        print(format_report(rows))
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Servizio JSON locale per i motori di domain/ (nessun import di Streamlit/Altair).
+
+Uso:
+    python -m service.server --port 8765 --workers 4
+
+Endpoint (POST, corpo JSON con i campi di una riga di rosa di batch_runner):
+    /tank, /tapering, /season, /simulate, /strategy
+GET /health e /stats (cache, richieste accorpate, in corso).
+Le richieste identiche già in esecuzione vengono accorpate sulla stessa Future; i risultati
+finiscono in una cache LRU in memoria. Il pool di processi è limitato (workers) e oltre
+max_pending richieste in coda il servizio risponde 503.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from domain.incremental_engine import context_fingerprint
+from service.endpoints import ENDPOINTS, compute
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_MAX_PENDING = 64
+DEFAULT_TIMEOUT_S = 60.0
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+# --- 1. POOL, CACHE E ACCORPAMENTO ---
+
+class SimulationService:
+    """
+    Esecuzione dei calcoli su pool di processi limitato con cache LRU e accorpamento
+    (coalescing) delle richieste identiche in volo. Thread-safe.
+    """
+
+    def __init__(self, n_workers=None, cache_size=DEFAULT_CACHE_SIZE, max_pending=DEFAULT_MAX_PENDING,
+                 timeout_s=DEFAULT_TIMEOUT_S):
+        self.n_workers = max(1, n_workers or os.cpu_count() or 1)
+        self.pool = ProcessPoolExecutor(max_workers=self.n_workers)
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self.timeout_s = timeout_s
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "cache_hits": 0, "coalesced": 0, "computed": 0, "errors": 0, "rejected": 0}
+
+    def request_key(self, endpoint, payload):
+        return context_fingerprint(endpoint, payload)
+
+    def _store(self, key, future):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                self.counters["errors"] += 1
+                return
+            self._cache[key] = future.result()
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def submit(self, endpoint, payload):
+        """Future del risultato: dalla cache, da una richiesta identica in corso o da un nuovo calcolo."""
+        if endpoint not in ENDPOINTS:
+            raise KeyError(endpoint)
+        key = self.request_key(endpoint, payload)
+        with self._lock:
+            self.counters["requests"] += 1
+            if key in self._cache:
+                self.counters["cache_hits"] += 1
+                self._cache.move_to_end(key)
+                return self._cache[key], "hit"
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+                return future, "coalesced"
+            if len(self._inflight) >= self.max_pending:
+                self.counters["rejected"] += 1
+                raise ServiceBusy(f"{len(self._inflight)} richieste in corso")
+            future = self.pool.submit(compute, endpoint, payload)
+            self._inflight[key] = future
+            self.counters["computed"] += 1
+        future.add_done_callback(lambda f: self._store(key, f))
+        return future, "miss"
+
+    def run(self, endpoint, payload):
+        """Risultato (dict JSON) e origine: hit | coalesced | miss."""
+        result, origin = self.submit(endpoint, payload)
+        if origin == "hit":
+            return result, origin
+        return result.result(timeout=self.timeout_s), origin
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "cached": len(self._cache), "inflight": len(self._inflight),
+                    "workers": self.n_workers}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- 2. HTTP ---
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status, body, extra_headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok"})
+            elif self.path == "/stats":
+                self._send(200, service.stats())
+            else:
+                self._send(404, {"error": f"Endpoint sconosciuto: {self.path}"})
+
+        def do_POST(self):
+            endpoint = self.path.strip("/")
+            if endpoint not in ENDPOINTS:
+                self._send(404, {"error": f"Endpoint sconosciuto: /{endpoint}"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(payload, dict):
+                    raise ValueError("Il corpo deve essere un oggetto JSON")
+            except ValueError as e:
+                self._send(400, {"error": f"JSON non valido: {e}"})
+                return
+            started = time.perf_counter()
+            try:
+                result, origin = service.run(endpoint, payload)
+            except ServiceBusy as e:
+                self._send(503, {"error": f"Servizio occupato: {e}"})
+            except FutureTimeout:
+                self._send(504, {"error": "Timeout del calcolo"})
+            except Exception as e:
+                self._send(422, {"error": f"{type(e).__name__}: {e}"})
+            else:
+                elapsed = f"{(time.perf_counter() - started) * 1000:.2f}"
+                self._send(200, result, {"X-Cache": origin, "X-Elapsed-Ms": elapsed})
+
+    return Handler
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, **service_kwargs):
+    """Server HTTP (thread per connessione) e servizio associato; port=0 sceglie una porta libera."""
+    service = SimulationService(**service_kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    return server, service
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servizio JSON locale per le simulazioni glicogeno.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Indirizzo di ascolto (default solo localhost)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Processi del pool (default: CPU disponibili)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING)
+    args = parser.parse_args(argv)
+
+    server, service = create_server(args.host, args.port, n_workers=args.workers,
+                                    cache_size=args.cache_size, max_pending=args.max_pending)
+    print(f"In ascolto su http://{args.host}:{server.server_address[1]} ({service.n_workers} worker)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import datetime
+import os
+import random
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_models import ChoMixType, IntakeMode, Sex, SportType, Subject  # noqa: E402
+
+CURVE_DICT = {'z2': {'hr': 130, 'cho': 60, 'fat': 40}, 'z3': {'hr': 150, 'cho': 120, 'fat': 25},
+              'z4': {'hr': 170, 'cho': 200, 'fat': 8}}
+
+
+def make_subject(**overrides):
+    kwargs = dict(weight_kg=70.0, height_cm=180.0, body_fat_pct=0.12, sex=Sex.MALE, glycogen_conc_g_kg=19.0,
+                  sport=SportType.CYCLING)
+    kwargs.update(overrides)
+    return Subject(**kwargs)
+
+
+def curve_frame():
+    watts = np.arange(80, 400, 1.0)
+    return pd.DataFrame({'Intensity': watts, 'CHO': 20 + watts * 0.6, 'FAT': np.maximum(0, 60 - watts * 0.1)})
+
+
+def random_race(rng):
+    """Scenario di gara casuale (kwargs di simulate_metabolism) da un random.Random con seme."""
+    import logic
+    subj = make_subject(weight_kg=rng.uniform(55, 90))
+    tank = logic.calculate_tank(subj)
+    duration = rng.choice([0, 30, 90, 180, 300, 600])
+    if rng.random() < 0.5:
+        params = {'mode': 'cycling', 'avg_watts': rng.uniform(100, 320), 'ftp_watts': rng.choice([0, 250, 280]),
+                  'efficiency': rng.uniform(19, 24)}
+        if rng.random() < 0.5:
+            params['np_watts'] = params['avg_watts'] * 1.05
+    else:
+        params = {'mode': 'running', 'avg_hr': rng.uniform(120, 175), 'threshold_hr': rng.choice([0, 170])}
+    series = None
+    if rng.random() < 0.4:
+        base = params.get('avg_watts', params.get('avg_hr'))
+        n = rng.choice([0, 10, duration // 2 + 1, duration + 20])
+        series = list(np.random.default_rng(rng.randint(0, 99)).normal(base, base * 0.1, n))
+    curve = None
+    r = rng.random()
+    if r < 0.2:
+        curve = curve_frame()
+    elif r < 0.3:
+        curve = CURVE_DICT
+    race = dict(
+        subject_data=tank, duration_min=duration, constant_carb_intake_g_h=rng.choice([0, 20, 45, 60, 90, 120]),
+        cho_per_unit_g=rng.choice([0, 25, 30]), crossover_pct=rng.choice([0, 60, 75, 85]),
+        tau_absorption=rng.choice([5, 20, 60]), subject_obj=subj, activity_params=params,
+        oxidation_efficiency_input=rng.choice([0.8, 0.95]), mix_type_input=rng.choice(list(ChoMixType)),
+        intensity_series=series, metabolic_curve=curve, intake_mode=rng.choice(list(IntakeMode)),
+        intake_cutoff_min=rng.choice([0, 20, 60]), variability_index=rng.choice([1.0, 1.1]),
+    )
+    if rng.random() < 0.2:
+        race['custom_max_exo_rate'] = 1.0
+    return race
+
+
+def random_days(rng, n_days, start=datetime.date(2024, 1, 1)):
+    """Diario casuale di n_days giorni nel formato di calculate_hourly_tapering."""
+    def clock():
+        return datetime.time(rng.randrange(24), rng.choice([0, 15, 30, 45]))
+
+    return [{
+        "date_obj": start + datetime.timedelta(days=k),
+        "type": rng.choice(["Ciclismo", "Corsa", "Riposo"]), "val": rng.uniform(0, 300),
+        "duration": rng.choice([0, 30, 90, 240, 600, 1440]), "calculated_if": rng.uniform(0, 1.1),
+        "cho_in": rng.choice([0, 50, 200, 400, 900]), "sleep_factor": rng.uniform(0.8, 1.0),
+        "sleep_start": clock(), "sleep_end": clock(), "workout_start": clock(),
+    } for k in range(n_days)]
+
+
+def assert_frames_close(a, b, tol=1e-9):
+    """Stesse colonne e righe; colonne numeriche entro tol (1e-5 se una delle due è float32)."""
+    assert list(a.columns) == list(b.columns)
+    assert len(a) == len(b)
+    for col in a.columns:
+        x, y = a[col], b[col]
+        if not (pd.api.types.is_numeric_dtype(x) and pd.api.types.is_numeric_dtype(y)):
+            assert (x.astype(str).to_numpy() == y.astype(str).to_numpy()).all(), col
+            continue
+        col_tol = max(tol, 1e-5) if 'float32' in (str(x.dtype), str(y.dtype)) else tol
+        np.testing.assert_allclose(x.to_numpy(float), y.to_numpy(float), rtol=col_tol, atol=col_tol, err_msg=col)
+
+
+def assert_stats_close(a, b, tol=1e-9):
+    """Aggregati numerici (dict di simulate_metabolism) uguali entro tol relativa."""
+    assert a.keys() == b.keys()
+    for key in a:
+        assert abs(a[key] - b[key]) <= tol * max(1, abs(a[key])), (key, a[key], b[key])
+
+
+@pytest.fixture
+def subject():
+    return make_subject()
+
+
+@pytest.fixture
+def rng():
+    return random.Random(20240601)
@@ -0,0 +1,55 @@
+import pytest
+
+import logic
+from conftest import make_subject, random_race
+from domain.adaptive_engine import simulate_metabolism_adaptive, validate_against_fixed_step
+from domain.vectorized_engine import MAX_LIVER_OUTPUT_G_MIN, simulate_metabolism_vectorized
+
+CROSSING_KEYS = ("bonk_minute", "minutes_simulated", "stop_reason")
+GRAMS_TOLERANCE = 0.05
+
+
+def _sweep_case(rng):
+    race = random_race(rng)
+    if isinstance(race['metabolic_curve'], dict):
+        race['metabolic_curve'] = None
+    race['summary_only'] = True
+    race['time_step_s'] = rng.choice([60, 60, 10, 1]) if race['duration_min'] <= 300 else 60
+    if race['time_step_s'] != 60:
+        race['intensity_series'] = None
+    if rng.random() < 0.2:
+        race['stop_at_floors'] = (rng.choice([0, 5, 20]), rng.choice([0, 50]))
+    return race
+
+
+def _check_against_fixed(race):
+    _, fixed = simulate_metabolism_vectorized(**race)
+    _, adaptive = simulate_metabolism_adaptive(**race)
+    for key in CROSSING_KEYS:
+        assert adaptive[key] == fixed[key], key
+    tank = race['subject_data']
+    assert adaptive['total_liver_used'] <= tank['liver_glycogen_g'] + 1e-9
+    assert adaptive['total_muscle_used'] <= tank['muscle_glycogen_g'] + 1e-9
+    gaps = validate_against_fixed_step(fixed, adaptive)
+    # Il passo fisso registra per intero l'ultimo prelievo epatico anche oltre la riserva
+    liver_slack = MAX_LIVER_OUTPUT_G_MIN * race['time_step_s'] / 60
+    assert gaps['total_liver_used'] <= liver_slack + GRAMS_TOLERANCE
+    for key in ("final_glycogen", "total_muscle_used", "total_exo_used", "min_liver_g", "min_muscle_g"):
+        assert gaps[key] <= GRAMS_TOLERANCE, key
+
+
+def test_seeded_sweep_matches_fixed_step(rng):
+    for _ in range(80):
+        _check_against_fixed(_sweep_case(rng))
+
+
+@pytest.mark.parametrize("watts", [180, 220, 260])
+@pytest.mark.parametrize("intake", [0, 60])
+@pytest.mark.parametrize("time_step_s", [60, 1])
+def test_depletion_minute_and_used_grams(watts, intake, time_step_s):
+    subj = make_subject()
+    params = {'mode': 'cycling', 'avg_watts': watts, 'ftp_watts': 250, 'efficiency': 22}
+    race = dict(subject_data=logic.calculate_tank(subj), duration_min=240, constant_carb_intake_g_h=intake,
+                cho_per_unit_g=30, crossover_pct=75, tau_absorption=20, subject_obj=subj,
+                activity_params=params, summary_only=True, time_step_s=time_step_s)
+    _check_against_fixed(race)
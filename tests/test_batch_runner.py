@@ -0,0 +1,33 @@
+import pytest
+
+import logic
+from batch_runner import run_athlete
+from parsers.roster import ROSTER_DEFAULTS, build_activity_params, build_subject, roster_race_settings
+
+ROW = {**ROSTER_DEFAULTS, "athlete": "A", "weight_kg": 70, "height_cm": 180, "body_fat_pct": 12, "sex": "m",
+       "sport": "cycling", "task": "strategy", "duration_min": 240, "avg_watts": 180}
+
+
+@pytest.mark.parametrize("crossover_pct, tau_absorption", [(60, 20), (75, 60), (85, 5)])
+def test_strategy_uses_roster_crossover_and_tau(crossover_pct, tau_absorption):
+    result = run_athlete({**ROW, "crossover_pct": crossover_pct, "tau_absorption": tau_absorption})
+    assert result["status"] in ("ok", "infeasible"), result["error"]
+    if result["status"] == "ok":
+        # La simulazione di verifica usa gli stessi parametri del solver: resta sopra i limiti
+        assert result["min_liver_g"] > logic.MIN_LIVER_SAFE
+        assert result["min_muscle_g"] > logic.MIN_MUSCLE_SAFE
+        assert result["bonk_minute"] is None
+
+
+def test_strategy_matches_solver_with_roster_settings():
+    row = {**ROW, "crossover_pct": 85, "tau_absorption": 5, "cho_per_unit_g": 25}
+    subject = build_subject(row, logic.get_concentration_from_vo2max)
+    race = roster_race_settings(row)
+    expected = logic.solve_minimum_strategy(
+        logic.calculate_tank(subject), 240, subject, build_activity_params(row, subject), None, race["mix_type"],
+        race["intake_mode"], cho_per_unit_g=25, crossover_pct=85, tau_absorption=5
+    )
+    result = run_athlete(row)
+    assert result["status"] == "ok"
+    assert result["intake_g_h"] == expected["intake_g_h"]
+    assert result["binding_minute"] == expected["binding_minute"]
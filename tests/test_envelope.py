@@ -0,0 +1,29 @@
+import logic
+
+
+def _params(avg_watts, ftp_watts):
+    return {'mode': 'cycling', 'avg_watts': avg_watts, 'ftp_watts': ftp_watts, 'efficiency': 22}
+
+
+def test_grid_follows_intensity_without_threshold(subject):
+    tank = logic.calculate_tank(subject)
+    store = {}
+    low = logic.sustainability_envelope(store, 'env', tank, subject, _params(150, 0))['envelope']
+    high = logic.sustainability_envelope(store, 'env', tank, subject, _params(300, 0))['envelope']
+    assert high is not low
+    assert high.intensities[-1] == 2 * low.intensities[-1]
+
+
+def test_cached_surface_is_reused_and_never_computed_on_demand(subject):
+    tank = logic.calculate_tank(subject)
+    store = {}
+    empty = logic.sustainability_envelope(store, 'env', tank, subject, _params(200, 250), compute=False)
+    assert empty == {"envelope": None, "current": False}
+
+    first = logic.sustainability_envelope(store, 'env', tank, subject, _params(200, 250))
+    assert first['current']
+    # Con la soglia nota l'intensità corrente non cambia la griglia
+    same = logic.sustainability_envelope(store, 'env', tank, subject, _params(230, 250), compute=False)
+    assert same['current'] and same['envelope'] is first['envelope']
+    stale = logic.sustainability_envelope(store, 'env', tank, subject, _params(200, 280), compute=False)
+    assert not stale['current'] and stale['envelope'] is first['envelope']
@@ -0,0 +1,90 @@
+from conftest import random_race
+from data_models import IntakeMode
+from domain.gradient_engine import GRADIENT_PARAMETERS, simulate_metabolism_gradients
+from domain.strategy_solver import solve_minimum_strategy, solve_minimum_strategy_newton
+from domain.vectorized_engine import simulate_metabolism_vectorized
+from test_strategy_solver import solve, strategy_race
+
+FD_STEPS = {"intake_g_h": 1e-3, "tau_absorption": 1e-4, "oxidation_efficiency": 1e-6, "crossover_pct": 1e-3,
+            "initial_muscle_g": 1e-4, "initial_liver_g": 1e-4}
+CHECKED_OUTPUTS = ("final_glycogen", "min_liver_g", "total_exo_used", "bonk_time_min")
+
+
+def _shifted(race, name, h):
+    race = dict(race)
+    tank = dict(race['subject_data'])
+    if name == "intake_g_h":
+        race['constant_carb_intake_g_h'] += h
+    elif name == "tau_absorption":
+        race['tau_absorption'] += h
+    elif name == "oxidation_efficiency":
+        race['oxidation_efficiency_input'] += h
+    elif name == "crossover_pct":
+        race['crossover_pct'] += h
+    elif name == "initial_muscle_g":
+        tank['muscle_glycogen_g'] += h
+    else:
+        tank['liver_glycogen_g'] += h
+    race['subject_data'] = tank
+    return simulate_metabolism_gradients(**race, parameters=())['values']
+
+
+def _one_sided_differences(race, name, output, h):
+    """Differenze all'indietro e in avanti (None se l'uscita manca in uno dei punti)."""
+    values = [_shifted(race, name, shift)[output] for shift in (-h, 0.0, h)]
+    if any(value is None for value in values):
+        return None, None
+    down, mid, up = values
+    return (mid - down) / h, (up - mid) / h
+
+
+def test_values_match_fixed_step_engine(rng):
+    for _ in range(20):
+        race = random_race(rng)
+        values = simulate_metabolism_gradients(**race, parameters=())['values']
+        _, stats = simulate_metabolism_vectorized(**race)
+        assert values['final_glycogen'] == stats['final_glycogen']
+        assert values['total_exo_used'] == stats['total_exo_used']
+
+
+def test_tangents_match_central_differences(rng):
+    checked = 0
+    for _ in range(25):
+        race = random_race(rng)
+        if rng.random() < 0.5:
+            race['intake_mode'] = IntakeMode.CONTINUOUS
+        race['clamp_reserves'] = rng.random() < 0.5
+        result = simulate_metabolism_gradients(**race)
+        for name in GRADIENT_PARAMETERS:
+            if name == "crossover_pct" and race['metabolic_curve'] is not None:
+                continue
+            # Unità discrete: la derivata rispetto al rateo è quella a orari fissi, non la differenza finita;
+            # a rateo nullo la differenza centrata uscirebbe dal dominio
+            if name == "intake_g_h" and (race['intake_mode'] == IntakeMode.DISCRETE
+                                         or race['constant_carb_intake_g_h'] == 0):
+                continue
+            h = FD_STEPS[name]
+            for output in CHECKED_OUTPUTS:
+                tangent = result['gradients'][output]
+                if tangent is None:
+                    continue
+                backward, forward = _one_sided_differences(race, name, output, h)
+                if backward is None:
+                    continue
+                central = 0.5 * (backward + forward)
+                scale = max(1.0, abs(central))
+                # Punto non derivabile (cap, intestino vuoto, soglia) dentro l'intervallo: salta
+                if abs(forward - backward) > 1e-3 * scale:
+                    continue
+                assert abs(tangent[name] - central) <= 1e-3 * scale, (name, output, tangent[name], central)
+                checked += 1
+    assert checked >= 200
+
+
+def test_newton_matches_bisection(rng):
+    for _ in range(60):
+        race = strategy_race(rng)
+        bisection = solve(race, solve_minimum_strategy)
+        newton = solve(race, solve_minimum_strategy_newton)
+        for key in ("intake_g_h", "binding_constraint", "binding_minute", "feasible"):
+            assert newton[key] == bisection[key], key
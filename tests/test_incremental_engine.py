@@ -0,0 +1,50 @@
+from conftest import assert_frames_close, assert_stats_close, random_race
+from domain.incremental_engine import IncrementalSimulator
+from domain.vectorized_engine import simulate_metabolism_vectorized
+
+CONTEXT_KEYS = ("subject_data", "duration_min", "crossover_pct", "subject_obj", "activity_params",
+                "intensity_series", "metabolic_curve", "variability_index")
+
+
+def _random_run(rng, race):
+    return dict(
+        constant_carb_intake_g_h=rng.choice([0, 30, 60, 90, 120]), cho_per_unit_g=rng.choice([25, 30]),
+        tau_absorption=race['tau_absorption'] if rng.random() < 0.8 else rng.choice([5, 20]),
+        oxidation_efficiency_input=race['oxidation_efficiency_input'], mix_type_input=race['mix_type_input'],
+        custom_max_exo_rate=race.get('custom_max_exo_rate'), intake_mode=race['intake_mode'],
+        intake_cutoff_min=rng.choice([0, 10, 20, 40, 60]),
+    )
+
+
+def test_incremental_runs_match_full_simulation(rng):
+    for _ in range(30):
+        race = random_race(rng)
+        sim = IncrementalSimulator(**{key: race[key] for key in CONTEXT_KEYS},
+                                   checkpoint_stride=rng.choice([1, 7, 10, 30]))
+        for _ in range(6):
+            run = _random_run(rng, race)
+            df_inc, stats_inc = sim.run(**run)
+            df_full, stats_full = simulate_metabolism_vectorized(**{**race, **run})
+            assert_frames_close(df_inc, df_full, tol=1e-12)
+            assert_stats_close(stats_inc, stats_full, tol=1e-12)
+
+
+def test_set_duration_matches_full_simulation(rng):
+    checked = 0
+    while checked < 20:
+        race = random_race(rng)
+        if race['intensity_series'] is not None or race['metabolic_curve'] is not None:
+            continue
+        checked += 1
+        context = {key: race[key] for key in CONTEXT_KEYS}
+        sim = IncrementalSimulator(**context, checkpoint_stride=rng.choice([1, 7, 10, 30]))
+        for _ in range(6):
+            duration = rng.choice([30, 61, 120, 240, 600, 900])
+            assert sim.matches(*{**context, 'duration_min': duration}.values())
+            sim.set_duration(duration)
+            run = _random_run(rng, race)
+            for lane in ("a", "b"):
+                df_inc, stats_inc = sim.run(**run, lane=lane)
+                df_full, stats_full = simulate_metabolism_vectorized(**{**race, **run, 'duration_min': duration})
+                assert_frames_close(df_inc, df_full, tol=1e-12)
+                assert_stats_close(stats_inc, stats_full, tol=1e-12)
@@ -0,0 +1,33 @@
+import pytest
+
+import logic
+from conftest import make_subject
+from domain.intake_optimizer import optimize_intake_schedule
+
+
+def _plan(muscle_g, liver_g, watts, duration, gut_tolerance_g):
+    subj = make_subject()
+    tank = {**logic.calculate_tank(subj), 'muscle_glycogen_g': muscle_g, 'liver_glycogen_g': liver_g}
+    params = {'mode': 'cycling', 'avg_watts': watts, 'ftp_watts': 250, 'efficiency': 22}
+    return optimize_intake_schedule(tank, duration, subj, params, 30, gut_tolerance_g=gut_tolerance_g)
+
+
+@pytest.mark.parametrize("gut_tolerance_g", [30, 60, 1e9])
+def test_muscle_floor_is_reported_regardless_of_gut_tolerance(gut_tolerance_g):
+    plan = _plan(400.0, 90.0, 220, 360, gut_tolerance_g)
+    assert plan['status'] == "muscle"
+    assert plan['binding_constraint'] == "muscle"
+    assert plan['n_units'] == 0 and plan['simulations'] == 1
+
+
+@pytest.mark.parametrize("gut_tolerance_g", [20, 30, 60, 1e9])
+def test_liver_limit_is_not_blamed_on_gut_tolerance(gut_tolerance_g):
+    plan = _plan(900.0, 90.0, 220, 360, gut_tolerance_g)
+    assert plan['status'] == "liver"
+    assert plan['binding_constraint'] == "liver"
+
+
+def test_gut_status_only_when_a_looser_tolerance_is_feasible():
+    assert _plan(900.0, 90.0, 200, 300, 20)['status'] == "gut"
+    relaxed = _plan(900.0, 90.0, 200, 300, 60)
+    assert relaxed['feasible'] and relaxed['binding_constraint'] is None
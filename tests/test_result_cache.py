@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import logic
+from domain.incremental_engine import context_fingerprint
+from domain.result_cache import ScenarioCache
+
+
+def _long_series(middle_w):
+    values = np.full(240, 150.0)
+    values[100:140] = middle_w
+    return pd.Series(values)
+
+
+def test_long_series_differing_in_the_middle_get_distinct_keys():
+    assert repr(_long_series(150.0)) == repr(_long_series(300.0))  # repr abbreviato da pandas
+    assert context_fingerprint(_long_series(150.0)) != context_fingerprint(_long_series(300.0))
+    assert context_fingerprint(pd.Index(_long_series(150.0))) != context_fingerprint(pd.Index(_long_series(300.0)))
+
+
+def test_simulate_metabolism_does_not_reuse_result_for_other_long_series(subject):
+    logic.clear_simulation_cache()
+    tank = logic.calculate_tank(subject)
+    params = {'mode': 'cycling', 'avg_watts': 200.0, 'ftp_watts': 250.0, 'efficiency': 22.0}
+
+    def final_glycogen(series):
+        _, stats = logic.simulate_metabolism(tank, 240, 0, 30, 75, 20, subject, params, intensity_series=series)
+        return stats["final_glycogen"]
+
+    easy = final_glycogen(_long_series(150.0))
+    hard = final_glycogen(_long_series(300.0))
+    logic.clear_simulation_cache()
+    assert hard == final_glycogen(_long_series(300.0))
+    assert hard < easy
+
+
+def test_unsupported_types_skip_the_cache():
+    with pytest.raises(TypeError):
+        context_fingerprint(object())
+    cache = ScenarioCache()
+    calls = []
+    for _ in range(2):
+        cache.call("ns", lambda obj: calls.append(obj) or len(calls), object())
+    assert len(calls) == 2 and len(cache) == 0 and cache.stats()["uncached"] == 2
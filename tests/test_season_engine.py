@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+from conftest import make_subject, random_days
+from data_models import GlycogenState
+from domain.season_engine import iter_tapering_hours, run_season
+from domain.tapering_engine import calculate_hourly_tapering
+
+
+@pytest.mark.parametrize("chunk_days", [1, 7, 28, 1000])
+def test_streamed_season_matches_single_pass(rng, tmp_path, chunk_days):
+    subject = make_subject()
+    for days in (random_days(rng, 120), random_days(rng, 1)):
+        full, final_tank = calculate_hourly_tapering(subject, days, GlycogenState.NORMAL)
+        parts = pd.concat(list(iter_tapering_hours(subject, iter(days), GlycogenState.NORMAL, chunk_days)),
+                          ignore_index=True)
+        assert full.equals(parts)
+
+        path = tmp_path / f"timeline_{chunk_days}.csv"
+        season = run_season(subject, (day for day in days), GlycogenState.NORMAL, chunk_days, hourly_path=path)
+        assert season["final_tank"] == final_tank
+        assert season["n_hours"] == len(full)
+        hourly = pd.read_csv(path, float_precision="round_trip")
+        assert (hourly["Muscolare"].to_numpy() == full["Muscolare"].to_numpy()).all()
+
+        daily = season["daily"]
+        assert daily.equals(run_season(subject, days, GlycogenState.NORMAL, 100000)["daily"])
+        liver = full["Epatico"].to_numpy().reshape(-1, 24)
+        assert (daily["Muscolare"].to_numpy() == full["Muscolare"].to_numpy().reshape(-1, 24)[:, -1]).all()
+        assert (daily["Epatico Min"].to_numpy() == liver.min(axis=1)).all()
+
+
+def test_empty_season_writes_no_file(tmp_path):
+    path = tmp_path / "timeline.csv"
+    season = run_season(make_subject(), [], hourly_path=path)
+    assert season["n_days"] == 0 and season["hourly_path"] is None
+    assert not path.exists()
@@ -0,0 +1,14 @@
+from domain.sensitivity_engine import build_factors
+
+PARAMS = {'mode': 'cycling', 'avg_watts': 200, 'ftp_watts': 250, 'efficiency': 22}
+
+
+def _names(subject, use_lab_curve):
+    return {factor.name for factor in build_factors(subject, PARAMS, use_lab_curve=use_lab_curve)}
+
+
+def test_lab_only_factors_follow_the_curve(subject):
+    without_curve = _names(subject, use_lab_curve=False)
+    assert "crossover_pct" in without_curve and "cho_drift" not in without_curve
+    with_curve = _names(subject, use_lab_curve=True)
+    assert "cho_drift" in with_curve and "crossover_pct" not in with_curve
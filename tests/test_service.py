@@ -0,0 +1,51 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from service.endpoints import compute
+from service.server import create_server
+
+ATHLETE = {"weight_kg": 70, "height_cm": 180, "body_fat_pct": 12, "sex": "m", "sport": "cycling"}
+
+
+def test_tapering_does_not_require_race_fields():
+    result = compute("tapering", {**ATHLETE, "taper_days": 2, "taper_start_state": "NORMAL"})
+    assert len(result["hourly"]["Ora"]) == 48
+    assert result["final_tank"]["fill_pct"] > 0
+
+
+def test_season_does_not_require_race_fields():
+    days = [{"date": "2024-01-01", "cho_in": 400},
+            {"date": "2024-01-02", "type": "Ciclismo", "val": 200, "duration": 60, "calculated_if": 0.8}]
+    result = compute("season", {**ATHLETE, "days": days})
+    assert result["daily"]["Data"] == ["2024-01-01T00:00:00", "2024-01-02T00:00:00"]
+
+
+@pytest.fixture
+def server():
+    server, service = create_server(port=0, n_workers=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+def _post(server, path, payload):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=60)
+    conn.request("POST", path, json.dumps(payload), {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    body = json.loads(response.read())
+    conn.close()
+    return response.status, body
+
+
+def test_http_status_codes(server):
+    assert _post(server, "/tapering", {**ATHLETE, "taper_days": 2})[0] == 200
+    assert _post(server, "/nope", ATHLETE)[0] == 404
+    # Campo mancante nel calcolo (KeyError interno): errore di input, non endpoint sconosciuto
+    status, body = _post(server, "/season", {**ATHLETE, "days": [{"cho_in": 300}]})
+    assert status == 422 and "KeyError" in body["error"]
@@ -0,0 +1,66 @@
+from conftest import random_race
+from domain.strategy_solver import (
+    MIN_LIVER_SAFE, MIN_MUSCLE_SAFE, evaluate_summary_floors, solve_minimum_strategy
+)
+from domain.vectorized_engine import simulate_metabolism_vectorized
+
+MAX_INTAKE_G_H = 120
+
+
+def strategy_race(rng):
+    """
+    Scenario di random_race a intensità moderata (l'intake minimo cade spesso fra 0 e 120 g/h),
+    con i parametri che il solver non espone fissati ai default.
+    """
+    race = random_race(rng)
+    race.pop('custom_max_exo_rate', None)
+    race['oxidation_efficiency_input'] = 0.80
+    race['cho_per_unit_g'] = race['cho_per_unit_g'] or 30
+    race['duration_min'] = rng.choice([120, 180, 240, 300])
+    race['intensity_series'] = None
+    params = dict(race['activity_params'])
+    if params['mode'] == 'cycling':
+        params['avg_watts'] = rng.uniform(140, 200)
+        params.pop('np_watts', None)
+    else:
+        params['avg_hr'] = rng.uniform(125, 150)
+    race['activity_params'] = params
+    return race
+
+
+def solve(race, solver=solve_minimum_strategy):
+    return solver(
+        race['subject_data'], race['duration_min'], race['subject_obj'], race['activity_params'],
+        race['metabolic_curve'], race['mix_type_input'], race['intake_mode'],
+        intake_cutoff_min=race['intake_cutoff_min'], variability_index=race['variability_index'],
+        intensity_series=race['intensity_series'], cho_per_unit_g=race['cho_per_unit_g'],
+        crossover_pct=race['crossover_pct'], tau_absorption=race['tau_absorption']
+    )
+
+
+def brute_force(race):
+    """Primo intake sostenibile scandendo 0..120 g/h a passi di 1 g/h (None se nessuno)."""
+    for intake in range(MAX_INTAKE_G_H + 1):
+        _, stats = simulate_metabolism_vectorized(
+            **{**race, 'constant_carb_intake_g_h': intake}, summary_only=True,
+            stop_at_floors=(MIN_LIVER_SAFE, MIN_MUSCLE_SAFE)
+        )
+        floors = evaluate_summary_floors(stats)
+        if floors['feasible']:
+            return intake, floors
+    return None, floors
+
+
+def test_bisection_matches_brute_force_scan(rng):
+    positive = 0
+    for _ in range(60):
+        race = strategy_race(rng)
+        intake, floors = brute_force(race)
+        result = solve(race)
+        assert result['intake_g_h'] == intake
+        assert result['binding_constraint'] == floors['binding_constraint']
+        assert result['binding_minute'] == floors['binding_minute']
+        assert result['simulations'] <= 10
+        positive += bool(intake)
+    # Il campione deve coprire anche soluzioni interne alla griglia, non solo 0 g/h o irraggiungibili
+    assert positive >= 8
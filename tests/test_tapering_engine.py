@@ -0,0 +1,15 @@
+from conftest import make_subject, random_days
+from data_models import GlycogenState
+from domain.tapering_engine import calculate_hourly_tapering, calculate_hourly_tapering_reference
+
+
+def test_vectorized_tapering_matches_reference(rng):
+    subject = make_subject()
+    diaries = [[], random_days(rng, 90)] + [random_days(rng, rng.randint(1, 40)) for _ in range(60)]
+    for days in diaries:
+        start_state = rng.choice(list(GlycogenState))
+        df_ref, tank_ref = calculate_hourly_tapering_reference(subject, days, start_state)
+        df_vec, tank_vec = calculate_hourly_tapering(subject, days, start_state)
+        assert df_ref.equals(df_vec)
+        assert list(df_ref.dtypes) == list(df_vec.dtypes)
+        assert tank_ref == tank_vec
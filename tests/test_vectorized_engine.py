@@ -0,0 +1,17 @@
+from conftest import assert_frames_close, assert_stats_close, random_race
+from domain.metabolism_engine import simulate_metabolism as simulate_metabolism_reference
+from domain.substrate_model import substrate_table
+from domain.vectorized_engine import simulate_metabolism_vectorized
+
+
+def test_vectorized_matches_scalar_reference(rng):
+    # Il riferimento usa il polinomio esatto, il motore vettoriale la tabella: l'errore dichiarato
+    # della tabella si può sommare minuto per minuto nelle colonne cumulative
+    table = substrate_table()
+    for _ in range(120):
+        race = random_race(rng)
+        tol = max(table.max_error, table.max_cho_error) * max(1, race['duration_min'])
+        df_ref, stats_ref = simulate_metabolism_reference(**race)
+        df_vec, stats_vec = simulate_metabolism_vectorized(**race)
+        assert_frames_close(df_ref, df_vec, tol)
+        assert_stats_close(stats_ref, stats_vec, tol)
@@ -73,11 +73,9 @@ def render_tab_profile(db_data, weight, user_vo2, user_vlamax, selected_sport, s
                             help="Se scegli HR, la simulazione userà la frequenza cardiaca del file FIT. Se scegli Watt, userà la potenza."
                         )
 
-                        # Preparazione DataFrame Curve
-                        df_curve = df_raw.copy()
-                        # Rinomina la colonna scelta in 'Intensity' per standardizzare
-                        df_curve['Intensity'] = df_curve[sel_metric]
-                        df_curve = df_curve[df_curve['Intensity'] > 0].sort_values('Intensity').reset_index(drop=True)
+                        # Curva compilata una volta sulla metrica scelta (array contigui, niente pandas nel motore)
+                        metabolic_curve = logic.build_metabolic_curve(df_raw, sel_metric)
+                        df_curve = metabolic_curve.to_frame()
 
                         # Visualizzazione Grafico Anteprima
                         c_chart = alt.Chart(df_curve).mark_line(point=True).encode(
@@ -90,7 +88,7 @@ def render_tab_profile(db_data, weight, user_vo2, user_vlamax, selected_sport, s
 
                         # Salvataggio in Session State
                         st.session_state['use_lab_data'] = True
-                        st.session_state['metabolic_curve'] = df_curve
+                        st.session_state['metabolic_curve'] = metabolic_curve
                         st.session_state['curve_metric'] = sel_metric  # <--- SALVIAMO LA SCELTA UTENTE
                         st.info(f"Curve salvate basate su: **{sel_metric}**")
                     else:
@@ -4,7 +4,13 @@ import streamlit as st
 
 import logic
 import utils
-from data_models import ChoMixType, IntakeMode, SportType
+from data_models import ChoMixType, IntakeMode, IntensitySeries, SeriesAggregation, SportType
+
+
+def render_chart(label, chart, **kwargs):
+    """st.altair_chart come stage "chart.<label>" (la serializzazione Vega-Lite avviene qui)."""
+    with utils.profile_stage(f"chart.{label}"):
+        st.altair_chart(chart, **kwargs)
 
 
 def render_tab_simulation(sim_method, create_cutoff_line):
@@ -45,6 +51,7 @@ def render_tab_simulation(sim_method, create_cutoff_line):
         params = {}
         vi_input = 1.0
         file_loaded = False
+        native_1hz = False
 
         target_thresh_hr = st.session_state.get('thr_hr_input', 170)
         target_ftp = st.session_state.get('ftp_watts_input', 250)
@@ -61,6 +68,12 @@ def render_tab_simulation(sim_method, create_cutoff_line):
                     fit_df = fit_clean_df
                     st.success("✅ File FIT elaborato")
 
+                    # Serie al secondo: il motore la ricampiona una sola volta al suo passo
+                    agg_sel = st.selectbox("Aggregazione al Minuto", list(SeriesAggregation), format_func=lambda x: x.label,
+                                           help="La media 4ª potenza pesa di più i picchi (come la Normalized Power).")
+                    native_1hz = st.checkbox("Simulazione Nativa 1 Hz", value=False,
+                                             help="Integra il modello secondo per secondo sui dati del FIT.")
+
                     # --- NUOVA LOGICA: ALLINEAMENTO METABOLICO ---
                     # Recupera le impostazioni dal Tab 1
                     lab_active = st.session_state.get('use_lab_data', False)
@@ -81,21 +94,18 @@ def render_tab_simulation(sim_method, create_cutoff_line):
                             forced_source_col = 'speed'  # fitparse restituisce m/s di solito, check utils
                             forced_metric_name = 'Speed'
 
-                    # Estrazione Serie Temporale (Resampled 1min)
-                    df_resampled = fit_clean_df.resample('1min').mean()
-
                     if forced_source_col:
                         # ABBIAMO TROVATO IL MATCH! Usiamo la metrica della curva.
                         st.info(f"🔄 **Allineamento Attivo:** Simulazione basata su **{forced_metric_name}** come da Profilo Lab.")
 
                         # Gestione specifica Speed (di solito m/s -> km/h per matchare Lab)
                         if forced_source_col == 'speed':
-                            intensity_series = (df_resampled[forced_source_col] * 3.6).fillna(0).tolist()
+                            intensity_series = IntensitySeries.from_frame(fit_clean_df, 'speed', scale=3.6, unit='km/h', aggregation=agg_sel)
                             val = int(fit_clean_df['speed'].mean() * 3.6)
                             params = {'mode': 'running', 'avg_watts': val}  # Hack: passiamo speed come avg_watts
                         else:
-                            intensity_series = df_resampled[forced_source_col].fillna(0).tolist()
-                            val = int(df_resampled[forced_source_col].mean())
+                            intensity_series = IntensitySeries.from_frame(fit_clean_df, forced_source_col, aggregation=agg_sel)
+                            val = int(fit_clean_df[forced_source_col].mean())
 
                             if forced_source_col == 'heart_rate':
                                 params = {'mode': 'running', 'avg_hr': val, 'threshold_hr': target_thresh_hr}
@@ -109,7 +119,8 @@ def render_tab_simulation(sim_method, create_cutoff_line):
 
                         if subj.sport == SportType.CYCLING:
                             k2.metric("Avg Power", f"{int(fit_avg_w)} W")
-                            intensity_series = fit_series  # Watt
+                            fit_series.aggregation = agg_sel
+                            intensity_series = fit_series  # Watt, 1 Hz
                             val = int(fit_avg_w)
                             vi_input = fit_np / fit_avg_w if fit_avg_w > 0 else 1.0
                             params = {'mode': 'cycling', 'avg_watts': val, 'np_watts': fit_np, 'ftp_watts': target_ftp, 'efficiency': 22.0}
@@ -117,10 +128,10 @@ def render_tab_simulation(sim_method, create_cutoff_line):
                             k2.metric("Avg HR", f"{int(fit_avg_hr)} bpm")
                             val = int(fit_avg_hr)
                             if fit_avg_w > 0:  # Stryd
-                                intensity_series = df_resampled['power'].fillna(0).tolist()
+                                intensity_series = IntensitySeries.from_frame(fit_clean_df, 'power', unit='W', aggregation=agg_sel)
                                 params = {'mode': 'running', 'avg_watts': fit_avg_w, 'ftp_watts': target_ftp}
                             else:
-                                intensity_series = df_resampled['heart_rate'].fillna(0).tolist()
+                                intensity_series = IntensitySeries.from_frame(fit_clean_df, 'heart_rate', unit='bpm', aggregation=agg_sel)
                                 params = {'mode': 'running', 'avg_hr': val, 'threshold_hr': target_thresh_hr}
 
             elif fname.endswith('.zwo'):
@@ -128,7 +139,9 @@ def render_tab_simulation(sim_method, create_cutoff_line):
                 if series:
                     duration = dur_calc
                     st.success(f"✅ ZWO: {dur_calc} min")
-                    intensity_series = [val * target_ftp if subj.sport == SportType.CYCLING else val * target_thresh_hr for val in series]
+                    intensity_series = IntensitySeries.per_minute(
+                        [val * target_ftp if subj.sport == SportType.CYCLING else val * target_thresh_hr for val in series]
+                    )
                     val = w_calc * target_ftp
                     params = {'mode': 'cycling' if subj.sport == SportType.CYCLING else 'running', 'avg_watts': val, 'threshold_hr': target_thresh_hr}
 
@@ -211,10 +224,17 @@ def render_tab_simulation(sim_method, create_cutoff_line):
             tau = st.slider("Costante Assorbimento (Tau)", 5, 60, 20)
             risk_thresh = st.slider("Soglia Tolleranza GI (g)", 10, 100, 30)
 
+        gut_compartments = st.checkbox(
+            "Modello Intestinale Multi-Compartimento", value=False,
+            help="Stomaco → intestino (glucosio via SGLT1, fruttosio via GLUT5) → ossidazione. "
+                 "Il Gut Load conta solo stomaco e intestino."
+        )
+        gut_model = logic.GUT_MODEL_COMPARTMENTS if gut_compartments else logic.GUT_MODEL_BUCKET
+
     # --- GRAFICO FIT ---
     if fit_df is not None:
         with st.expander("Analisi Dettagliata File FIT", expanded=True):
-            st.altair_chart(utils.create_fit_plot(fit_df), use_container_width=True)
+            render_chart("fit_plot", utils.create_fit_plot(fit_df), use_container_width=True)
 
     # --- SELEZIONE MODALITÀ SIMULAZIONE ---
     st.markdown("---")
@@ -223,32 +243,38 @@ def render_tab_simulation(sim_method, create_cutoff_line):
 
     if sim_mode == "Simulazione Manuale (Verifica Tattica)":
 
-        # CHIAMATA PULITA AL NUOVO LOGIC.PY (Senza parametri Mader/Running method)
-        df_sim, stats_sim = logic.simulate_metabolism(
-            tank, duration, cho_h, cho_unit,
-            crossover_val if not use_lab_active else 75,
-            tau, subj, params,
-            mix_type_input=mix_sel,
-            intensity_series=intensity_series,
-            metabolic_curve=curve_data if use_lab_active else None,
-            intake_mode=intake_mode_enum,
-            intake_cutoff_min=intake_cutoff,
-            variability_index=vi_input
-        )
+        if native_1hz or gut_compartments:
+            # Passo di 1 secondo o modello multi-compartimento: strategia e digiuno simulati separatamente
+            sim_kwargs = dict(
+                mix_type_input=mix_sel,
+                intensity_series=intensity_series,
+                metabolic_curve=curve_data if use_lab_active else None,
+                intake_mode=intake_mode_enum,
+                intake_cutoff_min=intake_cutoff,
+                variability_index=vi_input,
+                time_step_s=1 if native_1hz else 60,
+                gut_model=gut_model
+            )
+            sim_crossover = crossover_val if not use_lab_active else 75
+            df_sim, stats_sim = logic.simulate_metabolism(tank, duration, cho_h, cho_unit, sim_crossover, tau, subj, params, **sim_kwargs)
+            df_no, _ = logic.simulate_metabolism(tank, duration, 0, cho_unit, sim_crossover, tau, subj, params, **sim_kwargs)
+        else:
+            # Simulatore con checkpoint in session state: muovendo intake o cutoff si ricalcola solo la coda
+            sim = logic.incremental_simulator(
+                st.session_state, 'incremental_simulator', tank, duration,
+                crossover_val if not use_lab_active else 75, subj, params,
+                intensity_series=intensity_series,
+                metabolic_curve=curve_data if use_lab_active else None,
+                variability_index=vi_input
+            )
+            run_kwargs = dict(mix_type_input=mix_sel, intake_mode=intake_mode_enum, intake_cutoff_min=intake_cutoff)
+            with utils.profile_stage("engine.incremental"):
+                df_sim, stats_sim = sim.run(cho_h, cho_unit, tau, lane="strategia", **run_kwargs)
+                df_no, _ = sim.run(0, cho_unit, tau, lane="digiuno", **run_kwargs)
+
         df_sim['Scenario'] = 'Strategia Integrata'
         df_sim['Residuo Totale'] = df_sim['Residuo Muscolare'] + df_sim['Residuo Epatico']
 
-        df_no, _ = logic.simulate_metabolism(
-            tank, duration, 0, cho_unit,
-            crossover_val if not use_lab_active else 75,
-            tau, subj, params,
-            mix_type_input=mix_sel,
-            intensity_series=intensity_series,
-            metabolic_curve=curve_data if use_lab_active else None,
-            intake_mode=intake_mode_enum,
-            intake_cutoff_min=intake_cutoff,
-            variability_index=vi_input
-        )
         df_no['Scenario'] = 'Riferimento (Digiuno)'
         df_no['Residuo Totale'] = df_no['Residuo Muscolare'] + df_no['Residuo Epatico']
 
@@ -298,15 +324,15 @@ def render_tab_simulation(sim_method, create_cutoff_line):
         )
 
         # Uniamo tutto
-        st.altair_chart((chart_stack + chart_total + cutoff_line).interactive(), use_container_width=True)
+        render_chart("energy_balance", (chart_stack + chart_total + cutoff_line).interactive(), use_container_width=True)
 
         # INIEZIONE BPM REALI (Se disponibili dal FIT)
         if fit_df is not None and 'heart_rate' in fit_df.columns:
-            # Resample della HR originale del FIT per matchare i minuti della simulazione
-            hr_resampled = fit_df.resample('1min')['heart_rate'].mean().fillna(0)
+            # HR del FIT sul tempo in movimento, media per minuto come la simulazione
+            hr_minutes = IntensitySeries.from_frame(fit_df, 'heart_rate').values_at_step(60)
             # Allinea le lunghezze
             sim_len = len(df_sim)
-            hr_list = hr_resampled.tolist()[:sim_len]
+            hr_list = hr_minutes.tolist()[:sim_len]
             # Se la simulazione è più lunga del fit (es. manual override), pad con 0
             if len(hr_list) < sim_len:
                 hr_list += [0] * (sim_len - len(hr_list))
@@ -338,7 +364,7 @@ def render_tab_simulation(sim_method, create_cutoff_line):
                 tooltip=['Time (min)', 'BPM_Activity']
             )
 
-            st.altair_chart(alt.layer(line_fat, line_hr).resolve_scale(y='independent').interactive(), use_container_width=True)
+            render_chart("fat_vs_hr", alt.layer(line_fat, line_hr).resolve_scale(y='independent').interactive(), use_container_width=True)
 
         # --- GRAFICO 2: Bilancio Carboidrati Completo + BPM ---
         st.markdown("### 📊 Dettaglio Carboidrati & Intensità")
@@ -373,7 +399,7 @@ def render_tab_simulation(sim_method, create_cutoff_line):
         # Layering: Stack + Linea Totale su asse SX, HR su asse DX
         combined_cho = alt.layer(chart_stack + chart_total_cho, chart_hr_overlay).resolve_scale(y='independent')
 
-        st.altair_chart(combined_cho.interactive(), use_container_width=True)
+        render_chart("cho_intensity", combined_cho.interactive(), use_container_width=True)
 
         st.markdown("---")
         st.markdown("#### Confronto Riserve Nette")
@@ -407,9 +433,9 @@ def render_tab_simulation(sim_method, create_cutoff_line):
 
         c_strat, c_digi = st.columns(2)
         with c_strat:
-            st.altair_chart(create_reserve_stacked_chart(df_reserve_sim, "Con Integrazione"), use_container_width=True)
+            render_chart("reserve_strategy", create_reserve_stacked_chart(df_reserve_sim, "Con Integrazione"), use_container_width=True)
         with c_digi:
-            st.altair_chart(create_reserve_stacked_chart(df_reserve_no, "Digiuno"), use_container_width=True)
+            render_chart("reserve_fasting", create_reserve_stacked_chart(df_reserve_no, "Digiuno"), use_container_width=True)
 
         st.markdown("---")
         st.markdown("#### Analisi Gut Load")
@@ -417,7 +443,12 @@ def render_tab_simulation(sim_method, create_cutoff_line):
         area_gut = base.mark_area(color='#795548', opacity=0.6).encode(y=alt.Y('Gut Load', title='Accumulo (g)'), tooltip=['Gut Load'])
         rule = alt.Chart(pd.DataFrame({'y': [risk_thresh]})).mark_rule(color='red', strokeDash=[5,5]).encode(y='y')
         chart_gi = alt.layer(area_gut, rule, cutoff_line).properties(height=350)
-        st.altair_chart(chart_gi, use_container_width=True)
+        render_chart("gut_load", chart_gi, use_container_width=True)
+
+        # Tabella formattata solo su richiesta: i grafici usano le colonne numeriche
+        with st.expander("📋 Tabella Dati Minuto per Minuto"):
+            if st.checkbox("Mostra tabella", value=False, key="show_sim_table"):
+                st.dataframe(logic.format_simulation_table(df_sim), use_container_width=True, hide_index=True)
 
         st.markdown("---")
         st.subheader("Analisi Criticità & Timing")
@@ -450,9 +481,190 @@ def render_tab_simulation(sim_method, create_cutoff_line):
             else:
                 st.metric("Buffer Energetico", "Sicuro")
 
+        # --- INCERTEZZA (MONTE CARLO) ---
+        with st.expander("Analisi Incertezza (Monte Carlo)"):
+            st.caption("Ripete la simulazione variando concentrazione glicogeno, massa grassa, efficienza, tau, crossover ed efficienza di ossidazione.")
+            c_mc1, c_mc2, c_mc3 = st.columns(3)
+            mc_samples = c_mc1.select_slider("Numero Simulazioni", [500, 1000, 2000, 5000], value=2000)
+            mc_spread = c_mc2.slider("Ampiezza Incertezza (x)", 0.5, 2.0, 1.0, 0.25)
+            mc_seed = c_mc3.number_input("Seed", 0, 9999, 0)
+
+            if st.button("Avvia Analisi Monte Carlo"):
+                distributions = logic.default_uncertainty(
+                    subj, params, tau, crossover_val if not use_lab_active else 75, spread=mc_spread
+                )
+                with st.spinner("Simulazione in corso..."):
+                    mc = logic.run_monte_carlo(
+                        tank, duration, cho_h, cho_unit,
+                        crossover_val if not use_lab_active else 75,
+                        tau, subj, params,
+                        mix_type_input=mix_sel,
+                        intensity_series=intensity_series,
+                        metabolic_curve=curve_data if use_lab_active else None,
+                        intake_mode=intake_mode_enum,
+                        intake_cutoff_min=intake_cutoff,
+                        variability_index=vi_input,
+                        distributions=distributions,
+                        n_samples=mc_samples,
+                        seed=int(mc_seed)
+                    )
+                df_mc = mc.bands_frame('total')
+
+                c_mr1, c_mr2, c_mr3 = st.columns(3)
+                c_mr1.metric("Probabilità Crisi", f"{mc.final_bonk_probability * 100:.0f}%")
+                c_mr2.metric("Residuo Finale (P50)", f"{int(df_mc['P50'].iloc[-1])} g")
+                c_mr3.metric("Residuo Finale (P5-P95)", f"{int(df_mc['P5'].iloc[-1])}-{int(df_mc['P95'].iloc[-1])} g")
+
+                band_outer = alt.Chart(df_mc).mark_area(opacity=0.2, color='#1E88E5').encode(
+                    x='Time (min)', y=alt.Y('P5', title='Residuo Totale (g)'), y2='P95'
+                )
+                band_inner = alt.Chart(df_mc).mark_area(opacity=0.35, color='#1E88E5').encode(
+                    x='Time (min)', y='P25', y2='P75'
+                )
+                median = alt.Chart(df_mc).mark_line(color='#0D47A1').encode(
+                    x='Time (min)', y='P50', tooltip=['Time (min)', 'P5', 'P50', 'P95']
+                )
+                render_chart("monte_carlo_band", (band_outer + band_inner + median + cutoff_line).properties(height=300), use_container_width=True)
+
+                chart_bonk = alt.Chart(df_mc).mark_line(color='#C62828').encode(
+                    x='Time (min)',
+                    y=alt.Y('Prob. Crisi', title='Probabilità Crisi (cumulata)', axis=alt.Axis(format='%')),
+                    tooltip=['Time (min)', alt.Tooltip('Prob. Crisi', format='.0%')]
+                )
+                render_chart("monte_carlo_bonk", chart_bonk.properties(height=200), use_container_width=True)
+
+        # --- SENSIBILITÀ (MORRIS) ---
+        with st.expander("Analisi di Sensibilità (Cosa conta di più?)"):
+            st.caption("Varia insieme parametri atleta, attività, strategia e costanti del motore e li ordina per impatto sul glicogeno finale.")
+            c_sa1, c_sa2 = st.columns(2)
+            sa_range = c_sa1.slider("Variazione Parametri (±%)", 5, 30, 10, 5)
+            sa_traj = c_sa2.select_slider("Traiettorie di Morris", [25, 50, 100, 200], value=100)
+
+            if st.button("Avvia Analisi di Sensibilità"):
+                with st.spinner("Simulazione in corso..."):
+                    sens = logic.run_sensitivity_analysis(
+                        tank, duration, cho_h, cho_unit,
+                        crossover_val if not use_lab_active else 75,
+                        tau, subj, params,
+                        mix_type_input=mix_sel,
+                        intensity_series=intensity_series,
+                        metabolic_curve=curve_data if use_lab_active else None,
+                        intake_mode=intake_mode_enum,
+                        intake_cutoff_min=intake_cutoff,
+                        variability_index=vi_input,
+                        rel_range=sa_range / 100.0,
+                        n_trajectories=sa_traj
+                    )
+                df_tornado = sens['tornado']
+                st.caption(f"{sens['simulations']} simulazioni · μ* = effetto medio assoluto sull'intero range, σ = non linearità / interazioni.")
+
+                chart_tornado = alt.Chart(df_tornado).mark_bar().encode(
+                    x=alt.X('μ* Glicogeno', title='Impatto su Glicogeno Finale (g)'),
+                    y=alt.Y('Parametro', sort=None, title=None),
+                    color=alt.Color('Gruppo', legend=alt.Legend(orient='bottom')),
+                    tooltip=['Parametro', 'Basso', 'Alto',
+                             alt.Tooltip('μ* Glicogeno', format='.1f'), alt.Tooltip('σ Glicogeno', format='.1f'),
+                             alt.Tooltip('μ* Minuto Crisi', format='.0f')]
+                )
+                render_chart("sensitivity_tornado", chart_tornado.properties(height=max(200, 24 * len(df_tornado))), use_container_width=True)
+                st.dataframe(
+                    df_tornado[['Rank', 'Parametro', 'Gruppo', 'Basso', 'Alto',
+                                'Δ Glicogeno @Basso (g)', 'Δ Glicogeno @Alto (g)',
+                                'μ* Glicogeno', 'σ Glicogeno', 'μ* Minuto Crisi', 'σ Minuto Crisi']].round(3),
+                    hide_index=True, use_container_width=True
+                )
+
+        # --- INVILUPPO DI SOSTENIBILITÀ ---
+        with st.expander("Inviluppo di Sostenibilità (Durata × Intensità × Intake)"):
+            st.caption("Superficie precalcolata a intensità costante: intensità media massima senza crisi per ogni durata e rateo di intake.")
+            # Superficie costosa (~2.000 simulazioni): solo su richiesta, altrimenti l'ultima calcolata
+            run_envelope = st.button("Calcola Inviluppo")
+            envelope_state = logic.sustainability_envelope(
+                st.session_state, 'sustainability_envelope', tank, subj, params,
+                crossover_pct=crossover_val if not use_lab_active else 75,
+                tau_absorption=tau, cho_per_unit_g=cho_unit if cho_unit > 0 else 30,
+                intake_mode=intake_mode_enum, mix_type=mix_sel,
+                metabolic_curve=curve_data if use_lab_active else None, compute=run_envelope
+            )
+            envelope = envelope_state['envelope']
+            if envelope is None:
+                st.info("Premi **Calcola Inviluppo** per generare la superficie.")
+            else:
+                if not envelope_state['current']:
+                    st.warning("Superficie calcolata con parametri precedenti: premi **Calcola Inviluppo** per aggiornarla.")
+                unit_label = "W" if envelope.intensity_label == 'avg_watts' else "bpm"
+                grid = envelope.intensities
+                current_val = float(params.get(envelope.intensity_label, grid[len(grid) // 2]))
+                c_en1, c_en2, c_en3 = st.columns(3)
+                q_dur = c_en1.slider("Durata (min)", int(envelope.durations[0]), int(envelope.durations[-1]),
+                                     int(min(max(duration, envelope.durations[0]), envelope.durations[-1])), 10)
+                q_val = c_en2.slider(f"Intensità Media ({unit_label})", int(grid[0]), int(grid[-1]),
+                                     int(min(max(current_val, grid[0]), grid[-1])))
+                q_int = c_en3.slider("Intake (g/h)", int(envelope.intakes[0]), int(envelope.intakes[-1]),
+                                     int(min(max(cho_h, envelope.intakes[0]), envelope.intakes[-1])), 5)
+                answer = envelope.query(q_dur, q_val, q_int)
+                if not answer['feasible']:
+                    st.error("Nessuna intensità della griglia è sostenibile per questa durata e questo intake.")
+                elif answer['sustainable']:
+                    st.success(f"Sostenibile: limite stimato **{answer['max_intensity']:.0f} {unit_label}** "
+                               f"(riserva residua ~{answer['reserve_g']:.0f} g).")
+                else:
+                    bonk_txt = f" Crisi prevista intorno al minuto {answer['bonk_minute']:.0f}." if answer['bonk_minute'] is not None else ""
+                    st.error(f"Oltre il limite: massimo sostenibile **{answer['max_intensity']:.0f} {unit_label}**.{bonk_txt}")
+
+                df_env = pd.DataFrame([
+                    {"Durata (min)": float(d), "Intake (g/h)": float(k), "Intensità Max": float(envelope.max_intensity[i, j])}
+                    for i, d in enumerate(envelope.durations) for j, k in enumerate(envelope.intakes)
+                ])
+                chart_env = alt.Chart(df_env.dropna()).mark_rect().encode(
+                    x=alt.X('Durata (min):O', title='Durata (min)', axis=alt.Axis(format='.0f')),
+                    y=alt.Y('Intake (g/h):O', title='Intake (g/h)', sort='descending', axis=alt.Axis(format='.0f')),
+                    color=alt.Color('Intensità Max', title=f'Max ({unit_label})', scale=alt.Scale(scheme='viridis')),
+                    tooltip=[alt.Tooltip('Durata (min)', format='.0f'), alt.Tooltip('Intake (g/h)', format='.0f'),
+                             alt.Tooltip('Intensità Max', format='.0f')]
+                )
+                render_chart("envelope_heatmap", chart_env.properties(height=260), use_container_width=True)
+                st.caption(f"{envelope.simulations} simulazioni · griglia {envelope.shape[0]}×{envelope.shape[1]}×{envelope.shape[2]}.")
+
         st.markdown("---")
         st.markdown("### Cronotabella Operativa")
-        if intake_mode_enum == IntakeMode.DISCRETE and cho_h > 0 and cho_unit > 0:
+        optimize_timing = False
+        if intake_mode_enum == IntakeMode.DISCRETE and cho_unit > 0:
+            optimize_timing = st.checkbox(
+                "Ottimizza Timing Unità (Minimo Numero di Gel)", value=False,
+                help="Sceglie i minuti delle singole unità mantenendo fegato/muscolo sopra i limiti di sicurezza "
+                     "e il Gut Load sotto la soglia di tolleranza GI."
+            )
+
+        if optimize_timing:
+            with st.spinner("Ottimizzazione timing in corso..."):
+                plan = logic.optimize_intake_schedule(
+                    tank, duration, subj, params, cho_unit,
+                    crossover_pct=crossover_val if not use_lab_active else 75,
+                    tau_absorption=tau,
+                    curve_data=curve_data if use_lab_active else None,
+                    mix_type=mix_sel,
+                    intake_cutoff_min=intake_cutoff,
+                    variability_index=vi_input,
+                    intensity_series=intensity_series,
+                    gut_tolerance_g=risk_thresh
+                )
+            if plan['minutes']:
+                st.table(pd.DataFrame(logic.intake_schedule_table(plan)))
+            if plan['feasible']:
+                st.success(
+                    f"Portare **{plan['n_units']}** unità ({plan['total_g']} g, ~{plan['equivalent_g_h']:.0f} g/h). "
+                    f"Picco Gut Load: {plan['max_gut_g']:.0f} g."
+                )
+            elif plan['status'] == "muscle":
+                st.error(f"Glicogeno muscolare sotto il limite al minuto {plan['binding_minute']}: "
+                         "l'integrazione non può evitarlo (ridurre l'intensità).")
+            elif plan['status'] == "gut":
+                st.error("Nessun piano rispetta la soglia di tolleranza GI: alzare la soglia o usare unità più piccole.")
+            else:
+                st.error(f"Riserve epatiche insufficienti dal minuto {plan['binding_minute']} anche con il massimo di unità.")
+
+        elif intake_mode_enum == IntakeMode.DISCRETE and cho_h > 0 and cho_unit > 0:
             schedule = []
             current_time = intake_interval
             total_ingested = 0
@@ -491,13 +703,23 @@ def render_tab_simulation(sim_method, create_cutoff_line):
             # CORREZIONE: Rimosso riferimento a 'use_mader_sim'
             with st.spinner("Ottimizzazione modello in corso..."):
                 # CORREZIONE: Rimossi argomenti 'use_mader' e 'running_method' che non esistono più in logic.py
-                opt_intake = logic.calculate_minimum_strategy(
+                solution = logic.solve_minimum_strategy(
                     tank, duration, subj, params,
                     curve_to_use,
                     mix_sel, intake_mode_enum, intake_cutoff,
                     variability_index=vi_input,
-                    intensity_series=intensity_series
+                    intensity_series=intensity_series,
+                    cho_per_unit_g=cho_unit if cho_unit > 0 else 30,
+                    crossover_pct=crossover_val if not use_lab_active else 75,
+                    tau_absorption=tau
                 )
+            opt_intake = solution['intake_g_h']
+
+            binding_label = "Fegato" if solution['binding_constraint'] == "liver" else "Muscolo"
+            st.caption(
+                f"Simulazioni eseguite: **{solution['simulations']}** · Risoluzione: {solution['tolerance_g_h']:g} g/h · "
+                f"Vincolo limitante: **{binding_label}** al minuto **{solution['binding_minute']}**"
+            )
 
             if opt_intake is not None:
                 if opt_intake == 0:
@@ -505,36 +727,25 @@ def render_tab_simulation(sim_method, create_cutoff_line):
                     st.caption("Le tue riserve sono sufficienti per coprire la durata a questa intensità.")
 
                 else:
-                    st.success(f"### ✅ Strategia Minima: {opt_intake} g/h")
+                    st.success(f"### ✅ Strategia Minima: {opt_intake:g} g/h")
                     if intake_mode_enum == IntakeMode.DISCRETE and cho_unit > 0:
                         interval_min = int(60 / (opt_intake / cho_unit))
                         st.info(f"Assumere **1 unità da {cho_unit}g** ogni **{interval_min} minuti**")
                     else:
-                        st.info(f"Bere **{opt_intake}g** di carboidrati per ogni ora.")
+                        st.info(f"Bere **{opt_intake:g}g** di carboidrati per ogni ora.")
 
                 # --- 2. ESEGUIAMO LE DUE SIMULAZIONI PER IL CONFRONTO ---
-
-                # Scenario A: Il Crollo (0 g/h)
-                # CORREZIONE: Rimossi argomenti obsoleti use_mader/running_method
-                df_zero, stats_zero = logic.simulate_metabolism(
-                    tank, duration, 0, 0, 70, 20, subj, params,
-                    mix_type_input=mix_sel,
-                    metabolic_curve=curve_to_use,
-                    intake_mode=intake_mode_enum, intake_cutoff_min=intake_cutoff,
-                    variability_index=vi_input,
-                    intensity_series=intensity_series
-                )
-
-                # Scenario B: Il Salvataggio (opt_intake g/h)
-                # CORREZIONE: Rimossi argomenti obsoleti use_mader/running_method
-                df_opt, stats_opt = logic.simulate_metabolism(
-                    tank, duration, opt_intake, cho_unit if cho_unit > 0 else 25, 70, 20, subj, params,
+                # Scenario A: Il Crollo (0 g/h) - Scenario B: Il Salvataggio (opt_intake g/h)
+                comparison = logic.simulate_metabolism_batch(
+                    tank, duration, [0, opt_intake], [0, cho_unit if cho_unit > 0 else 25], 70, 20, subj, params,
                     mix_type_input=mix_sel,
                     metabolic_curve=curve_to_use,
                     intake_mode=intake_mode_enum, intake_cutoff_min=intake_cutoff,
                     variability_index=vi_input,
                     intensity_series=intensity_series
                 )
+                df_zero, stats_zero = comparison.to_frame(0), comparison.stats[0]
+                df_opt, stats_opt = comparison.to_frame(1), comparison.stats[1]
 
                 st.markdown("---")
                 st.subheader("⚔️ Confronto Impatto: Senza vs. Con Integrazione")
@@ -589,7 +800,7 @@ def render_tab_simulation(sim_method, create_cutoff_line):
                     return alt.layer(*layers).properties(title=title, height=320)
 
                 with col_bad:
-                    st.altair_chart(plot_enhanced_scenario(df_zero, stats_zero, "🔴 SCENARIO DIGIUNO (Fallimento)", True), use_container_width=True)
+                    render_chart("scenario_fasting", plot_enhanced_scenario(df_zero, stats_zero, "🔴 SCENARIO DIGIUNO (Fallimento)", True), use_container_width=True)
                     final_liv = df_zero['Residuo Epatico'].iloc[-1]
                     if final_liv <= 0:
                         st.error(f"**CROLLO METABOLICO**")
@@ -598,7 +809,7 @@ def render_tab_simulation(sim_method, create_cutoff_line):
                         st.warning("Riserve al limite.")
 
                 with col_good:
-                    st.altair_chart(plot_enhanced_scenario(df_opt, stats_opt, f"🟢 SCENARIO STRATEGIA ({opt_intake} g/h)", False), use_container_width=True)
+                    render_chart("scenario_strategy", plot_enhanced_scenario(df_opt, stats_opt, f"🟢 SCENARIO STRATEGIA ({opt_intake:g} g/h)", False), use_container_width=True)
                     saved_grams = int(stats_opt['final_glycogen'] - stats_zero['final_glycogen'])
                     st.success(f"**SALVATAGGIO: +{saved_grams}g**")
                     st.caption(f"L'integrazione ha preservato {saved_grams}g di glicogeno extra, garantendo l'arrivo.")
@@ -1,10 +1,20 @@
+import datetime
+import os
+import tempfile
+
 import altair as alt
 import pandas as pd
 import streamlit as st
 
 import logic
+import utils
 from data_models import GlycogenState
 
+SLEEP_OPTS_MAP = {"Ottimale (>7h)": 1.0, "Sufficiente (6-7h)": 0.95, "Insufficiente (<6h)": 0.85}
+TYPE_OPTS = ["Riposo", "Ciclismo", "Corsa/Altro"]
+WEEKDAYS = ["Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom"]
+RESERVE_COLORS = ['#43A047', '#FB8C00']
+
 
 def render_tab_tapering():
     """Render Tab 2 (Diario Ibrido) and update session state."""
@@ -17,6 +27,14 @@ def render_tab_tapering():
     user_thr = st.session_state.get('thr_hr_input', 170)
 
     st.subheader("🗓️ Diario di Avvicinamento (Timeline Oraria)")
+    st.caption("ℹ️ Nota: la quota di carboidrati degli allenamenti usa ora la stessa curva RER della simulazione gara "
+               "al posto della vecchia stima lineare (a IF 0.6: 43% invece di 25%, a IF 0.7: 55% invece di 50%). "
+               "A parità di diario i risultati cambiano rispetto ai calcoli precedenti: consumi più alti alle intensità moderate.")
+
+    mode = st.radio("Modalità", ["Diario Gara (2-7 giorni)", "Stagione (90-365 giorni)"], horizontal=True)
+    if mode.startswith("Stagione"):
+        render_season_mode(subj_base, user_ftp, user_thr)
+        return
 
     # --- SETUP CALENDARIO & DURATA ---
     c_cal1, c_cal2, c_cal3 = st.columns([1, 1, 1])
@@ -70,8 +88,8 @@ def render_tab_tapering():
     h3.markdown("##### Nutrizione")
     h4.markdown("##### Riposo")
 
-    sleep_opts_map = {"Ottimale (>7h)": 1.0, "Sufficiente (6-7h)": 0.95, "Insufficiente (<6h)": 0.85}
-    type_opts = ["Riposo", "Ciclismo", "Corsa/Altro"]
+    sleep_opts_map = SLEEP_OPTS_MAP
+    type_opts = TYPE_OPTS
 
     input_result_data = []
 
@@ -152,7 +170,7 @@ def render_tab_tapering():
         st.markdown("### Evoluzione Oraria Riserve (Timeline)")
 
         df_melt = df_hourly.melt('Timestamp', value_vars=['Muscolare', 'Epatico'], var_name='Riserva', value_name='Grammi')
-        c_range = ['#43A047', '#FB8C00']
+        c_range = RESERVE_COLORS
 
         chart = alt.Chart(df_melt).mark_area(opacity=0.8).encode(
             x=alt.X('Timestamp', title='Data/Ora', axis=alt.Axis(format='%d/%m %H:%M')),
@@ -172,3 +190,149 @@ def render_tab_tapering():
             delta="Attenzione" if final_tank['liver_glycogen_g'] < 80 else "Ottimale", delta_color="normal"
         )
 
+
+
+def _intensity_factor(activity_type, val, user_ftp, user_thr):
+    if activity_type == "Ciclismo" and user_ftp > 0:
+        return val / user_ftp
+    if activity_type == "Corsa/Altro" and user_thr > 0:
+        return val / user_thr
+    return 0.0
+
+
+def _default_week_template():
+    rows = []
+    for k, day in enumerate(WEEKDAYS):
+        training = k in (1, 3, 5, 6)
+        rows.append({
+            "Giorno": day, "Tipo": "Ciclismo" if training else "Riposo", "Minuti": 90 if training else 0,
+            "Intensità": 200 if training else 0, "Start": datetime.time(18, 0), "CHO (g)": 400 if training else 300,
+            "Sonno": "Sufficiente (6-7h)",
+        })
+    return pd.DataFrame(rows)
+
+
+def _week_template_days(week_df, user_ftp, user_thr, sleep_start, sleep_end):
+    """Righe del microciclo -> 7 giorni nel formato di calculate_hourly_tapering (senza data)."""
+    template = []
+    for row in week_df.to_dict(orient="records"):
+        activity = row["Tipo"] if row["Tipo"] in TYPE_OPTS else "Riposo"
+        training = activity != "Riposo"
+        val = float(row["Intensità"] or 0) if training else 0.0
+        template.append({
+            "type": activity, "val": val, "duration": float(row["Minuti"] or 0) if training else 0.0,
+            "calculated_if": _intensity_factor(activity, val, user_ftp, user_thr) if training else 0.0,
+            "cho_in": float(row["CHO (g)"] or 0), "sleep_factor": SLEEP_OPTS_MAP.get(row["Sonno"], 1.0),
+            "sleep_start": sleep_start, "sleep_end": sleep_end,
+            "workout_start": row["Start"] or datetime.time(18, 0),
+        })
+    return template
+
+
+def _season_stream(start_date, n_days, template, completed):
+    """Giorni della stagione in streaming: il diario svolto sostituisce il microciclo nelle sue date."""
+    by_date = {day['date_obj']: day for day in completed}
+    for day in logic.season_days(start_date, n_days, template):
+        yield by_date.get(day['date_obj'], day)
+
+
+def render_season_mode(subj_base, user_ftp, user_thr):
+    """Modalità stagione: microciclo pianificato + diario svolto, riepilogo giornaliero e trend."""
+    c1, c2, c3 = st.columns(3)
+    start_date = c1.date_input("Inizio Blocco", value=pd.Timestamp.today() - pd.Timedelta(days=logic.SEASON_MIN_DAYS))
+    n_days = c2.slider("Durata Stagione (Giorni)", logic.SEASON_MIN_DAYS, logic.SEASON_MAX_DAYS, 120)
+    start_state = c3.selectbox("Condizione Iniziale", list(GlycogenState), format_func=lambda x: x.label, index=2,
+                               key="season_start_state")
+
+    with st.expander("⚙️ Orari Standard (Default)", expanded=False):
+        d_c1, d_c2 = st.columns(2)
+        sleep_start = d_c1.time_input("Orario Sonno (Inizio)", value=datetime.time(23, 0), key="season_ss")
+        sleep_end = d_c2.time_input("Orario Sveglia", value=datetime.time(7, 0), key="season_se")
+
+    st.markdown("##### Microciclo Settimanale (Pianificato)")
+    week_df = st.data_editor(
+        _default_week_template(), key="season_week", hide_index=True, use_container_width=True,
+        disabled=["Giorno"],
+        column_config={
+            "Tipo": st.column_config.SelectboxColumn("Tipo", options=TYPE_OPTS, required=True),
+            "Minuti": st.column_config.NumberColumn("Minuti", min_value=0, max_value=400, step=15),
+            "Intensità": st.column_config.NumberColumn("Intensità", help="Watt (Ciclismo) o Bpm", min_value=0,
+                                                       max_value=500, step=10),
+            "Start": st.column_config.TimeColumn("Start", format="HH:mm"),
+            "CHO (g)": st.column_config.NumberColumn("CHO (g)", min_value=0, max_value=2000, step=50),
+            "Sonno": st.column_config.SelectboxColumn("Sonno", options=list(SLEEP_OPTS_MAP), required=True),
+        },
+    )
+
+    # Parquet (diario e timeline) solo se pyarrow è installato
+    u1, u2 = st.columns([2, 1])
+    diary_file = u1.file_uploader(
+        "Diario Svolto (CSV/Parquet, opzionale)" if logic.PARQUET_AVAILABLE else "Diario Svolto (CSV, opzionale)",
+        type=["csv", "parquet"] if logic.PARQUET_AVAILABLE else ["csv"],
+        help="Una riga per giorno: date, type, val, duration, cho_in, sleep_factor, orari. "
+             "Le date non presenti seguono il microciclo."
+    )
+    hourly_format = u2.selectbox("Timeline Oraria su File",
+                                 ["Nessuna", "Parquet", "CSV"] if logic.PARQUET_AVAILABLE else ["Nessuna", "CSV"])
+
+    if not st.button("Calcola Stagione", type="primary"):
+        return
+
+    try:
+        completed = utils.parse_training_diary(diary_file, user_ftp, user_thr) if diary_file else []
+    except Exception as e:
+        st.error(f"Diario non valido: {e}")
+        return
+    template = _week_template_days(week_df, user_ftp, user_thr, sleep_start, sleep_end)
+    days = _season_stream(start_date, n_days, template, completed)
+
+    hourly_path = None
+    if hourly_format != "Nessuna":
+        suffix = ".parquet" if hourly_format == "Parquet" else ".csv"
+        fd, hourly_path = tempfile.mkstemp(suffix=suffix, prefix="timeline_")
+        os.close(fd)
+    hourly_bytes = None
+    try:
+        season = logic.run_season_tapering(subj_base, days, start_state=start_state, hourly_path=hourly_path)
+        if season["hourly_path"]:
+            with open(season["hourly_path"], "rb") as f:
+                hourly_bytes = f.read()
+    except ImportError:
+        st.error("Il formato Parquet richiede pyarrow: installalo oppure scegli CSV.")
+        return
+    finally:
+        # Il file temporaneo va rimosso in ogni caso (errore, stagione vuota, download)
+        if hourly_path and os.path.exists(hourly_path):
+            os.remove(hourly_path)
+
+    daily = season["daily"]
+    final_tank = season["final_tank"]
+
+    st.markdown("### Trend Riserve (Fine Giornata)")
+    df_melt = daily.melt('Data', value_vars=['Muscolare', 'Epatico'], var_name='Riserva', value_name='Grammi')
+    chart = alt.Chart(df_melt).mark_area(opacity=0.8).encode(
+        x=alt.X('Data', title='Data', axis=alt.Axis(format='%d/%m')),
+        y=alt.Y('Grammi', stack=True),
+        color=alt.Color('Riserva', scale=alt.Scale(domain=['Muscolare', 'Epatico'], range=RESERVE_COLORS)),
+        tooltip=['Data', 'Riserva', 'Grammi']
+    ).properties(height=350).interactive()
+    st.altair_chart(chart, use_container_width=True)
+
+    k1, k2, k3 = st.columns(3)
+    k1.metric("Riempimento Medio", f"{daily['Riempimento %'].mean():.1f}%")
+    k2.metric("Giorni con Fegato a Rischio", f"{int((daily['Ore Rischio'] > 0).sum())} / {season['n_days']}")
+    k3.metric("Riempimento Finale", f"{final_tank['fill_pct']:.1f}%")
+
+    st.markdown("#### Riepilogo Settimanale")
+    weekly = daily.set_index('Data').resample('W-MON', label='left', closed='left').agg({
+        'Totale': 'mean', 'Totale Min': 'min', 'Epatico Min': 'min', 'Ore Rischio': 'sum', 'Ore Allenamento': 'sum',
+    })
+    weekly.index = weekly.index.strftime('%d/%m')
+    st.dataframe(weekly.round(1), use_container_width=True)
+
+    with st.expander("Riepilogo Giornaliero", expanded=False):
+        st.dataframe(daily.round(1), use_container_width=True, hide_index=True)
+
+    if hourly_bytes is not None:
+        st.download_button(f"Scarica Timeline Oraria ({season['n_hours']} ore)", hourly_bytes,
+                           file_name=f"timeline_oraria{os.path.splitext(hourly_path)[1]}")
@@ -16,7 +16,9 @@ from parsers.metabolic import resample_to_unit_intervals as _resample_to_unit_in
 from parsers.metabolic import apply_smoothing as _apply_smoothing
 from parsers.metabolic import find_header_row_index as _find_header_row_index
 from parsers.zwo import parse_zwo_file as _parse_zwo_file
+from parsers.diary import read_diary as _read_diary
 from plots.fit_altair import create_fit_plot as _create_fit_plot
+from profiling import Profiler, session_profiler, stage as profile_stage
 
 # ==============================================================================
 # MODULO CALCOLO POTENZA NORMALIZZATA (NP)
@@ -45,7 +47,7 @@ def parse_fit_file_wrapper(uploaded_file, sport_type):
     """
     Estrae dati dal FIT file.
     Ritorna:
-    1. simulation_series (lista valori per simulazione, es. 1 al secondo)
+    1. simulation_series (IntensitySeries a 1 Hz)
     2. statistiche scalari (duration, avg, etc)
     3. graphs_data (Dizionario con liste per grafici alta risoluzione)
     """
@@ -82,6 +84,10 @@ def find_header_row_index(df_temp):
 def parse_zwo_file(uploaded_file, ftp_watts, thr_hr, sport_type):
     return _parse_zwo_file(uploaded_file, ftp_watts, thr_hr, sport_type)
 
+# --- DIARIO ALLENAMENTI ---
+def parse_training_diary(uploaded_file, ftp_watts, thr_hr):
+    return _read_diary(uploaded_file, ftp_watts, thr_hr)
+
 # --- ZONE ---
 def calculate_zones_cycling(ftp):
     return [{"Zona": f"Z{i+1}", "Valore": f"{int(ftp*p)} W"} for i, p in enumerate([0.55, 0.75, 0.90, 1.05, 1.20])]